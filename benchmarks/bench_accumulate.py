@@ -0,0 +1,39 @@
+import sys
+import time
+
+from ckl.functions import get_none_environment
+from ckl.interpreter import Interpreter
+
+# times list accumulation idioms for growing numbers of items. When every
+# step copies the list built so far the times grow quadratically. Run it
+# from the repo root, optionally with the numbers of items:
+#
+#   python benchmarks/bench_accumulate.py [items...]
+
+SCRIPTS = {
+    "x += [i]": "def x = []; for i in range({n}) x += [i]; length(x)",
+    "x = x + [i]": "def x = []; for i in range({n}) x = x + [i]; length(x)",
+    "x += i": "def x = []; def i = 0; "
+    "while i < {n} do x += i; i += 1; end; length(x)",
+    "x += pair": "def x = []; for i in range({n} / 2) x += [i, i]; length(x)",
+    "[0] * n": "length([0] * {n})",
+}
+
+
+def measure(interpreter, script):
+    start = time.perf_counter()
+    interpreter.interpret(script, "bench", get_none_environment())
+    return time.perf_counter() - start
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10000, 100000, 1000000]
+    interpreter = Interpreter(False, False)
+    for name, script in SCRIPTS.items():
+        for n in sizes:
+            elapsed = measure(interpreter, script.format(n=n))
+            print(f"{name:12} {n:8} {elapsed:8.3f}s")
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
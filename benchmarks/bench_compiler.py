@@ -0,0 +1,55 @@
+import timeit
+
+from ckl.functions import get_none_environment
+from ckl.interpreter import Interpreter
+
+# compares the tree walking evaluator with the closure compiler
+# by running the same scripts repeatedly. Run it from the repo root:
+#
+#   python benchmarks/bench_compiler.py
+
+SCRIPTS = {
+    "fib": """
+        def fib(n) if n < 2 then n else fib(n - 1) + fib(n - 2);
+        fib(15)
+    """,
+    "loop": """
+        def total = 0;
+        for i in range(2000) do
+            if i % 3 == 0 then total += i;
+            if i % 5 == 0 and i > 10 then total -= 1;
+        end;
+        total
+    """,
+    "objects": """
+        def point = <* x = 1, y = 2, len = fn(self) self->x + self->y *>;
+        def result = [];
+        for i in range(500) append(result, point->len());
+        length(result)
+    """,
+}
+
+
+def main():
+    interpreter = Interpreter(False, False)
+    for name, script in SCRIPTS.items():
+        compiled = interpreter.compile(script, name)
+        walker = timeit.timeit(
+            lambda: interpreter.interpret(
+                script, name, get_none_environment()
+            ),
+            number=20,
+        )
+        closures = timeit.timeit(
+            lambda: compiled.run(get_none_environment()),
+            number=20,
+        )
+        print(
+            f"{name:10} tree walker {walker:8.3f}s  "
+            f"compiled {closures:8.3f}s  "
+            f"speedup {walker / closures:5.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
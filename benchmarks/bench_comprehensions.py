@@ -0,0 +1,59 @@
+import timeit
+
+from ckl.functions import get_none_environment
+from ckl.interpreter import Interpreter
+
+# times every form of comprehension, with and without a condition, on
+# the tree walking evaluator. The time to set up the collections is
+# subtracted. Run it from the repo root:
+#
+#   python benchmarks/bench_comprehensions.py
+
+SETUP = """
+    def a = range(2000);
+    def b = range(40);
+    def s = set(range(2000));
+    def t = set(range(40));
+    def m = map(zip(a, a));
+"""
+
+FORMS = {
+    "list": "[x * x + 1 for x in a{cond}]",
+    "list parallel": "[x * y + 1 for x in a also for y in a{cond}]",
+    "list product": "[x * y + 1 for x in b for y in b{cond}]",
+    "set": "<<x * x + 1 for x in s{cond}>>",
+    "set parallel": "<<x * y + 1 for x in s also for y in s{cond}>>",
+    "set product": "<<x * y + 1 for x in t for y in t{cond}>>",
+    "map": "<<<x => x * x + 1 for x in keys m{cond}>>>",
+}
+
+CONDITIONS = {
+    "all": "",
+    "filtered": " if x % 10 == 0",
+}
+
+
+def measure(interpreter, script):
+    return min(
+        timeit.repeat(
+            lambda: interpreter.interpret(
+                script, "bench", get_none_environment()
+            ),
+            number=5,
+            repeat=7,
+        )
+    )
+
+
+def main():
+    interpreter = Interpreter(False, False)
+    setup = measure(interpreter, SETUP)
+    for name, form in FORMS.items():
+        for label, cond in CONDITIONS.items():
+            script = SETUP + form.format(cond=cond)
+            elapsed = measure(interpreter, script) - setup
+            print(f"{name:14} {label:9} {elapsed:8.3f}s")
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
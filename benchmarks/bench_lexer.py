@@ -0,0 +1,70 @@
+import os
+import sys
+import time
+import tracemalloc
+
+import ckl
+from ckl.lexer import Lexer
+
+# measures the scanner throughput in MB/s and the peak memory of the
+# token window while consuming a large script generated from the
+# bundled modules.
+# Run it from the repo root:
+#
+#   python benchmarks/bench_lexer.py
+#
+# With the tests directory on the path, the original character at a
+# time scanner is measured as well.
+
+
+def generate_script(size):
+    modules = os.path.join(os.path.dirname(ckl.__file__), "modules")
+    sources = []
+    for filename in sorted(os.listdir(modules)):
+        if filename.endswith(".ckl"):
+            with open(os.path.join(modules, filename), encoding="utf-8") as f:
+                sources.append(f.read())
+    source = "\n".join(sources)
+    return source * (size // len(source) + 1)
+
+
+def consume(script):
+    lexer = Lexer(script, "bench").scan()
+    tokens = 0
+    while lexer.hasNext():
+        lexer.eat(1)
+        tokens += 1
+    return tokens
+
+
+def throughput(scanner, script, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        scanner(script)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return len(script.encode("utf-8")) / best / 1e6
+
+
+def main():
+    script = generate_script(4 * 1024 * 1024)
+    tracemalloc.start()
+    tokens = consume(script)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"script {len(script) / 1e6:.1f} MB, {tokens} tokens")
+    print(f"memory    {peak / 1e3:6.1f} KB peak")
+    mbs = throughput(consume, script)
+    print(f"scanner   {mbs:6.2f} MB/s")
+    sys.path.append(os.path.join(os.path.dirname(__file__), "..", "tests"))
+    try:
+        from lexer_reference import scan_reference
+    except ImportError:
+        return
+    mbs = throughput(lambda s: scan_reference(s, "bench"), script, 1)
+    print(f"reference {mbs:6.2f} MB/s")
+
+
+if __name__ == "__main__":
+    main()
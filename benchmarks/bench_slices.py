@@ -0,0 +1,40 @@
+import sys
+import time
+
+from ckl.functions import get_none_environment
+from ckl.interpreter import Interpreter
+
+# times list and string idioms built on sublist and substr for growing
+# sizes. With slices that copy their items the times grow quadratically.
+# Run it from the repo root, optionally with the sizes:
+#
+#   python benchmarks/bench_slices.py [size...]
+
+SCRIPTS = {
+    "chunks list": "def a = [x for x in range({n})]; length(chunks(a, 3))",
+    "chunks string": "def s = '1234567890' * ({n} / 10); "
+    "length(chunks(s, 3))",
+    "rest loop": "require List; def a = [x for x in range({n})]; "
+    "def c = 0; while not is_empty(a) do c += a[0]; a = List->rest(a); "
+    "end; c",
+    "reduce": "require List; List->reduce([x for x in range({n})], add)",
+}
+
+
+def measure(interpreter, script):
+    start = time.perf_counter()
+    interpreter.interpret(script, "bench", get_none_environment())
+    return time.perf_counter() - start
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10000, 100000, 1000000]
+    interpreter = Interpreter(False, False)
+    for name, script in SCRIPTS.items():
+        for n in sizes:
+            elapsed = measure(interpreter, script.format(n=n))
+            print(f"{name:14} {n:8} {elapsed:8.3f}s")
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,40 @@
+import sys
+import time
+
+from ckl.functions import get_none_environment
+from ckl.interpreter import Interpreter
+
+# times iterating the same set and map repeatedly for growing sizes.
+# Sets and maps are iterated in sorted order; without a cached order
+# every pass sorts the collection again. Run it from the repo root,
+# optionally with the sizes:
+#
+#   python benchmarks/bench_sorted.py [size...]
+
+SCRIPTS = {
+    "set loop": "def s = set([x * 7919 % {n} for x in range({n})]); "
+    "def c = 0; for i in range(20) do for x in s c += 1; end; c",
+    "map loop": "def m = <<<>>>; for x in range({n}) m[x * 7919 % {n}] = x; "
+    "def c = 0; for i in range(20) do for k in keys m c += 1; end; c",
+    "set list": "def s = set([x * 7919 % {n} for x in range({n})]); "
+    "def c = 0; for i in range(20) c += length(list(s)); c",
+}
+
+
+def measure(interpreter, script):
+    start = time.perf_counter()
+    interpreter.interpret(script, "bench", get_none_environment())
+    return time.perf_counter() - start
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10000, 100000]
+    interpreter = Interpreter(False, False)
+    for name, script in SCRIPTS.items():
+        for n in sizes:
+            elapsed = measure(interpreter, script.format(n=n))
+            print(f"{name:10} {n:8} {elapsed:8.3f}s")
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,39 @@
+import sys
+import time
+
+from ckl.functions import get_none_environment
+from ckl.interpreter import Interpreter
+
+# times building strings by repeated concatenation for growing numbers
+# of lines of 50 characters. With concatenations that copy the whole
+# string the times grow quadratically. Run it from the repo root,
+# optionally with the numbers of lines:
+#
+#   python benchmarks/bench_strings.py [lines...]
+
+SCRIPTS = {
+    "report +=": "def line = 'x' * 49 + '\\n'; def s = ''; "
+    "for i in range({n}) s += line; length(s)",
+    "join": "require String; "
+    "length(String->join([x for x in range({n})], '-' * 45))",
+    "reverse": "require String; length(String->reverse('x' * {n}))",
+}
+
+
+def measure(interpreter, script):
+    start = time.perf_counter()
+    interpreter.interpret(script, "bench", get_none_environment())
+    return time.perf_counter() - start
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [20000, 200000, 2000000]
+    interpreter = Interpreter(False, False)
+    for name, script in SCRIPTS.items():
+        for n in sizes:
+            elapsed = measure(interpreter, script.format(n=n))
+            print(f"{name:10} {n:8} {elapsed:8.3f}s")
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
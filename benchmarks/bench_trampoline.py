@@ -0,0 +1,74 @@
+import sys
+import timeit
+
+from ckl.functions import get_none_environment
+from ckl.interpreter import Interpreter
+
+# compares the tree walking evaluator with the trampolined evaluator
+# by running the same scripts repeatedly, and shows the recursion depth
+# the trampolined evaluator reaches. Run it from the repo root:
+#
+#   python benchmarks/bench_trampoline.py
+
+SCRIPTS = {
+    "fib": """
+        def fib(n) if n < 2 then n else fib(n - 1) + fib(n - 2);
+        fib(15)
+    """,
+    "loop": """
+        def total = 0;
+        for i in range(2000) do
+            if i % 3 == 0 then total += i;
+            if i % 5 == 0 and i > 10 then total -= 1;
+        end;
+        total
+    """,
+    "objects": """
+        def point = <* x = 1, y = 2, len = fn(self) self->x + self->y *>;
+        def result = [];
+        for i in range(500) append(result, point->len());
+        length(result)
+    """,
+}
+
+DEPTH = 100000
+
+DEEP = f"def f(n) if n == 0 then 0 else 1 + f(n - 1); f({DEPTH})"
+
+
+def main():
+    interpreter = Interpreter(False, False)
+    for name, script in SCRIPTS.items():
+        trampolined = interpreter.trampoline(script, name)
+        walker = timeit.timeit(
+            lambda: interpreter.interpret(
+                script, name, get_none_environment()
+            ),
+            number=20,
+        )
+        stackless = timeit.timeit(
+            lambda: trampolined.run(get_none_environment()),
+            number=20,
+        )
+        print(
+            f"{name:10} tree walker {walker:8.3f}s  "
+            f"trampolined {stackless:8.3f}s  "
+            f"ratio {stackless / walker:5.2f}x"
+        )
+    try:
+        interpreter.interpret(DEEP, "deep", get_none_environment())
+        print(f"tree walker recursion depth {DEPTH} ok")
+    except RecursionError:
+        print(
+            f"tree walker recursion depth {DEPTH} fails "
+            f"(recursion limit {sys.getrecursionlimit()})"
+        )
+    deep = interpreter.trampoline(DEEP, "deep")
+    elapsed = timeit.timeit(
+        lambda: deep.run(get_none_environment()), number=1
+    )
+    print(f"trampolined recursion depth {DEPTH} ok in {elapsed:.3f}s")
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,55 @@
+import gc
+import json
+import sys
+import time
+import tracemalloc
+
+from ckl.functions import get_none_environment
+from ckl.interpreter import Interpreter
+from ckl.values import ValueString
+
+# measures the memory taken by a dataset of rows loaded into a list of
+# maps with parse_json, and the time it takes. The JSON text itself is
+# not counted. Run it from the repo root, optionally with the number of
+# rows:
+#
+#   python benchmarks/bench_values.py [rows]
+
+
+def make_dataset(rows):
+    return json.dumps(
+        [
+            {
+                "id": i,
+                "group": i % 100,
+                "count": i % 7,
+                "score": i % 13 * 1.5,
+                "active": i % 2 == 0,
+                "name": f"item {i % 50}",
+            }
+            for i in range(rows)
+        ]
+    )
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    interpreter = Interpreter(False, False)
+    environment = get_none_environment()
+    environment.put("data", ValueString(make_dataset(rows)))
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = interpreter.interpret("parse_json(data)", "bench", environment)
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"rows     {len(result.value):10}")
+    print(f"memory   {current / 1024 / 1024:10.1f} MB")
+    print(f"per row  {current / rows:10.1f} bytes")
+    print(f"peak     {peak / 1024 / 1024:10.1f} MB")
+    print(f"time     {elapsed:10.2f} s")
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,320 @@
+import collections
+import functools
+import hashlib
+import os
+import pickle
+import re
+import sys
+
+from ckl.nodes import NodeLiteral, getManifest
+from ckl.parser import parse_script
+from ckl.values import ValueString
+
+
+# Parsed node trees are cached as pickled .cklc files. Each file starts
+# with the cache key of its source, which covers the source text and a
+# fingerprint of the interpreter implementation, so stale files are
+# simply ignored. The key is followed by the module manifest (see
+# getManifest), which lazy module loading reads without the tree. The
+# filename, which is part of every source position, is not stored; it
+# is filled in again when a tree is loaded.
+#
+# Packaged modules may ship precompiled next to their sources (see
+# precompile_modules), user modules are cached next to their source
+# file, everything else goes to the cache directory. The cache directory
+# defaults to ~/.ckl/cache and is configured with the CKL_CACHE_DIR
+# environment variable; an empty value disables the cache directory.
+# Its files are named after the fingerprint, files of other fingerprints
+# are deleted whenever a file is added, and only the CACHE_MAX_FILES
+# most recently written files are kept.
+#
+# Loading a pickle can run arbitrary code, so only files owned by the
+# current user or root that no one else can write to are loaded, see
+# is_trusted_file. Files are written without group and other write
+# permissions.
+#
+# Scripts parsed at runtime by eval and parse go through an in-memory
+# LRU cache keyed by source text and filename instead. Its size is set
+# with the CKL_PARSE_CACHE_SIZE environment variable, 0 disables it.
+# Strings can be changed in place, so a cached tree gets new values for
+# its string literals whenever it is handed out again, just like a tree
+# parsed anew.
+
+CACHE_SUFFIX = ".cklc"
+
+CACHE_MAX_FILES = 256
+
+CACHE_FILE_PATTERN = re.compile(r"^(?:[0-9a-f]{16}-)?[0-9a-f]{64}\.cklc$")
+
+FINGERPRINT_MODULES = [
+    "cache.py",
+    "errors.py",
+    "lexer.py",
+    "nodes.py",
+    "parser.py",
+    "values.py",
+]
+
+
+class ParseCache:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def parse(self, script, filename="-"):
+        key = (script, filename)
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            node, literals = entry
+            for literal, text in literals:
+                literal.value = ValueString(text)
+            return node
+        self.misses += 1
+        node = parse_script(script, filename)
+        if self.maxsize > 0:
+            literals = []
+            collectStringLiterals(node, literals)
+            self.entries[key] = (node, literals)
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        return node
+
+    def resize(self, maxsize):
+        self.maxsize = maxsize
+        while len(self.entries) > max(maxsize, 0):
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+def collectStringLiterals(node, literals):
+    if isinstance(node, (list, tuple)):
+        for item in node:
+            collectStringLiterals(item, literals)
+    elif isinstance(node, NodeLiteral):
+        if isinstance(node.value, ValueString):
+            literals.append((node, node.value.value))
+    elif type(node).__module__ == "ckl.nodes" and hasattr(node, "evaluate"):
+        for value in vars(node).values():
+            collectStringLiterals(value, literals)
+
+
+def get_parse_cache_size():
+    try:
+        return int(os.environ.get("CKL_PARSE_CACHE_SIZE", "256"))
+    except ValueError:
+        return 256
+
+
+PARSE_CACHE = ParseCache(get_parse_cache_size())
+
+
+def get_cache_dir():
+    cachedir = os.environ.get("CKL_CACHE_DIR")
+    if cachedir is None:
+        return os.path.expanduser("~/.ckl/cache")
+    return cachedir or None
+
+
+def get_modules_dir():
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), "modules")
+
+
+@functools.lru_cache(maxsize=None)
+def get_fingerprint():
+    digest = hashlib.sha256()
+    digest.update(sys.version.encode("utf-8"))
+    basedir = os.path.dirname(os.path.abspath(__file__))
+    for module in FINGERPRINT_MODULES:
+        with open(os.path.join(basedir, module), "rb") as infile:
+            digest.update(infile.read())
+    return digest.hexdigest()
+
+
+def get_cache_key(script):
+    digest = hashlib.sha256()
+    digest.update(get_fingerprint().encode("utf-8"))
+    digest.update(script.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def get_cache_path(cachedir, key):
+    return os.path.join(
+        cachedir, f"{get_fingerprint()[:16]}-{key}{CACHE_SUFFIX}"
+    )
+
+
+def prune_cache_dir(cachedir):
+    # deletes the files of other fingerprints and the oldest files
+    # beyond CACHE_MAX_FILES
+    prefix = get_fingerprint()[:16] + "-"
+    try:
+        names = os.listdir(cachedir)
+    except OSError:
+        return
+    current = []
+    for name in names:
+        if not CACHE_FILE_PATTERN.match(name):
+            continue
+        path = os.path.join(cachedir, name)
+        try:
+            if name.startswith(prefix):
+                current.append((os.path.getmtime(path), path))
+            else:
+                os.remove(path)
+        except OSError:
+            pass
+    current.sort()
+    for _, path in current[:max(len(current) - CACHE_MAX_FILES, 0)]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def is_trusted_file(infile):
+    if not hasattr(os, "getuid"):
+        return True
+    stat = os.fstat(infile.fileno())
+    return stat.st_uid in (0, os.getuid()) and not stat.st_mode & 0o022
+
+
+class TreePickler(pickle.Pickler):
+    def __init__(self, outfile, filename):
+        super().__init__(outfile, pickle.HIGHEST_PROTOCOL)
+        self.filename = filename
+
+    def persistent_id(self, obj):
+        if type(obj) is str and obj == self.filename:
+            return "filename"
+        return None
+
+
+class TreeUnpickler(pickle.Unpickler):
+    def __init__(self, infile, filename):
+        super().__init__(infile)
+        self.filename = filename
+
+    def persistent_load(self, pid):
+        if pid != "filename":
+            raise pickle.UnpicklingError(f"unsupported persistent id {pid}")
+        return self.filename
+
+
+def load_cached(path, key, filename, manifestOnly=False):
+    try:
+        with open(path, "rb") as infile:
+            if not is_trusted_file(infile):
+                return None
+            unpickler = TreeUnpickler(infile, filename)
+            if unpickler.load() != key:
+                return None
+            manifest = unpickler.load()
+            if manifestOnly:
+                return manifest
+            return unpickler.load()
+    except FileNotFoundError:
+        return None
+    except Exception:
+        return None  # unreadable or incompatible cache file
+
+
+def store_cached(path, key, node, filename):
+    temppath = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path) or ".", 0o700, exist_ok=True)
+        fd = os.open(temppath, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        with os.fdopen(fd, "wb") as outfile:
+            pickler = TreePickler(outfile, filename)
+            pickler.dump(key)
+            pickler.dump(getManifest(node))
+            pickler.dump(node)
+        os.replace(temppath, path)
+        return True
+    except (OSError, pickle.PicklingError, RecursionError):
+        try:
+            os.remove(temppath)
+        except OSError:
+            pass
+        return False
+
+
+def parse_script_cached(script, filename="-", filepath=None):
+    key = get_cache_key(script)
+    paths = []
+    if filepath is not None:
+        paths.append(os.path.splitext(filepath)[0] + CACHE_SUFFIX)
+    cachedir = get_cache_dir()
+    cachepath = None
+    if cachedir:
+        cachepath = get_cache_path(cachedir, key)
+        paths.append(cachepath)
+    for path in paths:
+        node = load_cached(path, key, filename)
+        if node is not None:
+            return node
+    node = parse_script(script, filename)
+    for path in paths:
+        if store_cached(path, key, node, filename):
+            if path == cachepath:
+                prune_cache_dir(cachedir)
+            break
+    return node
+
+
+def get_bundled_path(modulefile):
+    return os.path.join(
+        get_modules_dir(), modulefile.lower()[:-4] + CACHE_SUFFIX
+    )
+
+
+def parse_module_cached(script, filename, modulefile):
+    node = load_cached(
+        get_bundled_path(modulefile), get_cache_key(script), filename
+    )
+    if node is not None:
+        return node
+    return parse_script_cached(script, filename)
+
+
+def load_module_manifest(script, filename, modulefile):
+    key = get_cache_key(script)
+    paths = [get_bundled_path(modulefile)]
+    cachedir = get_cache_dir()
+    if cachedir:
+        paths.append(get_cache_path(cachedir, key))
+    for path in paths:
+        if os.path.exists(path):
+            manifest = load_cached(path, key, filename, True)
+            if manifest is not None:
+                return manifest
+    return getManifest(parse_module_cached(script, filename, modulefile))
+
+
+def precompile_modules():
+    result = []
+    modulesdir = get_modules_dir()
+    for modulefile in sorted(os.listdir(modulesdir)):
+        if not modulefile.endswith(".ckl"):
+            continue
+        path = os.path.join(modulesdir, modulefile)
+        with open(path, encoding="utf-8") as infile:
+            script = infile.read()
+        filename = "mod:" + modulefile[:-4]
+        node = parse_script(script, filename)
+        cachepath = path[:-4] + CACHE_SUFFIX
+        if store_cached(cachepath, get_cache_key(script), node, filename):
+            result.append(cachepath)
+    return result
+
+
+if __name__ == "__main__":
+    for path in precompile_modules():
+        print(f"Precompiled {path}")
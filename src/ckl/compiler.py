@@ -0,0 +1,577 @@
+from ckl.errors import CklRuntimeError
+from ckl.functions import FuncLambda
+from ckl.nodes import (
+    copyConstant,
+    getBindingPlan,
+    invokeValues,
+    NodeAnd,
+    NodeAssign,
+    NodeBinaryOp,
+    NodeBlock,
+    NodeBreak,
+    NodeConstant,
+    NodeContinue,
+    NodeDef,
+    NodeDeref,
+    NodeDerefInvoke,
+    NodeFor,
+    NodeFuncall,
+    NodeIdentifier,
+    NodeIf,
+    NodeIn,
+    NodeLambda,
+    NodeList,
+    NodeLiteral,
+    NodeMap,
+    NodeNot,
+    NodeNull,
+    NodeOr,
+    NodeReturn,
+    NodeSet,
+    NodeSpread,
+    NodeWhile,
+)
+from ckl.values import (
+    ValueBoolean,
+    ValueControlBreak,
+    ValueControlContinue,
+    ValueControlReturn,
+    ValueControlTailCall,
+    ValueList,
+    ValueMap,
+    ValueSet,
+    ValueString,
+    TRUE,
+    FALSE,
+    NULL,
+)
+
+
+# The compiler lowers a node tree into nested python closures. Every
+# closure takes the environment and returns the same value the
+# corresponding node's evaluate method would return. Node types without
+# a dedicated compile function fall back to their evaluate method, so
+# the compiled code always covers the complete language.
+
+CONTROL = (ValueControlBreak, ValueControlContinue, ValueControlReturn)
+
+
+def compile_node(node):
+    compiler = COMPILERS.get(type(node))
+    if compiler is None:
+        return node.evaluate
+    return compiler(node)
+
+
+def expected_boolean(value, pos):
+    return CklRuntimeError(
+        ValueString("ERROR"),
+        "Expected boolean but got " + value.type(),
+        pos,
+    )
+
+
+def compile_and(node):
+    expressions = [compile_node(expr) for expr in node.expressions]
+    pos = node.pos
+
+    def evaluate_and(environment):
+        for expression in expressions:
+            value = expression(environment)
+            if value.__class__ is not ValueBoolean:
+                raise expected_boolean(value, pos)
+            if not value.value:
+                return FALSE
+        return TRUE
+
+    return evaluate_and
+
+
+def compile_assign(node):
+    if node.accumulate:
+        return compile_accumulate(node)
+    identifier = node.identifier
+    expression = compile_node(node.expression)
+    pos = node.pos
+
+    def evaluate_assign(environment):
+        if not environment.isDefined(identifier):
+            raise CklRuntimeError(
+                ValueString("ERROR"),
+                f"Variable {identifier} is not defined",
+                pos,
+            )
+        environment.set(identifier, expression(environment))
+        return environment.get(identifier, pos)
+
+    return evaluate_assign
+
+
+def compile_accumulate(node):
+    # see NodeAssign.accumulateValue
+    identifier = node.identifier
+    op = node.expression
+    func = compile_node(op.func)
+    a = compile_node(op.a)
+    b = compile_node(op.b)
+    names = op.names
+    pos = node.pos
+
+    def evaluate_accumulate(environment):
+        if not environment.isDefined(identifier):
+            raise CklRuntimeError(
+                ValueString("ERROR"),
+                f"Variable {identifier} is not defined",
+                pos,
+            )
+        fn = func(environment)
+        if not fn.isFunc():
+            raise CklRuntimeError(
+                ValueString("ERROR"),
+                f"Expected def but got {fn.type()}",
+                op.pos,
+            )
+        current = a(environment)
+        value = b(environment)
+        if not (
+            current.__class__ is ValueList
+            and not environment.evaluated
+            and fn.accumulate(current, value)
+        ):
+            result = fn.executeOperator(current, value)
+            if result is None:
+                result = invokeValues(
+                    fn, names, [current, value], environment, op.pos
+                )
+            current = result
+        environment.set(identifier, current)
+        return environment.get(identifier, pos)
+
+    return evaluate_accumulate
+
+
+def compile_binary_op(node):
+    func = compile_node(node.func)
+    a = compile_node(node.a)
+    b = compile_node(node.b)
+    names = node.names
+    pos = node.pos
+
+    def evaluate_binary_op(environment):
+        fn = func(environment)
+        if not fn.isFunc():
+            raise CklRuntimeError(
+                ValueString("ERROR"),
+                f"Expected def but got {fn.type()}",
+                pos,
+            )
+        valueA = a(environment)
+        valueB = b(environment)
+        result = fn.executeOperator(valueA, valueB)
+        if result is None:
+            return invokeValues(fn, names, [valueA, valueB], environment, pos)
+        return result
+
+    return evaluate_binary_op
+
+
+def compile_block(node):
+    expressions = [compile_node(expr) for expr in node.expressions]
+    if node.catchexprs or node.finallyexprs:
+        return compile_block_guarded(node, expressions)
+    if len(expressions) == 1:
+        return expressions[0]
+
+    def evaluate_block(environment):
+        result = TRUE
+        for expression in expressions:
+            result = expression(environment)
+            if result.__class__ in CONTROL:
+                break
+        return result
+
+    return evaluate_block
+
+
+def compile_block_guarded(node, expressions):
+    catchexprs = [
+        (err and compile_node(err), compile_node(expr))
+        for err, expr in node.catchexprs
+    ]
+    finallyexprs = [compile_node(expr) for expr in node.finallyexprs]
+
+    def evaluate_block(environment):
+        result = TRUE
+        try:
+            for expression in expressions:
+                result = expression(environment)
+                if result.__class__ in CONTROL:
+                    break
+        except CklRuntimeError as e:
+            for err, expr in catchexprs:
+                if not err or e.value == err(environment):
+                    return expr(environment)
+            raise
+        finally:
+            for expression in finallyexprs:
+                expression(environment)
+        return result
+
+    return evaluate_block
+
+
+def compile_break(node):
+    pos = node.pos
+
+    def evaluate_break(environment):
+        return ValueControlBreak(pos)
+
+    return evaluate_break
+
+
+def compile_constant(node):
+    value = node.value
+    original = compile_node(node.original)
+    guards = node.guards
+    frozen = node.frozen
+    pos = node.pos
+
+    def evaluate_constant(environment):
+        for name, nativetype in guards:
+            if environment.get(name, pos).__class__ is not nativetype:
+                return original(environment)
+        if frozen:
+            return value
+        return copyConstant(value)
+
+    return evaluate_constant
+
+
+def compile_continue(node):
+    pos = node.pos
+
+    def evaluate_continue(environment):
+        return ValueControlContinue(pos)
+
+    return evaluate_continue
+
+
+def compile_def(node):
+    identifier = node.identifier
+    expression = compile_node(node.expression)
+    info = node.info
+
+    def evaluate_def(environment):
+        value = expression(environment).withInfo(info)
+        environment.put(identifier, value)
+        if isinstance(value, FuncLambda):
+            value.name = identifier
+        return value
+
+    return evaluate_def
+
+
+def compile_deref(node):
+    expression = compile_node(node.expression)
+    index = compile_node(node.index)
+    dereference = node.dereference
+
+    def evaluate_deref(environment):
+        idx = index(environment)
+        return dereference(expression(environment), idx, environment)
+
+    return evaluate_deref
+
+
+def compile_deref_invoke(node):
+    if any(isinstance(arg, NodeSpread) for arg in node.args):
+        return node.evaluate
+    objectExpr = compile_node(node.objectExpr)
+    getMemberFunction = node.getMemberFunction
+    names = node.names
+    objectNames = [None] + node.names
+    args = [compile_node(arg) for arg in node.args]
+    pos = node.pos
+
+    plan = objectPlan = None
+
+    def evaluate_deref_invoke(environment):
+        nonlocal plan, objectPlan
+        obj_ = objectExpr(environment)
+        fn = getMemberFunction(obj_)
+        if obj_.isObject() and not obj_.isModule:
+            values = [obj_]
+            values.extend([arg(environment) for arg in args])
+            objectPlan = getBindingPlan(objectPlan, objectNames, fn)
+            return objectPlan.invoke(fn, values, environment, pos)
+        values = [arg(environment) for arg in args]
+        plan = getBindingPlan(plan, names, fn)
+        return plan.invoke(fn, values, environment, pos)
+
+    return evaluate_deref_invoke
+
+
+def compile_for(node):
+    expression = compile_node(node.expression)
+    block = compile_node(node.block)
+    iterate = node.iterate
+
+    def evaluate_for(environment):
+        return iterate(expression(environment), block, environment)
+
+    return evaluate_for
+
+
+def compile_funcall(node):
+    if any(isinstance(arg, NodeSpread) for arg in node.args):
+        return node.evaluate
+    func = compile_node(node.func)
+    names = node.names
+    args = [compile_node(arg) for arg in node.args]
+    tail = node.tail
+    pos = node.pos
+    plan = None
+
+    def evaluate_funcall(environment):
+        nonlocal plan
+        fn = func(environment)
+        if not fn.isFunc():
+            raise CklRuntimeError(
+                ValueString("ERROR"),
+                f"Expected def but got {fn.type()}",
+                pos,
+            )
+        values = [arg(environment) for arg in args]
+        plan = getBindingPlan(plan, names, fn)
+        if tail and fn.tailCallable and plan.bindings is not None:
+            return ValueControlTailCall(fn, plan.bind(values, pos), pos)
+        return plan.invoke(fn, values, environment, pos)
+
+    return evaluate_funcall
+
+
+def compile_identifier(node):
+    name = node.value
+    pos = node.pos
+
+    def evaluate_identifier(environment):
+        return environment.get(name, pos)
+
+    return evaluate_identifier
+
+
+def compile_if(node):
+    branches = [
+        (compile_node(node.conditions[i]), compile_node(node.expressions[i]))
+        for i in range(len(node.conditions))
+    ]
+    elseExpression = compile_node(node.elseExpression)
+    pos = node.pos
+
+    def evaluate_if(environment):
+        for condition, expression in branches:
+            value = condition(environment)
+            if value.__class__ is not ValueBoolean:
+                raise CklRuntimeError(
+                    ValueString("ERROR"),
+                    "Expected boolean condition value "
+                    f"but got {value.type()}",
+                    pos,
+                )
+            if value.value:
+                return expression(environment)
+        return elseExpression(environment)
+
+    return evaluate_if
+
+
+def compile_in(node):
+    expression = compile_node(node.expression)
+    lst = compile_node(node.list)
+    contains = node.contains
+
+    def evaluate_in(environment):
+        value = expression(environment)
+        return contains(value, lst(environment))
+
+    return evaluate_in
+
+
+def compile_lambda(node):
+    argsAndDefs = list(zip(node.args, node.defs))
+    body = node.body
+    code = compile_node(body)
+    layout = node.layout
+
+    def evaluate_lambda(environment):
+        result = FuncLambda(environment)
+        for arg, defaultValue in argsAndDefs:
+            result.addArg(arg, defaultValue)
+        result.setBody(body, code)
+        result.setLayout(layout)
+        return result
+
+    return evaluate_lambda
+
+
+def compile_list(node):
+    items = [
+        (isinstance(item, NodeSpread), compile_node(item))
+        for item in node.items
+    ]
+
+    def evaluate_list(environment):
+        result = ValueList()
+        for spread, item in items:
+            if spread:
+                for value in item(environment).value:
+                    result.addItem(value)
+            else:
+                result.addItem(item(environment))
+        return result
+
+    return evaluate_list
+
+
+def compile_literal(node):
+    value = node.value
+
+    def evaluate_literal(environment):
+        return value
+
+    return evaluate_literal
+
+
+def compile_map(node):
+    items = [
+        (compile_node(node.keys[i]), compile_node(node.values[i]))
+        for i in range(len(node.keys))
+    ]
+
+    def evaluate_map(environment):
+        result = ValueMap()
+        for key, value in items:
+            result.addItem(key(environment), value(environment))
+        return result
+
+    return evaluate_map
+
+
+def compile_not(node):
+    expression = compile_node(node.expression)
+    pos = node.pos
+
+    def evaluate_not(environment):
+        value = expression(environment)
+        if value.__class__ is not ValueBoolean:
+            raise expected_boolean(value, pos)
+        return FALSE if value.value else TRUE
+
+    return evaluate_not
+
+
+def compile_null(node):
+    def evaluate_null(environment):
+        return NULL
+
+    return evaluate_null
+
+
+def compile_or(node):
+    expressions = [compile_node(expr) for expr in node.expressions]
+    pos = node.pos
+
+    def evaluate_or(environment):
+        for expression in expressions:
+            value = expression(environment)
+            if value.__class__ is not ValueBoolean:
+                raise expected_boolean(value, pos)
+            if value.value:
+                return TRUE
+        return FALSE
+
+    return evaluate_or
+
+
+def compile_return(node):
+    expression = node.expression and compile_node(node.expression)
+    pos = node.pos
+
+    def evaluate_return(environment):
+        return ValueControlReturn(
+            expression(environment) if expression else NULL, pos
+        )
+
+    return evaluate_return
+
+
+def compile_set(node):
+    items = [compile_node(item) for item in node.items]
+
+    def evaluate_set(environment):
+        result = ValueSet()
+        for item in items:
+            result.addItem(item(environment))
+        return result
+
+    return evaluate_set
+
+
+def compile_while(node):
+    expression = compile_node(node.expression)
+    block = compile_node(node.block)
+    pos = node.pos
+
+    def evaluate_condition(environment):
+        condition = expression(environment)
+        if condition.__class__ is not ValueBoolean:
+            raise CklRuntimeError(
+                ValueString("ERROR"),
+                "Expected boolean condition but got " + condition.type(),
+                pos,
+            )
+        return condition.value
+
+    def evaluate_while(environment):
+        result = TRUE
+        while evaluate_condition(environment):
+            result = block(environment)
+            if result.__class__ is ValueControlBreak:
+                result = TRUE
+                break
+            elif result.__class__ is ValueControlContinue:
+                result = TRUE
+            elif result.__class__ is ValueControlReturn:
+                break
+        return result
+
+    return evaluate_while
+
+
+COMPILERS = {
+    NodeAnd: compile_and,
+    NodeAssign: compile_assign,
+    NodeBinaryOp: compile_binary_op,
+    NodeBlock: compile_block,
+    NodeBreak: compile_break,
+    NodeConstant: compile_constant,
+    NodeContinue: compile_continue,
+    NodeDef: compile_def,
+    NodeDeref: compile_deref,
+    NodeDerefInvoke: compile_deref_invoke,
+    NodeFor: compile_for,
+    NodeFuncall: compile_funcall,
+    NodeIdentifier: compile_identifier,
+    NodeIf: compile_if,
+    NodeIn: compile_in,
+    NodeLambda: compile_lambda,
+    NodeList: compile_list,
+    NodeLiteral: compile_literal,
+    NodeMap: compile_map,
+    NodeNot: compile_not,
+    NodeNull: compile_null,
+    NodeOr: compile_or,
+    NodeReturn: compile_return,
+    NodeSet: compile_set,
+    NodeWhile: compile_while,
+}
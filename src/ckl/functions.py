@@ -1,16 +1,29 @@
 import datetime
+import functools
 import json
 import pkgutil
 import platform
 import math
+import operator
 import os
 import random
 import re
 import shutil
 import subprocess
 
+from ckl.cache import (
+    collectStringLiterals,
+    PARSE_CACHE,
+    parse_module_cached,
+)
 from ckl.errors import CklRuntimeError
 from ckl.parser import parse_script
+from ckl.nodes import (
+    getFuncallString,
+    NodeIdentifier,
+    NodeLiteral,
+    UNBOUND,
+)
 from ckl.date import to_oa_date, to_date
 from ckl.values import (
     Args,
@@ -23,6 +36,7 @@ from ckl.values import (
     ValueControlBreak,
     ValueControlContinue,
     ValueControlReturn,
+    ValueControlTailCall,
     ValueDate,
     ValueDecimal,
     ValueFunc,
@@ -34,8 +48,12 @@ from ckl.values import (
     ValueObject,
     ValueOutput,
     ValuePattern,
+    ValueRange,
+    ValueSequence,
     ValueSet,
     ValueString,
+    ValueStringRope,
+    ValueStringSlice,
     TRUE,
     FALSE,
     NULL,
@@ -46,7 +64,30 @@ def get_none_environment():
     return Environment()
 
 
+# Base environments are built once per (secure, legacy) combination and
+# kept as templates. With lazy module loading the template only holds
+# immutable values and LazySymbol stubs, so every interpreter gets its
+# own copy of the binding table and module registry, while the values
+# themselves are shared. Modules are still loaded per interpreter, on
+# first use of one of their symbols.
+
+BASE_TEMPLATES = dict()
+
+
 def get_base_environment(secure=True, legacy=True):
+    import ckl.lazy
+    if not ckl.lazy.LAZY_MODULES:
+        return build_base_environment(secure, legacy)
+    key = (secure, legacy)
+    if key not in BASE_TEMPLATES:
+        template = build_base_environment(secure, legacy)
+        if not ckl.lazy.isShareable(template):
+            return template
+        BASE_TEMPLATES[key] = template
+    return BASE_TEMPLATES[key].copyBase()
+
+
+def build_base_environment(secure=True, legacy=True):
     result = get_none_environment()
     result.put("checkerlang_secure_mode", ValueBoolean.fromval(secure))
     # MAXINT and MININT are kind of arbitrary, since python supports
@@ -59,13 +100,18 @@ def get_base_environment(secure=True, legacy=True):
     if legacy:
         script = pkgutil.get_data(
             __name__, "modules/legacy.ckl").decode("utf-8")
-        parse_script(script, ":legacy").evaluate(result)
+        parse_module_cached(script, ":legacy", "legacy.ckl").evaluate(result)
     else:
         script = pkgutil.get_data(__name__, "modules/base.ckl").decode("utf-8")
-        parse_script(script, ":base").evaluate(result)
+        parse_module_cached(script, ":base", "base.ckl").evaluate(result)
     return result
 
 
+NUMERIC = (ValueInt, ValueDecimal)
+
+STRINGS = (ValueString, ValueStringRope, ValueStringSlice)
+
+
 def add(env, func, alias=None):
     if alias is not None:
         env.put(alias, func)
@@ -73,6 +119,9 @@ def add(env, func, alias=None):
 
 
 class Environment:
+    layout = None
+    evaluated = False
+
     def __init__(self, parent=None):
         self.map = dict()
         self.parent = parent
@@ -84,6 +133,15 @@ class Environment:
         self.parent = parent
         return self
 
+    def markEvaluated(self):
+        # code run by eval or run may take the lists of the variables of
+        # the environment and its parents, so that accumulations must not
+        # change them in place any more, see markAccumulations
+        current = self
+        while current:
+            current.evaluated = True
+            current = current.parent
+
     def getBase(self):
         current = self
         while current.parent:
@@ -105,6 +163,12 @@ class Environment:
     def getModules(self):
         return self.getBase().modules
 
+    def copyBase(self):
+        result = Environment()
+        result.map = dict(self.map)
+        result.modules = dict(self.modules)
+        return result
+
     def pushModuleStack(self, moduleidentifier, pos):
         base = self.getBase()
         if moduleidentifier in base.modulestack:
@@ -147,20 +211,12 @@ class Environment:
     def get(self, symbol, pos=None):
         if symbol in self.map:
             value = self.map[symbol]
-            if value is None:
-                return NULL
             if isinstance(value, Value):
                 return value
-            elif isinstance(value, int):
-                return ValueInt(value)
-            elif isinstance(value, float):
-                return ValueDecimal(value)
-            elif isinstance(value, bool):
-                return ValueBoolean.fromval(value)
-            elif isinstance(value, datetime.datetime):
-                return ValueDate(value)
-            else:
-                return ValueString(str(value))
+            if isinstance(value, LazySymbol):
+                value = self.map[symbol] = value.resolve(self)
+                return value
+            return to_value(value)
         if self.parent:
             return self.parent.get(symbol, pos)
         raise CklRuntimeError(
@@ -168,6 +224,107 @@ class Environment:
         )
 
 
+class LazySymbol:
+    # Stands in for a symbol of a module that is loaded on first access,
+    # see ckl.lazy. Environment.get replaces it by the actual value. It
+    # does not refer to a particular interpreter, the module is loaded
+    # into the base environment the symbol is looked up in.
+    def __init__(self, module, name):
+        self.module = module
+        self.name = name
+
+    def resolve(self, environment):
+        base = environment.getBase()
+        return self.module.getEnvironment(base).get(self.name)
+
+
+def to_value(value):
+    if value is None:
+        return NULL
+    if isinstance(value, Value):
+        return value
+    elif isinstance(value, int):
+        return ValueInt.fromval(value)
+    elif isinstance(value, float):
+        return ValueDecimal(value)
+    elif isinstance(value, bool):
+        return ValueBoolean.fromval(value)
+    elif isinstance(value, datetime.datetime):
+        return ValueDate(value)
+    else:
+        return ValueString(str(value))
+
+
+class SlotEnvironment(Environment):
+    def __init__(self, parent, layout):
+        self.map = dict()
+        self.parent = parent
+        self.layout = layout
+        self.slots = [UNBOUND] * len(layout)
+
+    def getSymbols(self):
+        result = set(super().getSymbols())
+        for symbol in self.getLocalSymbols():
+            result.add(symbol)
+        return sorted(result)
+
+    def getLocalSymbols(self):
+        result = [
+            symbol
+            for symbol, index in self.layout.items()
+            if self.slots[index] is not UNBOUND
+        ]
+        result.extend(self.map.keys())
+        return result
+
+    def put(self, name, value):
+        index = self.layout.get(name)
+        if index is None:
+            self.map[name] = value
+        elif isinstance(value, Value):
+            self.slots[index] = value
+        else:
+            self.slots[index] = to_value(value)
+
+    def set(self, name, value):
+        index = self.layout.get(name)
+        if index is not None and self.slots[index] is not UNBOUND:
+            self.slots[index] = to_value(value)
+        elif name in self.map:
+            self.map[name] = value
+        else:
+            self.parent.set(name, value)
+
+    def remove(self, name):
+        index = self.layout.get(name)
+        if index is None or self.slots[index] is UNBOUND:
+            del self.map[name]
+        else:
+            self.slots[index] = UNBOUND
+
+    def isDefined(self, symbol):
+        index = self.layout.get(symbol)
+        if index is not None and self.slots[index] is not UNBOUND:
+            return True
+        return symbol in self.map or self.parent.isDefined(symbol)
+
+    def get(self, symbol, pos=None):
+        index = self.layout.get(symbol)
+        if index is not None:
+            value = self.slots[index]
+            if value is not UNBOUND:
+                return value
+        elif symbol in self.map:
+            value = self.map[symbol]
+            if isinstance(value, Value):
+                return value
+            if isinstance(value, LazySymbol):
+                value = self.map[symbol] = value.resolve(self)
+                return value
+            return to_value(value)
+        return self.parent.get(symbol, pos)
+
+
 def bind_native(environment, native, alias=None):
     if native == "acos":
         bind_native_fun(environment, FuncAcos(), alias)
@@ -287,6 +444,16 @@ def bind_native(environment, native, alias=None):
         bind_native_fun(environment, FuncIsNotNull(), alias)
     elif native == "is_null":
         bind_native_fun(environment, FuncIsNull(), alias)
+    elif native == "join":
+        bind_native_fun(environment, FuncJoin(), alias)
+    elif native == "lazy_filter":
+        bind_native_fun(environment, FuncLazyFilter(), alias)
+    elif native == "lazy_flatten":
+        bind_native_fun(environment, FuncLazyFlatten(), alias)
+    elif native == "lazy_map":
+        bind_native_fun(environment, FuncLazyMap(), alias)
+    elif native == "lazy_unique":
+        bind_native_fun(environment, FuncLazyUnique(), alias)
     elif native == "length":
         bind_native_fun(environment, FuncLength(), alias)
     elif native == "less":
@@ -321,6 +488,8 @@ def bind_native(environment, native, alias=None):
         bind_native_fun(environment, FuncOrd(), alias)
     elif native == "parse":
         bind_native_fun(environment, FuncParse(), alias)
+    elif native == "parse_cache_info":
+        bind_native_fun(environment, FuncParseCacheInfo(), alias)
     elif native == "parse_date":
         bind_native_fun(environment, FuncParseDate(), alias)
     elif native == "parse_json":
@@ -353,6 +522,8 @@ def bind_native(environment, native, alias=None):
         bind_native_fun(environment, FuncRound(), alias)
     elif native == "s":
         bind_native_fun(environment, FuncS(), alias)
+    elif native == "sequence":
+        bind_native_fun(environment, FuncSequence(), alias)
     elif native == "set":
         bind_native_fun(environment, FuncSet(), alias)
     elif native == "set_seed":
@@ -365,6 +536,8 @@ def bind_native(environment, native, alias=None):
         bind_native_fun(environment, FuncSplit(), alias)
     elif native == "split2":
         bind_native_fun(environment, FuncSplit2(), alias)
+    elif native == "sprintf":
+        bind_native_fun(environment, FuncSprintf(), alias)
     elif native == "sqrt":
         bind_native_fun(environment, FuncSqrt(), alias)
     elif native == "str_input":
@@ -545,7 +718,7 @@ class FuncAdd(ValueFunc):
             return NULL
 
         if a.isInt() and b.isInt():
-            return ValueInt(a.value + b.value)
+            return ValueInt.fromval(a.value + b.value)
 
         if a.isNumerical() and b.isNumerical():
             return ValueDecimal(a.asDecimal().value + b.asDecimal().value)
@@ -588,7 +761,7 @@ class FuncAdd(ValueFunc):
             )
 
         if (a.isString() and b.isAtomic()) or (a.isAtomic() and b.isString()):
-            return ValueString(a.asString().value + b.asString().value)
+            return a.asString().concat(b.asString())
 
         raise CklRuntimeError(
             ValueString("ERROR"),
@@ -596,6 +769,24 @@ class FuncAdd(ValueFunc):
             pos,
         )
 
+    def executeOperator(self, a, b):
+        if a.__class__ is ValueInt and b.__class__ is ValueInt:
+            return ValueInt.fromval(a.value + b.value)
+        if a.__class__ in NUMERIC and b.__class__ in NUMERIC:
+            return ValueDecimal(a.value + b.value)
+        if a.__class__ in STRINGS and b.__class__ in STRINGS:
+            return a.concat(b)
+        return None
+
+    def accumulate(self, a, b):
+        if b.isNull():
+            return False
+        if b.isCollection():
+            a.addItems(b.asList().getItems())
+        else:
+            a.addItem(b)
+        return True
+
 
 class FuncAppend(ValueFunc):
     def __init__(self):
@@ -1276,6 +1467,13 @@ class FuncDiv(ValueFunc):
             pos,
         )
 
+    def executeOperator(self, a, b):
+        if a.__class__ in NUMERIC and b.__class__ in NUMERIC and b.value:
+            if a.__class__ is ValueInt and b.__class__ is ValueInt:
+                return ValueInt.fromval(math.trunc(a.value / b.value))
+            return ValueDecimal(a.value / b.value)
+        return None
+
 
 class FuncEndsWith(ValueFunc):
     def __init__(self):
@@ -1330,6 +1528,13 @@ class FuncEquals(ValueFunc):
         b = args.get("b")
         return ValueBoolean.fromval(a == b)
 
+    def executeOperator(self, a, b):
+        if a.__class__ in NUMERIC and b.__class__ in NUMERIC:
+            return TRUE if a.value == b.value else FALSE
+        if a.__class__ is ValueString and b.__class__ is ValueString:
+            return TRUE if a.value == b.value else FALSE
+        return None
+
 
 class FuncEscapePattern(ValueFunc):
     def __init__(self):
@@ -1376,11 +1581,13 @@ class FuncEval(ValueFunc):
         return ["s"]
 
     def execute(self, args, environment, pos):
+        environment.markEvaluated()
         if args.get("s").isNode():
-            return args.getAsNode("s").value.evaluate(environment)
+            result = args.getAsNode("s").value.evaluate(environment)
+            return executeTailCall(result, environment)
         s = args.getString("s").value
         try:
-            node = parse_script(s, pos.filename)
+            node = PARSE_CACHE.parse(s, pos.filename)
             return node.evaluate(environment)
         except Exception:
             raise CklRuntimeError(
@@ -1898,6 +2105,11 @@ class FuncGreater(ValueFunc):
         b = args.get("b")
         return ValueBoolean.fromval(a > b)
 
+    def executeOperator(self, a, b):
+        if a.__class__ in NUMERIC and b.__class__ in NUMERIC:
+            return TRUE if a.value > b.value else FALSE
+        return None
+
 
 class FuncGreaterEquals(ValueFunc):
     def __init__(self):
@@ -1922,6 +2134,11 @@ class FuncGreaterEquals(ValueFunc):
         b = args.get("b")
         return ValueBoolean.fromval(a >= b)
 
+    def executeOperator(self, a, b):
+        if a.__class__ in NUMERIC and b.__class__ in NUMERIC:
+            return TRUE if a.value >= b.value else FALSE
+        return None
+
 
 class FuncIdentity(ValueFunc):
     def __init__(self):
@@ -2125,9 +2342,9 @@ class FuncIsEmpty(ValueFunc):
         if obj.isNumerical():
             return FALSE
         if obj.isString():
-            return ValueBoolean.fromval(obj.value == "")
+            return ValueBoolean.fromval(obj.getLength() == 0)
         if obj.isList():
-            return ValueBoolean.fromval(len(obj.value) == 0)
+            return ValueBoolean.fromval(len(obj.getItems()) == 0)
         if obj.isSet():
             return ValueBoolean.fromval(len(obj.value) == 0)
         if obj.isMap():
@@ -2165,9 +2382,9 @@ class FuncIsNotEmpty(ValueFunc):
         if obj.isNumerical():
             return TRUE
         if obj.isString():
-            return ValueBoolean.fromval(obj.value != "")
+            return ValueBoolean.fromval(obj.getLength() > 0)
         if obj.isList():
-            return ValueBoolean.fromval(len(obj.value) > 0)
+            return ValueBoolean.fromval(len(obj.getItems()) > 0)
         if obj.isSet():
             return ValueBoolean.fromval(len(obj.value) > 0)
         if obj.isMap():
@@ -2221,13 +2438,62 @@ class FuncIsNull(ValueFunc):
         return ValueBoolean.fromval(args.get("obj").isNull())
 
 
+class FuncJoin(ValueFunc):
+    def __init__(self):
+        super().__init__("join")
+        self.info = "\r\n".join(
+            [
+                "join(lst, sep = ' ')",
+                "",
+                "Returns a string containing all elements of the list lst",
+                "separated by the string sep.",
+                "",
+                ": join([1, 2, 3], '|') ==> '1|2|3'",
+                ": join(['one', 'world'], '--') ==> 'one--world'",
+                ": join([], '|') ==> ''",
+                ": join([1], '|') ==> '1'",
+                ": join('|', [1, 2, 3]) ==> '1|2|3'",
+            ]
+        )
+
+    def getArgNames(self):
+        return ["lst", "sep"]
+
+    def execute(self, args, environment, pos):
+        lst = args.get("lst")
+        sep = args.get("sep") if args.hasArg("sep") else ValueString(" ")
+        if lst.isString():
+            lst, sep = sep, lst
+        if lst.isString():
+            items = [ValueString(ch) for ch in lst.value]
+        elif lst.isList():
+            items = lst.getItems()
+        elif lst.isSet():
+            items = lst.getSortedItems()
+        elif lst.isMap():
+            items = [lst.value[key] for key in lst.getSortedKeys()]
+        elif lst.isSequence():
+            items = lst.iterate()
+        else:
+            raise CklRuntimeError(
+                ValueString("ERROR"), f"Cannot iterate over {lst.type()}", pos
+            )
+        return ValueString(
+            sep.asString().value.join(item.asString().value for item in items)
+        )
+
+
 class FuncLambda(ValueFunc):
+    tailCallable = True
+
     def __init__(self, lexicalEnv):
         super().__init__("lambda")
         self.lexicalEnv = lexicalEnv
         self.argNames = []
         self.defValues = []
         self.body = None
+        self.code = None
+        self.layout = None
 
     def getArgNames(self):
         return self.argNames
@@ -2239,26 +2505,56 @@ class FuncLambda(ValueFunc):
         self.argNames.append(name)
         self.defValues.append(defaultValue)
 
-    def setBody(self, body):
+    def setBody(self, body, code=None):
         self.body = body
+        self.code = code or body.evaluate
 
-    def execute(self, args, environment, pos):
-        env = self.lexicalEnv.newEnv()
-        for i in range(len(self.argNames)):
-            if args.hasArg(self.argNames[i]):
-                env.put(self.argNames[i], args.get(self.argNames[i]))
+    def setLayout(self, layout):
+        self.layout = layout
+
+    def bindArgs(self, args, pos):
+        if self.layout is None:
+            env = self.lexicalEnv.newEnv()
+        else:
+            env = SlotEnvironment(self.lexicalEnv, self.layout)
+        values = args.args
+        for i, argName in enumerate(self.argNames):
+            if argName in values:
+                env.put(argName, values[argName])
             elif self.defValues[i] is not None:
-                env.put(self.argNames[i], self.defValues[i].evaluate(env))
+                env.put(argName, self.defValues[i].evaluate(env))
             else:
                 raise CklRuntimeError(
                     ValueString("ERROR"),
-                    "Missing argument " + self.argNames[i],
+                    "Missing argument " + argName,
                     pos,
                 )
-        result = self.body.evaluate(env)
-        if isinstance(result, ValueControlReturn):
-            return result.value
-        elif isinstance(result, ValueControlBreak):
+        return env
+
+    def execute(self, args, environment, pos):
+        # Calls in tail position of the body come back as tail call
+        # values and are executed here in turn, so they neither nest
+        # python frames nor environments.
+        fn = self
+        while True:
+            try:
+                result = fn.code(fn.bindArgs(args, pos))
+            except CklRuntimeError as e:
+                if fn is not self:
+                    e.stacktrace.append(
+                        getFuncallString(fn, args) + " " + str(pos)
+                    )
+                raise
+            if isinstance(result, ValueControlReturn):
+                result = result.value
+                if not isinstance(result, ValueControlTailCall):
+                    return result
+            if not isinstance(result, ValueControlTailCall):
+                break
+            fn = result.fn
+            args = result.args
+            pos = result.pos
+        if isinstance(result, ValueControlBreak):
             raise CklRuntimeError(
                 ValueString("ERROR"),
                 "Cannot use break without surrounding loop",
@@ -2273,6 +2569,177 @@ class FuncLambda(ValueFunc):
         return result
 
 
+class FuncLazyFilter(ValueFunc):
+    def __init__(self):
+        super().__init__("lazy_filter")
+        self.info = "\r\n".join(
+            [
+                "lazy_filter(seq, predicate, key = identity)",
+                "",
+                "Returns a sequence of the elements of seq for which the",
+                "predicate returns TRUE. The elements are only read and",
+                "tested when the sequence is iterated.",
+                "",
+                ": list(lazy_filter([1, 2, 3, 4], fn(x) x % 2 == 0)) "
+                "==> [2, 4]",
+            ]
+        )
+
+    def getArgNames(self):
+        return ["seq", "predicate", "key"]
+
+    def execute(self, args, environment, pos):
+        seq = getSequence(args, "seq", pos)
+        predicate = args.getFunc("predicate")
+        key = args.getFunc("key") if args.hasArg("key") else None
+        env = environment.newEnv()
+
+        def stage(items):
+            for item in items:
+                value = item
+                if key is not None:
+                    value = executeUnary(key, item, env, pos)
+                condition = executeUnary(predicate, value, env, pos)
+                if not condition.isBoolean():
+                    raise CklRuntimeError(
+                        ValueString("ERROR"),
+                        f"Expected boolean but got {condition.type()}",
+                        pos,
+                    )
+                if condition.value:
+                    yield item
+
+        return seq.withStage(stage)
+
+
+class FuncLazyFlatten(ValueFunc):
+    def __init__(self):
+        super().__init__("lazy_flatten")
+        self.info = "\r\n".join(
+            [
+                "lazy_flatten(seq)",
+                "",
+                "Returns a sequence of the elements of seq, where lists",
+                "are replaced by their elements. This does only work at",
+                "the top level and does not recurse.",
+                "",
+                ": list(lazy_flatten([[1, 2], 3, [4]])) ==> [1, 2, 3, 4]",
+            ]
+        )
+
+    def getArgNames(self):
+        return ["seq"]
+
+    def execute(self, args, environment, pos):
+        seq = getSequence(args, "seq", pos)
+
+        def stage(items):
+            for item in items:
+                if item.isList():
+                    yield from item.getItems()
+                else:
+                    yield item
+
+        return seq.withStage(stage)
+
+
+class FuncLazyMap(ValueFunc):
+    def __init__(self):
+        super().__init__("lazy_map")
+        self.info = "\r\n".join(
+            [
+                "lazy_map(seq, f)",
+                "",
+                "Returns a sequence of the elements of seq with the",
+                "function f applied. The function is only called when",
+                "the sequence is iterated.",
+                "",
+                ": list(lazy_map([1, 2, 3], fn(x) 2 * x)) ==> [2, 4, 6]",
+            ]
+        )
+
+    def getArgNames(self):
+        return ["seq", "f"]
+
+    def execute(self, args, environment, pos):
+        seq = getSequence(args, "seq", pos)
+        f = args.getFunc("f")
+        env = environment.newEnv()
+
+        def stage(items):
+            for item in items:
+                yield executeUnary(f, item, env, pos)
+
+        return seq.withStage(stage)
+
+
+class FuncLazyUnique(ValueFunc):
+    def __init__(self):
+        super().__init__("lazy_unique")
+        self.info = "\r\n".join(
+            [
+                "lazy_unique(seq, key = identity)",
+                "",
+                "Returns a sequence of the elements of seq without",
+                "duplicates. The first occurence of each duplicate is",
+                "retained.",
+                "",
+                ": list(lazy_unique([1, 4, 2, 4, 1])) ==> [1, 4, 2]",
+            ]
+        )
+
+    def getArgNames(self):
+        return ["seq", "key"]
+
+    def execute(self, args, environment, pos):
+        seq = getSequence(args, "seq", pos)
+        key = args.getFunc("key") if args.hasArg("key") else None
+        env = environment.newEnv()
+
+        def stage(items):
+            seen = set()
+            for item in items:
+                value = item
+                if key is not None:
+                    value = executeUnary(key, item, env, pos)
+                if value in seen:
+                    continue
+                seen.add(value)
+                yield item
+
+        return seq.withStage(stage)
+
+
+def getSequence(args, name, pos):
+    value = args.get(name)
+    if value.isSequence():
+        return value
+    if value.isList() or value.isSet() or value.isInput():
+        return ValueSequence(value)
+    raise CklRuntimeError(
+        ValueString("ERROR"),
+        f"Cannot create sequence from {value.type()}",
+        pos,
+    )
+
+
+def executeTailCall(result, environment):
+    # lambda bodies evaluated outside of FuncLambda.execute, e.g. by eval
+    # of their body, return their tail calls still pending
+    if isinstance(result, ValueControlReturn):
+        value = executeTailCall(result.value, environment)
+        if value is not result.value:
+            return ValueControlReturn(value, result.pos)
+    while isinstance(result, ValueControlTailCall):
+        result = result.fn.execute(result.args, environment, result.pos)
+    return result
+
+
+def executeUnary(fn, value, environment, pos):
+    args = Args(pos).addArg(fn.getArgNames()[0], value)
+    return fn.execute(args, environment, pos)
+
+
 class FuncLength(ValueFunc):
     def __init__(self):
         super().__init__("length")
@@ -2297,9 +2764,9 @@ class FuncLength(ValueFunc):
     def execute(self, args, environment, pos):
         arg = args.get("obj")
         if arg.isString():
-            return ValueInt(len(arg.value))
+            return ValueInt(arg.getLength())
         if arg.isList():
-            return ValueInt(len(arg.value))
+            return ValueInt(len(arg.getItems()))
         if arg.isSet():
             return ValueInt(len(arg.value))
         if arg.isMap():
@@ -2330,6 +2797,11 @@ class FuncLess(ValueFunc):
         b = args.get("b")
         return ValueBoolean.fromval(a < b)
 
+    def executeOperator(self, a, b):
+        if a.__class__ in NUMERIC and b.__class__ in NUMERIC:
+            return TRUE if a.value < b.value else FALSE
+        return None
+
 
 class FuncLessEquals(ValueFunc):
     def __init__(self):
@@ -2354,6 +2826,11 @@ class FuncLessEquals(ValueFunc):
         b = args.get("b")
         return ValueBoolean.fromval(a <= b)
 
+    def executeOperator(self, a, b):
+        if a.__class__ in NUMERIC and b.__class__ in NUMERIC:
+            return TRUE if a.value <= b.value else FALSE
+        return None
+
 
 class FuncList(ValueFunc):
     def __init__(self):
@@ -2610,7 +3087,7 @@ class FuncMod(ValueFunc):
             return NULL
 
         if a.isInt() and b.isInt():
-            return ValueInt(a.value % b.value)
+            return ValueInt.fromval(a.value % b.value)
 
         if a.isNumerical() and b.isNumerical():
             return ValueDecimal(a.asDecimal().value % b.asDecimal().value)
@@ -2621,6 +3098,13 @@ class FuncMod(ValueFunc):
             pos,
         )
 
+    def executeOperator(self, a, b):
+        if a.__class__ in NUMERIC and b.__class__ in NUMERIC and b.value:
+            if a.__class__ is ValueInt and b.__class__ is ValueInt:
+                return ValueInt.fromval(a.value % b.value)
+            return ValueDecimal(a.value % b.value)
+        return None
+
 
 class FuncMul(ValueFunc):
     def __init__(self):
@@ -2656,12 +3140,11 @@ class FuncMul(ValueFunc):
 
         if a.isList() and b.isInt():
             result = ValueList()
-            for i in range(b.value):
-                result.addItems(a.value)
+            result.value = a.value * b.value
             return result
 
         if a.isInt() and b.isInt():
-            return ValueInt(a.value * b.value)
+            return ValueInt.fromval(a.value * b.value)
 
         if a.isNumerical() and b.isNumerical():
             return ValueDecimal(a.asDecimal().value * b.asDecimal().value)
@@ -2672,6 +3155,13 @@ class FuncMul(ValueFunc):
             pos,
         )
 
+    def executeOperator(self, a, b):
+        if a.__class__ is ValueInt and b.__class__ is ValueInt:
+            return ValueInt.fromval(a.value * b.value)
+        if a.__class__ in NUMERIC and b.__class__ in NUMERIC:
+            return ValueDecimal(a.value * b.value)
+        return None
+
 
 class FuncNotEquals(ValueFunc):
     def __init__(self):
@@ -2700,6 +3190,13 @@ class FuncNotEquals(ValueFunc):
         b = args.get("b")
         return ValueBoolean.fromval(a != b)
 
+    def executeOperator(self, a, b):
+        if a.__class__ in NUMERIC and b.__class__ in NUMERIC:
+            return TRUE if a.value != b.value else FALSE
+        if a.__class__ is ValueString and b.__class__ is ValueString:
+            return TRUE if a.value != b.value else FALSE
+        return None
+
 
 class FuncObject(ValueFunc):
     def __init__(self):
@@ -2769,7 +3266,7 @@ class FuncParse(ValueFunc):
     def execute(self, args, environment, pos):
         try:
             return ValueNode(
-                parse_script(args.getString("s").value, pos.filename)
+                PARSE_CACHE.parse(args.getString("s").value, pos.filename)
             )
         except Exception:
             raise CklRuntimeError(
@@ -2779,6 +3276,38 @@ class FuncParse(ValueFunc):
             )
 
 
+class FuncParseCacheInfo(ValueFunc):
+    def __init__(self):
+        super().__init__("parse_cache_info")
+        self.info = "\r\n".join(
+            [
+                "parse_cache_info()",
+                "",
+                "Returns a map with the statistics of the cache used by",
+                "eval and parse: the number of hits and misses, the",
+                "current number of entries and the maximum size.",
+                "",
+                ": set(parse_cache_info()) ==> "
+                "<<'hits', 'maxsize', 'misses', 'size'>>",
+            ]
+        )
+
+    def getArgNames(self):
+        return []
+
+    def execute(self, args, environment, pos):
+        result = ValueMap()
+        result.addItem(ValueString("hits"), ValueInt(PARSE_CACHE.hits))
+        result.addItem(ValueString("misses"), ValueInt(PARSE_CACHE.misses))
+        result.addItem(
+            ValueString("size"), ValueInt(len(PARSE_CACHE.entries))
+        )
+        result.addItem(
+            ValueString("maxsize"), ValueInt(PARSE_CACHE.maxsize)
+        )
+        return result
+
+
 class FuncParseDate(ValueFunc):
     def __init__(self):
         super().__init__("parse_date")
@@ -2911,7 +3440,7 @@ class FuncParseJson(ValueFunc):
         if type(obj) == str:
             return ValueString(obj)
         if type(obj) == int:
-            return ValueInt(obj)
+            return ValueInt.fromval(obj)
         if type(obj) == float:
             return ValueDecimal(obj)
         if type(obj) == bool:
@@ -3060,8 +3589,8 @@ class FuncProcessLines(ValueFunc):
                 "once for each line. The line string is the single argument",
                 "of the callback function.",
                 "",
-                "If input is a list, then each list element is converted to",
-                "a string and processed as a line",
+                "If input is a list or a sequence, then each element is",
+                "converted to a string and processed as a line",
                 "",
                 "The function returns the number of processed lines." + "",
                 ": def result = []; str_input('one\\ntwo\\nthree') !> "
@@ -3097,6 +3626,15 @@ class FuncProcessLines(ValueFunc):
                 )
                 callback.execute(args, env, pos)
             return ValueInt(len(lst))
+        elif inparg.isSequence():
+            count = 0
+            for element in inparg.iterate():
+                args = Args(pos).addArg(
+                    callback.getArgNames()[0], element.asString()
+                )
+                callback.execute(args, env, pos)
+                count += 1
+            return ValueInt(count)
         else:
             raise CklRuntimeError(
                 ValueString("ERROR"),
@@ -3217,17 +3755,9 @@ class FuncRange(ValueFunc):
         if args.hasArg("step"):
             step = args.getInt("step").value
 
-        result = ValueList()
-        i = start
-        if step > 0:
-            while i < end:
-                result.addItem(ValueInt(i))
-                i += step
-        elif step < 0:
-            while i > end:
-                result.addItem(ValueInt(i))
-                i += step
-        return result
+        if step == 0:
+            return ValueRange(range(0))
+        return ValueRange(range(start, end, step))
 
 
 class FuncRead(ValueFunc):
@@ -3410,6 +3940,7 @@ class FuncRun(ValueFunc):
             raise CklRuntimeError(
                 ValueString("ERROR"), "File " + path + " not found", pos
             )
+        self.interpreter.environment.markEvaluated()
         return self.interpreter.interpret(script, file)
 
 
@@ -3469,55 +4000,144 @@ class FuncS(ValueFunc):
         start = args.getInt("start", 0).value
         if start < 0:
             start = len(s) + start
-        while True:
-            idx1 = s.find("{", start)
-            if idx1 == -1:
-                return ValueString(s)
-            idx2 = s.find("}", idx1 + 1)
-            if idx2 == -1:
-                return ValueString(s)
-            variable = s[idx1+1:idx2]
-            width = 0
-            zeroes = False
-            leading = True
-            digits = -1
-            base = 10
-            idx3 = variable.find("#")
-            if idx3 != -1:
-                spec = variable[idx3+1:]
-                variable = variable[0:idx3]
-                if spec.startswith("-"):
-                    leading = False
-                    spec = spec[1:]
-                if spec.startswith("0"):
-                    zeroes = True
-                    leading = False
-                    spec = spec[1:]
-                if spec.endswith("x"):
-                    base = 16
-                    spec = spec[0:-1]
-                idx4 = spec.find(".")
-                if idx4 == -1:
-                    digits = -1
-                    width = int(spec or "0")
-                else:
-                    digits = int(spec[idx4+1:] or "0")
-                    width = int(spec[0:idx4] or "0")
-            node = parse_script(variable, pos.filename)
-            value = node.evaluate(environment).asString().value
-            if base != 10:
-                value = f"{int(value):x}"
-            elif digits != -1:
-                value = str(round(float(value), digits))
-            while len(value) < width:
-                if leading:
-                    value = " " + value
-                elif zeroes:
-                    value = "0" + value
-                else:
-                    value = value + " "
-            s = s[0:idx1] + value + s[idx2+1:]
-            start = idx1 + len(value)
+        result = []
+        for part in compile_template(s, start, pos.filename):
+            if part.__class__ is str:
+                result.append(part)
+            else:
+                result.append(part.format(environment))
+        return ValueString("".join(result))
+
+
+# Format strings of s and sprintf are split into literal parts and placeholder
+# fields once and kept in a bounded cache, so that formatting the same
+# string again only evaluates the placeholder expressions. Substituted
+# values are never scanned for placeholders, which allows splitting the
+# string in advance.
+
+@functools.lru_cache(maxsize=1024)
+def compile_template(s, start, filename):
+    parts = []
+    last = 0
+    while True:
+        idx1 = s.find("{", start)
+        if idx1 == -1:
+            break
+        idx2 = s.find("}", idx1 + 1)
+        if idx2 == -1:
+            break
+        if idx1 > last:
+            parts.append(s[last:idx1])
+        parts.append(TemplateField(s[idx1+1:idx2], filename))
+        last = start = idx2 + 1
+    if last < len(s) or not parts:
+        parts.append(s[last:])
+    return tuple(parts)
+
+
+class TemplateField:
+    def __init__(self, field, filename):
+        self.field = field
+        self.filename = filename
+        try:
+            self.compile()
+        except Exception:
+            self.node = None  # reported when the field is formatted
+
+    def compile(self):
+        variable = self.field
+        self.width = 0
+        self.zeroes = False
+        self.leading = True
+        self.digits = -1
+        self.base = 10
+        idx3 = variable.find("#")
+        if idx3 != -1:
+            spec = variable[idx3+1:]
+            variable = variable[0:idx3]
+            if spec.startswith("-"):
+                self.leading = False
+                spec = spec[1:]
+            if spec.startswith("0"):
+                self.zeroes = True
+                self.leading = False
+                spec = spec[1:]
+            if spec.endswith("x"):
+                self.base = 16
+                spec = spec[0:-1]
+            idx4 = spec.find(".")
+            if idx4 == -1:
+                self.width = int(spec or "0")
+            else:
+                self.digits = int(spec[idx4+1:] or "0")
+                self.width = int(spec[0:idx4] or "0")
+        self.index = None
+        if variable.isascii() and variable.isdigit():
+            if str(int(variable)) == variable:
+                self.index = int(variable)
+        self.node = parse_script(variable, self.filename)
+        # expressions other than a name or literal may take the lists of
+        # variables, like code run by eval, see Environment.markEvaluated
+        self.evaluates = not isinstance(
+            self.node, (NodeIdentifier, NodeLiteral)
+        )
+        # the cached tree is evaluated again and again, its string literals
+        # are replaced before each evaluation as they can be changed in place
+        self.literals = []
+        collectStringLiterals(self.node, self.literals)
+
+    def format(self, environment, values=None):
+        if self.node is None:
+            self.compile()
+        if values is not None and self.index is not None and (
+            self.index < len(values)
+        ):
+            value = values[self.index].asString().value
+        else:
+            if self.evaluates:
+                environment.markEvaluated()
+            for literal, text in self.literals:
+                literal.value = ValueString(text)
+            value = self.node.evaluate(environment).asString().value
+        if self.base != 10:
+            value = f"{int(value):x}"
+        elif self.digits != -1:
+            value = str(round(float(value), self.digits))
+        if len(value) < self.width:
+            if self.leading:
+                value = value.rjust(self.width)
+            elif self.zeroes:
+                value = value.rjust(self.width, "0")
+            else:
+                value = value.ljust(self.width)
+        return value
+
+
+class FuncSequence(ValueFunc):
+    def __init__(self):
+        super().__init__("sequence")
+        self.info = "\r\n".join(
+            [
+                "sequence(obj)",
+                "",
+                "Returns a lazy sequence of the elements of the list or set",
+                "obj, or of the lines of the input obj. The functions",
+                "map_list, filter, grep, unique and flatten of the List",
+                "module return sequences for sequences, which are",
+                "processed in a single pass when the sequence is iterated.",
+                "Use list(seq) to get a list of the elements.",
+                "",
+                ": list(sequence([1, 2, 3])) ==> [1, 2, 3]",
+                ": list(sequence(<<3, 1, 2>>)) ==> [1, 2, 3]",
+                ": type(sequence([])) ==> 'sequence'",
+            ]
+        )
+
+    def getArgNames(self):
+        return ["obj"]
+
+    def execute(self, args, environment, pos):
+        return getSequence(args, "obj", pos)
 
 
 class FuncSet(ValueFunc):
@@ -3585,20 +4205,25 @@ class FuncSorted(ValueFunc):
         super().__init__("sorted")
         self.info = "\r\n".join(
             [
-                "sorted(lst, cmp=compare, key=identity)",
+                "sorted(lst, cmp=compare, key=identity, reverse=FALSE)",
                 "",
                 "Returns a sorted copy of the list. This is sorted ",
                 "according to the value returned by the key function ",
                 "for each element of the list.",
                 "The values are compared using the compare function cmp.",
+                "If reverse is TRUE, the list is sorted in descending order.",
+                "The sort is stable.",
                 "",
                 ": sorted([3, 2, 1]) ==> [1, 2, 3]",
                 ": sorted([6, 2, 5, 3, 1, 4]) ==> [1, 2, 3, 4, 5, 6]",
+                ": sorted([1, 3, 2], reverse = TRUE) ==> [3, 2, 1]",
+                ": sorted(['a', 'bbb', 'cc'], key = length) "
+                "==> ['a', 'cc', 'bbb']",
             ]
         )
 
     def getArgNames(self):
-        return ["lst", "cmp", "key"]
+        return ["lst", "cmp", "key", "reverse"]
 
     def execute(self, args, environment, pos):
         env = environment.newEnv()
@@ -3613,28 +4238,42 @@ class FuncSorted(ValueFunc):
             if args.hasArg("key")
             else environment.get("identity", pos)
         )
+        reverse = False
+        if args.hasArg("reverse"):
+            reverse = args.getBoolean("reverse").value
         result = lst.value[:]
-        for i in range(len(result)):
-            v = key.execute(
-                Args(pos).addArg(key.getArgNames()[0], result[i]), env, pos
-            )
-            for j in range(i - 1, -1, -1):
-                v2 = key.execute(
-                    Args(pos).addArg(key.getArgNames()[0], result[j]), env, pos
-                )
+
+        if isinstance(cmp, FuncCompare):
+            sortkey = None
+        else:
+            cmpArgNames = cmp.getArgNames()
+
+            def compare(a, b):
                 cmpargs = (
                     Args(pos)
-                    .addArg(cmp.getArgNames()[0], v)
-                    .addArg(cmp.getArgNames()[1], v2)
+                    .addArg(cmpArgNames[0], a)
+                    .addArg(cmpArgNames[1], b)
                 )
-                comparison = cmp.execute(cmpargs, env, pos).value
-                if comparison < 0:
-                    temp = result[j + 1]
-                    result[j + 1] = result[j]
-                    result[j] = temp
-                else:
-                    break
-        return ValueList().addItems(result)
+                return cmp.execute(cmpargs, env, pos).value
+
+            sortkey = functools.cmp_to_key(compare)
+
+        if isinstance(key, FuncIdentity):
+            result.sort(key=sortkey, reverse=reverse)
+            return ValueList().addItems(result)
+
+        keyArgName = key.getArgNames()[0]
+        decorated = [
+            (key.execute(Args(pos).addArg(keyArgName, item), env, pos), item)
+            for item in result
+        ]
+        if sortkey is None:
+            decorated.sort(key=operator.itemgetter(0), reverse=reverse)
+        else:
+            decorated.sort(
+                key=lambda entry: sortkey(entry[0]), reverse=reverse
+            )
+        return ValueList().addItems([item for _, item in decorated])
 
 
 class FuncSplit(ValueFunc):
@@ -3712,6 +4351,50 @@ class FuncSplit2(ValueFunc):
         return result
 
 
+class FuncSprintf(ValueFunc):
+    def __init__(self):
+        super().__init__("sprintf")
+        self.info = "\r\n".join(
+            [
+                "sprintf(fmt, args...)",
+                "",
+                "Formats a string format using the provided args. Each",
+                "value can be referred to in the fmt string using the",
+                "{0} syntax, where 0 means the first argument passed.",
+                "",
+                "This uses internally the s function. See there for",
+                "an explanation of available formatting suffixes.",
+                "Other placeholders are evaluated like in s, in the",
+                "scope of the caller. Arguments of any type are",
+                "formatted as their string value, NULL as ''.",
+                "",
+                ": sprintf('{0} {1}', 1, 2) ==> '1 2'",
+                ": sprintf('{0} {1}', 'a', 'b') ==> 'a b'",
+                ": sprintf('{0#5} {1#5}', 1, 2) ==> '    1     2'",
+                ": sprintf('{0#-5} {1#-5}', 1, 2) ==> '1     2    '",
+                ": sprintf('{0#05} {1#05}', 1, 2) ==> '00001 00002'",
+                ": require Math; sprintf('{0#.4}', Math->PI) ==> '3.1416'",
+                ": def a = 5; sprintf('{a}-{0}', 1) ==> '5-1'",
+                ": sprintf('[{0}]', NULL) ==> '[]'",
+                ": sprintf('{0}', [1, 2]) ==> '[1, 2]'",
+            ]
+        )
+
+    def getArgNames(self):
+        return ["fmt", "args..."]
+
+    def execute(self, args, environment, pos):
+        fmt = args.getString("fmt").value
+        values = args.getList("args...").value
+        result = []
+        for part in compile_template(fmt, 0, pos.filename):
+            if part.__class__ is str:
+                result.append(part)
+            else:
+                result.append(part.format(environment, values))
+        return ValueString("".join(result))
+
+
 class FuncSqrt(ValueFunc):
     def __init__(self):
         super().__init__("sqrt")
@@ -3896,7 +4579,7 @@ class FuncSub(ValueFunc):
             return NULL
 
         if a.isInt() and b.isInt():
-            return ValueInt(a.value - b.value)
+            return ValueInt.fromval(a.value - b.value)
 
         if a.isNumerical() and b.isNumerical():
             return ValueDecimal(a.asDecimal().value - b.asDecimal().value)
@@ -3907,6 +4590,13 @@ class FuncSub(ValueFunc):
             pos,
         )
 
+    def executeOperator(self, a, b):
+        if a.__class__ is ValueInt and b.__class__ is ValueInt:
+            return ValueInt.fromval(a.value - b.value)
+        if a.__class__ in NUMERIC and b.__class__ in NUMERIC:
+            return ValueDecimal(a.value - b.value)
+        return None
+
 
 class FuncSublist(ValueFunc):
     def __init__(self):
@@ -3930,21 +4620,19 @@ class FuncSublist(ValueFunc):
     def execute(self, args, environment, pos):
         if args.isNull("lst"):
             return NULL
-        value = args.getList("lst").value
+        lst = args.getList("lst")
+        length = len(lst.getItems())
         start = args.getInt("startidx").value
         if start < 0:
-            start = len(value) + start
-        if start > len(value):
+            start = max(length + start, 0)
+        if start > length:
             return ValueList()
-        end = args.getInt("endidx", len(value)).value
+        end = args.getInt("endidx", length).value
         if end < 0:
-            end = len(value) + end
-        if end > len(value):
-            end = len(value)
-        result = ValueList()
-        for i in range(start, end):
-            result.addItem(value[i])
-        return result
+            end = length + end
+        if end > length:
+            end = length
+        return lst.slice(start, max(start, end))
 
 
 class FuncSubstr(ValueFunc):
@@ -3969,18 +4657,20 @@ class FuncSubstr(ValueFunc):
     def execute(self, args, environment, pos):
         if args.isNull("str"):
             return NULL
-        value = args.getString("str").value
+        value = args.getString("str")
+        length = value.getLength()
         start = args.getInt("startidx").value
         if start < 0:
-            start = len(value) + start
-        if start > len(value):
+            start = length + start
+        if start > length:
             return ValueString("")
-        end = args.getInt("endidx", len(value)).value
+        end = args.getInt("endidx", length).value
         if end < 0:
-            end = len(value) + end
-        if end > len(value):
-            end = len(value)
-        return ValueString(value[start:end])
+            end = length + end
+        if end > length:
+            end = length
+        start, end, _ = slice(start, end).indices(length)
+        return value.slice(start, max(start, end))
 
 
 class FuncSum(ValueFunc):
@@ -4015,7 +4705,7 @@ class FuncSum(ValueFunc):
         if args.isNull("list"):
             return NULL
 
-        lst = args.getList("list").value
+        lst = args.getList("list").getItems()
 
         ignore = []
         if args.hasArg("ignore"):
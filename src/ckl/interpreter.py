@@ -1,8 +1,12 @@
+import functools
 import os
 import sys
 
+from ckl.compiler import compile_node
 from ckl.errors import CklRuntimeError
+from ckl.optimizer import optimize
 from ckl.parser import parse_script
+from ckl.trampoline import run
 from ckl.functions import (
     get_base_environment,
     FuncRun,
@@ -40,6 +44,27 @@ class Interpreter:
         return self.interpret(contents, os.path.basename(filename))
 
     def interpret(self, script, filename, environment=None):
+        return self.execute(
+            self.parse(script, filename).evaluate,
+            environment
+        )
+
+    def parse(self, script, filename="-"):
+        return optimize(parse_script(script, filename), self.environment)
+
+    def compile(self, script, filename="-"):
+        return CompiledScript(
+            self,
+            compile_node(self.parse(script, filename))
+        )
+
+    def trampoline(self, script, filename="-"):
+        return CompiledScript(
+            self,
+            functools.partial(run, self.parse(script, filename))
+        )
+
+    def execute(self, code, environment=None):
         savedParent = None
         if environment is None:
             env = self.environment
@@ -52,7 +77,7 @@ class Interpreter:
                 environment_.withParent(self.environment)
             env = environment
         try:
-            result = parse_script(script, filename).evaluate(env)
+            result = code(env)
             if result.isReturn():
                 return result.value
             elif result.isBreak():
@@ -75,3 +100,12 @@ class Interpreter:
                     environment_ = environment_.parent
                 if environment_:
                     environment_.withParent(savedParent)
+
+
+class CompiledScript:
+    def __init__(self, interpreter, code):
+        self.interpreter = interpreter
+        self.code = code
+
+    def run(self, environment=None):
+        return self.interpreter.execute(self.code, environment)
@@ -0,0 +1,203 @@
+from ckl.cache import load_module_manifest, parse_module_cached
+from ckl.errors import CklRuntimeError
+from ckl.functions import Environment, LazySymbol, bind_native
+from ckl.nodes import getPackagedModuleSource
+from ckl.values import ValueBoolean
+
+
+# Packaged modules that are required unqualified or with an import list
+# are not evaluated right away. Their exports are determined from the
+# module manifests (see getManifest) and bound as LazySymbol stubs,
+# which load the module defining the symbol on first access. The
+# exports keep the order and origin the eager evaluation would produce,
+# so the environments look exactly the same. Modules whose manifest is
+# incomplete are loaded eagerly.
+
+LAZY_MODULES = True
+
+SOURCES = dict()
+MANIFESTS = dict()
+NATIVE_NAMES = dict()
+
+
+def getPackagedSource(modulefile):
+    key = modulefile.lower()
+    if key not in SOURCES:
+        SOURCES[key] = getPackagedModuleSource(modulefile)
+    return SOURCES[key]
+
+
+def getPackagedModule(environment, moduleidentifier, modulefile):
+    modulesrc = getPackagedSource(modulefile)
+    if modulesrc is None:
+        return None
+    module = LazyModule(moduleidentifier, modulefile, modulesrc)
+    environment.getModules()[moduleidentifier] = module
+    return module
+
+
+def getModule(base, modulespec):
+    modulefile = modulespec
+    if not modulefile.endswith(".ckl"):
+        modulefile += ".ckl"
+    moduleidentifier = modulespec.split("/")[-1]
+    if moduleidentifier.endswith(".ckl"):
+        moduleidentifier = moduleidentifier[0:-4]
+    modules = base.getModules()
+    if moduleidentifier in modules:
+        return modules[moduleidentifier]
+    return getPackagedModule(base, moduleidentifier, modulefile)
+
+
+def isShareable(base):
+    # a base environment can serve as a template for other interpreters
+    # as long as it does not refer to any loaded module environment
+    return all(
+        isinstance(module, LazyModule)
+        for module in base.getModules().values()
+    )
+
+
+def getNativeNames(native, alias, secure):
+    key = (native, alias, secure)
+    if key not in NATIVE_NAMES:
+        environment = Environment()
+        environment.put(
+            "checkerlang_secure_mode", ValueBoolean.fromval(secure)
+        )
+        bind_native(environment, native, alias)
+        NATIVE_NAMES[key] = [
+            name
+            for name in environment.getLocalSymbols()
+            if name != "checkerlang_secure_mode"
+        ]
+    return NATIVE_NAMES[key]
+
+
+def getExport(base, module, symbol):
+    if isinstance(module, LazyModule):
+        loaded = base.getModules().get(module.moduleidentifier)
+        if not isinstance(loaded, Environment):
+            return LazySymbol(module, symbol)
+        module = loaded
+    return module.get(symbol)
+
+
+class LazyModule:
+    # Describes a packaged module that has not been loaded yet. It is
+    # registered in the modules of a base environment until the module
+    # is loaded, and does not depend on that base environment itself.
+    def __init__(self, moduleidentifier, modulefile, modulesrc):
+        self.moduleidentifier = moduleidentifier
+        self.modulefile = modulefile
+        self.modulesrc = modulesrc
+        self.filename = "mod:" + modulefile[0:-4]
+        self.exports = None
+        self.resolved = False
+        self.resolving = False
+
+    def getManifest(self):
+        key = self.modulefile.lower()
+        if key not in MANIFESTS:
+            MANIFESTS[key] = load_module_manifest(
+                self.modulesrc, self.filename, self.modulefile
+            )
+        return MANIFESTS[key]
+
+    def getExports(self, base):
+        if self.resolved:
+            return self.exports
+        if self.resolving:
+            return None  # circular, the eager load reports it
+        self.resolving = True
+        try:
+            exports = dict()
+            manifest = self.getManifest()
+            if manifest is None or not self.addExports(
+                base, exports, manifest
+            ):
+                exports = None
+        finally:
+            self.resolving = False
+        # exports referring to loaded modules belong to this base
+        # environment only and are not kept
+        if exports is None or all(
+            isinstance(module, LazyModule) for module, _ in exports.values()
+        ):
+            self.exports = exports
+            self.resolved = True
+        return exports
+
+    def addExports(self, base, exports, entries):
+        secure = base.get("checkerlang_secure_mode").value
+        for entry in entries:
+            if entry[0] == "def":
+                exports[entry[1]] = (self, entry[1])
+            elif entry[0] == "native":
+                try:
+                    names = getNativeNames(entry[1], entry[2], secure)
+                except CklRuntimeError:
+                    return False
+                for name in names:
+                    exports[name] = (self, name)
+            elif entry[0] == "secure":
+                if not self.addExports(
+                    base, exports, entry[1] if secure else entry[2]
+                ):
+                    return False
+            elif entry[0] == "require":
+                _, modulespec, isIdentifier, unqualified, symbols = entry
+                if isIdentifier and (
+                    modulespec in exports or base.isDefined(modulespec)
+                ):
+                    return False
+                module = getModule(base, modulespec)
+                if module is None:
+                    return False
+                if isinstance(module, LazyModule):
+                    moduleExports = module.getExports(base)
+                    if moduleExports is None:
+                        return False
+                    items = list(moduleExports.items())
+                else:
+                    items = [
+                        (name, (module, name))
+                        for name in module.getLocalSymbols()
+                    ]
+                for name, origin in items:
+                    if name.startswith("_"):
+                        continue
+                    if unqualified:
+                        exports[name] = origin
+                    elif name in symbols:
+                        exports[symbols[name]] = origin
+            else:
+                return False
+        return True
+
+    def bindExports(self, environment, unqualified, symbols):
+        base = environment.getBase()
+        for name, (module, symbol) in self.getExports(base).items():
+            if name.startswith("_"):
+                continue  # skip private module symbols
+            if unqualified:
+                environment.put(name, getExport(base, module, symbol))
+            elif name in symbols:
+                environment.put(
+                    symbols[name], getExport(base, module, symbol)
+                )
+
+    def getEnvironment(self, base, pos=None):
+        modules = base.getModules()
+        loaded = modules.get(self.moduleidentifier)
+        if isinstance(loaded, Environment):
+            return loaded
+        base.pushModuleStack(self.moduleidentifier, pos)
+        environment = base.newEnv()
+        node = parse_module_cached(
+            self.modulesrc, self.filename, self.modulefile
+        )
+        node.evaluate(environment)
+        modules[self.moduleidentifier] = environment
+        base.popModuleStack()
+        return environment
@@ -1,3 +1,7 @@
+import array
+import re
+import sys
+
 from ckl.errors import CklSyntaxError
 
 KEYWORDS = [
@@ -51,7 +55,135 @@ OPERATORS = [
 ]
 
 
+KEYWORD_SET = frozenset(KEYWORDS)
+
+# the lexer scans LEXER_LOOKAHEAD tokens ahead at a time and drops
+# consumed tokens once more than LEXER_WINDOW of them accumulated
+LEXER_LOOKAHEAD = 64
+LEXER_WINDOW = 1024
+LEXER_KEEP = 8
+
+TOKEN_TYPES = [
+    "identifier",
+    "keyword",
+    "boolean",
+    "int",
+    "decimal",
+    "string",
+    "pattern",
+    "operator",
+    "interpunction",
+]
+TYPE_CODES = {tokentype: code for code, tokentype in enumerate(TOKEN_TYPES)}
+(
+    IDENTIFIER,
+    KEYWORD,
+    BOOLEAN,
+    INT,
+    DECIMAL,
+    STRING,
+    PATTERN,
+    OPERATOR,
+    INTERPUNCTION,
+) = range(len(TOKEN_TYPES))
+
+# Operators and interpunction with the offset of the character that ends
+# them and the column adjustment of their source position, see scan
+FIXED_TOKENS = {
+    "(": ("interpunction", 0, 0),
+    ")": ("interpunction", 0, 0),
+    "[": ("interpunction", 0, 0),
+    "]": ("interpunction", 0, 0),
+    ",": ("interpunction", 0, 0),
+    ";": ("interpunction", 0, 0),
+    "+": ("operator", 1, 0),
+    "-": ("operator", 1, 0),
+    "*": ("operator", 1, 0),
+    "%": ("operator", 1, 0),
+    "+=": ("operator", 1, 0),
+    "-=": ("operator", 1, 0),
+    "*=": ("operator", 1, 0),
+    "%=": ("operator", 1, 0),
+    "->": ("operator", 1, 0),
+    "*>": ("interpunction", 1, 0),
+    "/": ("operator", 1, -1),
+    "/=": ("operator", 1, -1),
+    "<": ("operator", 1, -1),
+    ">": ("operator", 1, -1),
+    "=": ("operator", 1, -1),
+    "!": ("operator", 1, -1),
+    "<=": ("operator", 1, -3),
+    ">=": ("operator", 1, -3),
+    "==": ("operator", 1, -3),
+    "!=": ("operator", 1, -3),
+    "!>": ("operator", 1, -3),
+    "<>": ("operator", 1, -1),
+    "=>": ("interpunction", 1, -3),
+    "<*": ("interpunction", 1, -1),
+    "<<": ("interpunction", 2, -2),
+    ">>": ("interpunction", 2, -2),
+    "<<<": ("interpunction", 2, -3),
+    ">>>": ("interpunction", 2, -3),
+    "...": ("interpunction", 2, -3),
+}
+FIXED_CODES = {
+    token: (token, TYPE_CODES[tokentype], delta, offset)
+    for token, (tokentype, delta, offset) in FIXED_TOKENS.items()
+}
+
+NUMBER_END = r"(?=[()\[\]<>=! \t\n\r+\-*/%,;#]|\Z)"
+# a number that is not properly terminated continues as a name
+NUMBER_REST = r"[^()\[\]<>=! \t\n\r+\-*/%,;#][^()+\-*/%\[\]<>=,;!\"' \t\r\n#]*"
+
+MASTER = re.compile(
+    "|".join(
+        [
+            r"(?P<space>[ \t\r\n]+)",
+            r"(?P<comment>#[^\n]*\n?)",
+            r"(?P<pattern>/(?=/)(?s:.*?)//)",
+            r"(?P<unterminated>//)",
+            "(?P<fixed>"
+            + "|".join(
+                re.escape(token)
+                for token in sorted(FIXED_TOKENS, key=len, reverse=True)
+            )
+            + ")",
+            r"(?P<string>\"(?:[^\"\\]|\\[^x]|\\x[\s\S]{2})*\"|"
+            r"'(?:[^'\\]|\\[^x]|\\x[\s\S]{2})*')",
+            r"(?P<quote>[\"'])",
+            r"0x(?P<hex>[0-9a-fA-F_]*)" + NUMBER_END,
+            r"0b(?P<binary>[01_]*)" + NUMBER_END,
+            r"0[xb](?P<dots>\.\.\.)",
+            r"0x(?P<hexname>[0-9a-fA-F_]*" + NUMBER_REST + ")",
+            r"0b(?P<binaryname>[01_]*" + NUMBER_REST + ")",
+            r"(?P<number>[0-9][0-9_]*(?:\.[0-9_]*)?)" + NUMBER_END,
+            r"(?P<numbername>[0-9][0-9_]*(?:\.[0-9_]*)?" + NUMBER_REST + ")",
+            r"(?P<name>[^()+\-*/%\[\]<>=,;!\"' \t\r\n#]+)",
+        ]
+    )
+)
+ESCAPE = re.compile(r"\\(x[\s\S]{2}|[\s\S])")
+ESCAPES = {"n": "\n", "r": "\r", "t": "\t"}
+
+
+def unescape(match):
+    escape = match.group(1)
+    if escape[0] == "x":
+        return chr(int(escape[1:], 16))
+    return ESCAPES.get(escape, escape)
+
+
+def checkEscapes(script, start):
+    # the escapes of an unterminated string are not decoded, but a bad
+    # hex escape fails like in a terminated string unless it is cut off
+    for match in ESCAPE.finditer(script + " ", start):
+        if match.group(1) != "x":
+            unescape(match)
+
+
 class SourcePos:
+    __slots__ = ("filename", "line", "column")
+
     def __init__(self, filename, line, column):
         self.filename = filename
         self.line = line
@@ -69,6 +201,8 @@ class SourcePos:
 
 
 class Token:
+    __slots__ = ("value", "type", "pos")
+
     def __init__(self, value, tokentype, pos):
         self.value = value
         self.type = tokentype
@@ -85,25 +219,70 @@ class Token:
 
 
 class Lexer:
+    # Tokens are scanned on demand while the parser consumes them and are
+    # kept in a window of parallel arrays: the token values, their type
+    # codes (see TOKEN_TYPES) and their lines and columns. Tokens are
+    # addressed by their absolute number, first is the number of the
+    # oldest token still in the window. Consumed tokens are dropped from
+    # the window, so its size depends on the lookahead of the parser and
+    # not on the size of the script. Token and SourcePos objects are only
+    # created when the parser asks for them.
     def __init__(self, script, name):
-        self.script = script + " "
+        self.script = script
         self.name = name
-        self.tokens = []
+        self.values = []
+        self.types = bytearray()
+        self.lines = array.array("l")
+        self.columns = array.array("l")
+        self.positions = dict()
+        self.first = 0
+        self.count = 0
+        self.nextToken = 0
+        self.matches = None
 
     @classmethod
     def init(cls, script, name="-"):
         return Lexer(script, name).scan()
 
+    @property
+    def tokens(self):
+        while self.fill(self.count):
+            pass
+        return [self.getToken(k) for k in range(self.first, self.count)]
+
+    def getToken(self, k):
+        pos = self.positions.get(k) or self.getPosAt(k)
+        return Token(
+            self.values[k - self.first],
+            TOKEN_TYPES[self.types[k - self.first]],
+            pos,
+        )
+
+    def getPosAt(self, k):
+        pos = self.positions.get(k)
+        if pos is None:
+            pos = SourcePos(
+                self.name,
+                self.lines[k - self.first],
+                self.columns[k - self.first],
+            )
+            self.positions[k] = pos
+        return pos
+
     def hasNext(self):
-        return self.nextToken < len(self.tokens)
+        return self.nextToken < self.count or self.fill(self.nextToken)
 
     def next(self):
-        result = self.tokens[self.nextToken]
+        if self.nextToken >= self.count:
+            self.fill(self.nextToken)
+        result = self.getToken(self.nextToken)
         self.nextToken += 1
         return result
 
     def peek(self):
-        return self.tokens[self.nextToken]
+        if self.nextToken >= self.count:
+            self.fill(self.nextToken)
+        return self.getToken(self.nextToken)
 
     def eat(self, n):
         self.nextToken += n
@@ -116,22 +295,24 @@ class Lexer:
     def getPos(self):
         if self.nextToken == 0:
             return self.getPosNext()
-        return self.tokens[self.nextToken - 1].pos
+        return self.positions.get(self.nextToken - 1) or self.getPosAt(
+            self.nextToken - 1
+        )
 
     def getPosNext(self):
         if not self.hasNext():
             return self.getPos()
-        return self.tokens[self.nextToken].pos
+        return self.getPosAt(self.nextToken)
 
     def peekn(self, n, token, tokentype=None):
-        if self.nextToken + n - 1 < len(self.tokens):
-            t = self.tokens[self.nextToken + n - 1]
+        k = self.nextToken + n - 1
+        if k >= self.count and not self.fill(k):
+            return False
+        k -= self.first
+        if self.values[k] == token:
             if tokentype is None:
-                return t.value == token and (
-                    t.type == "identifier" or t.type == "keyword"
-                )
-            else:
-                return t.value == token and t.type == tokentype
+                return self.types[k] <= KEYWORD
+            return self.types[k] == TYPE_CODES.get(tokentype)
         return False
 
     def peekOne(self, n, tokens, tokentype=None):
@@ -154,370 +335,175 @@ class Lexer:
             return True
         else:
             if self.peekn(1, token, tokentype):
-                self.eat(1)
+                self.nextToken += 1
                 return True
             return False
 
     def match(self, token, tokentype):
         if not self.hasNext():
             raise CklSyntaxError("Unexpected end of input", self.getPos())
-        t = self.next()
-        if t.value != token or t.type != tokentype:
+        k = self.nextToken - self.first
+        if self.values[k] != token or TOKEN_TYPES[self.types[k]] != tokentype:
+            t = self.next()
             raise CklSyntaxError(f"Expected {token} but got {t}", t.pos)
+        self.nextToken += 1
 
     def matchIdentifier(self):
         if not self.hasNext():
             raise CklSyntaxError("Unexpected end of input", self.getPos())
-        t = self.next()
-        if t.type != "identifier":
+        k = self.nextToken - self.first
+        if self.types[k] != IDENTIFIER:
+            t = self.next()
             raise CklSyntaxError(f"Expected identifier but got {t}", t.pos)
-        return t.value
+        self.nextToken += 1
+        return self.values[k]
 
     def scan(self):
-        self.tokens = []
+        self.values = []
+        self.types = bytearray()
+        self.lines = array.array("l")
+        self.columns = array.array("l")
+        self.positions = dict()
+        self.first = 0
+        self.count = 0
         self.nextToken = 0
+        self.matches = MASTER.finditer(self.script)
+        self.line = 1
+        self.linestart = -1
+        self.mark = 0
+        return self
 
-        fname = self.name
-
-        tempbuf = ""
-        token = ""
-        state = 0
-        pos = 0
-        line = 1
-        column = 0
-        updatepos = True
-        while pos < len(self.script):
-            ch = self.script[pos]
-            pos += 1
-            if updatepos:
-                if ch == "\n":
-                    line += 1
-                    column = 0
-                else:
-                    column += 1
-            updatepos = True
-
-            if state == 0:  # Eat whitespace
-                if ch == "#":
-                    state = 9
-                elif ch in "+-*%":
-                    token += ch
-                    state = 10
-                elif ch in "()[],;":
-                    here = SourcePos(fname, line, column)
-                    self.tokens.append(Token(ch, "interpunction", here))
-                elif ch == "/":
-                    state = 5
-                elif ch in "<>=!":
-                    token += ch
-                    state = 2
-                elif ch == '"':
-                    state = 3
-                elif ch == "'":
-                    state = 4
-                elif ch == "0":
-                    state = 70
-                elif ch in "0123456789":
-                    token += ch
-                    state = 7
-                elif ch not in " \t\r\n":
-                    token += ch
-                    state = 1
-
-            elif state == 1:  # normal token
-                if ch in "()+-*/%[]<>=,;!\"' \t\r\n#":
-                    if token == "TRUE":
-                        here = SourcePos(fname, line, column - len("TRUE"))
-                        self.tokens.append(Token("TRUE", "boolean", here))
-                        token = ""
-                    elif token == "FALSE":
-                        here = SourcePos(fname, line, column - len("TRUE"))
-                        self.tokens.append(Token("FALSE", "boolean", here))
-                        token = ""
-                    elif token in KEYWORDS:
-                        here = SourcePos(fname, line, column - len(token))
-                        self.tokens.append(Token(token, "keyword", here))
-                        token = ""
-                    elif token:
-                        here = SourcePos(fname, line, column - len(token))
-                        self.tokens.append(Token(token, "identifier", here))
-                        token = ""
-                    pos -= 1
-                    updatepos = False
-                    state = 0
-                else:
-                    token += ch
-                    if token == "...":
-                        here = SourcePos(fname, line, column - len(token))
-                        self.tokens.append(Token(token, "interpunction", here))
-                        token = ""
-                        state = 0
-
-            elif state == 2:  # <>, <=, >=, ==, <<, >>, <<<, >>>, !>, <*, *>
-                if ch == "=":
-                    token += ch
-                    here = SourcePos(fname, line, column - len(token) - 1)
-                    self.tokens.append(Token(token, "operator", here))
-                    token = ""
-                    state = 0
-                elif ch == ">" and token == "=":
-                    token += ch
-                    here = SourcePos(fname, line, column - len(token) - 1)
-                    self.tokens.append(Token(token, "interpunction", here))
-                    token = ""
-                    state = 0
-                elif ch == ">" and token == "<":
-                    here = SourcePos(fname, line, column - 1)
-                    self.tokens.append(Token("<>", "operator", here))
-                    token = ""
-                    state = 0
-                elif ch == "<" and token == "<":
-                    token += ch
-                    state = 21
-                elif ch == ">" and token == ">":
-                    token += ch
-                    state = 21
-                elif ch == ">" and token == "!":
-                    token += ch
-                    here = SourcePos(fname, line, column - len(token) - 1)
-                    self.tokens.append(Token("!>", "operator", here))
-                    token = ""
-                    state = 0
-                elif ch == "*" and token == "<":
-                    here = SourcePos(fname, line, column - 1)
-                    self.tokens.append(Token("<*", "interpunction", here))
-                    token = ""
-                    state = 0
-                else:
-                    here = SourcePos(fname, line, column - len(token))
-                    self.tokens.append(Token(token, "operator", here))
-                    token = ""
-                    pos -= 1
-                    updatepos = False
-                    state = 0
-
-            elif state == 21:  # <<, >>, <<<, >>>
-                if ch == "<" and token == "<<":
-                    here = SourcePos(fname, line, column - 3)
-                    self.tokens.append(Token("<<<", "interpunction", here))
-                    token = ""
-                    state = 0
-                elif ch == ">" and token == ">>":
-                    here = SourcePos(fname, line, column - 3)
-                    self.tokens.append(Token(">>>", "interpunction", here))
-                    token = ""
-                    state = 0
-                else:
-                    here = SourcePos(fname, line, column - len(token))
-                    self.tokens.append(Token(token, "interpunction", here))
-                    token = ""
-                    pos -= 1
-                    updatepos = False
-                    state = 0
-
-            elif state == 3:  # double quotes
-                if ch == '"':
-                    here = SourcePos(fname, line, column - len(token) - 2 + 1)
-                    self.tokens.append(Token(token, "string", here))
-                    token = ""
-                    state = 0
-                elif ch == "\\":
-                    state = 31
-                else:
-                    token += ch
-
-            elif state == 31:  # double quotes escapes
-                if ch == "n":
-                    token += "\n"
-                    state = 3
-                elif ch == "r":
-                    token += "\r"
-                    state = 3
-                elif ch == "t":
-                    token += "\t"
-                    state = 3
-                elif ch == "x":
-                    state = 311
-                else:
-                    token += ch
-                    state = 3
-
-            elif state == 311:  # hex num first digit
-                tempbuf = ch
-                state = 312
-
-            elif state == 312:  # hex num second digit
-                tempbuf += ch
-                token += chr(int(tempbuf, 16))
-                tempbuf = ""
-                state = 3
-
-            elif state == 4:  # single quote
-                if ch == "'":
-                    here = SourcePos(fname, line, column - len(token) - 2 + 1)
-                    self.tokens.append(Token(token, "string", here))
-                    token = ""
-                    state = 0
-                elif ch == "\\":
-                    state = 41
-                else:
-                    token += ch
-
-            elif state == 41:  # single quotes escapes
-                if ch == "n":
-                    token += "\n"
-                    state = 4
-                elif ch == "r":
-                    token += "\r"
-                    state = 4
-                elif ch == "t":
-                    token += "\t"
-                    state = 4
-                elif ch == "x":
-                    state = 411
-                else:
-                    token += ch
-                    state = 4
-
-            elif state == 411:  # hex num first digit
-                tempbuf = ch
-                state = 412
-
-            elif state == 412:  # hex num second digit
-                tempbuf += ch
-                token += chr(int(tempbuf, 16))
-                tempbuf = ""
-                state = 4
-
-            elif state == 5:  # check for pattern
-                if ch == "/":
-                    token += "//"
-                    state = 6
-                elif ch == "=":
-                    here = SourcePos(fname, line, column - 1)
-                    self.tokens.append(Token("/=", "operator", here))
-                    state = 0
-                else:
-                    here = SourcePos(fname, line, column - 1)
-                    self.tokens.append(Token("/", "operator", here))
-                    pos -= 1
-                    updatepos = False
-                    state = 0
-
-            elif state == 6:  # pattern
-                token += ch
-                if token.endswith("//"):
-                    here = SourcePos(fname, line, column - len(token) - 4 + 1)
-                    self.tokens.append(Token(token, "pattern", here))
-                    token = ""
-                    state = 0
-
-            elif state == 7:  # int or decimal
-                if ch == ".":
-                    token += ch
-                    state = 8
-                elif ch in "0123456789_":
-                    token += ch
-                elif ch in "()[]<>=! \t\n\r+-*/%,;#":
-                    here = SourcePos(fname, line, column - len(token))
-                    token = token.replace("_", "")
-                    self.tokens.append(Token(token, "int", here))
-                    token = ""
-                    pos -= 1
-                    updatepos = False
-                    state = 0
-                else:
-                    token += ch
-                    state = 1
-
-            elif state == 70:  # int, decimal or hex/binary int literal
-                if ch == "x":
-                    state = 71
-                    # hex int literal
-                elif ch == "b":
-                    state = 72
-                    # binary int literal
-                else:
-                    token += "0"
-                    pos -= 1
-                    updatepos = False
-                    state = 7
-
-            elif state == 71:  # hex int literal
-                if ch in "0123456789abcdefABCDEF_":
-                    token += ch
-                elif ch in "()[]<>=! \t\n\r+-*/%,;#":
-                    here = SourcePos(fname, line, column - len(token))
-                    token = str(int(token.replace("_", ""), 16))
-                    self.tokens.append(Token(token, "int", here))
-                    token = ""
-                    pos -= 1
-                    updatepos = False
-                    state = 0
-                else:
-                    token += ch
-                    state = 1
-
-            elif state == 72:  # binary int literal
-                if ch in "01_":
-                    token += ch
-                elif ch in "()[]<>=! \t\n\r+-*/%,;#":
-                    here = SourcePos(fname, line, column - len(token))
-                    self.tokens.append(
-                        Token(str(int(token.replace("_", ""), 2)), "int", here)
-                    )
-                    token = ""
-                    pos -= 1
-                    updatepos = False
-                    state = 0
+    def trim(self):
+        # drops the consumed tokens from the window, keeping a few of
+        # them for previous and getPos
+        drop = self.nextToken - LEXER_KEEP - self.first
+        if drop <= 0:
+            return
+        del self.values[:drop]
+        del self.types[:drop]
+        del self.lines[:drop]
+        del self.columns[:drop]
+        self.first += drop
+        first = self.first
+        self.positions = {
+            k: pos for k, pos in self.positions.items() if k >= first
+        }
+
+    def fill(self, k):
+        # scans ahead until token k is in the window, returns False if
+        # the script ends before that
+        if self.matches is None:
+            return False
+        if self.nextToken - self.first > LEXER_WINDOW:
+            self.trim()
+
+        # The tokens are matched with a single regular expression. Their
+        # source positions follow the rules of the original character at
+        # a time scanner: each token is placed relative to the character
+        # that ended it, given by index and a column offset.
+        addValue = self.values.append
+        addType = self.types.append
+        addLine = self.lines.append
+        addColumn = self.columns.append
+        intern = sys.intern
+        script = self.script
+        count = script.count
+        line = self.line
+        linestart = self.linestart
+        mark = self.mark
+        last = max(k, self.nextToken + LEXER_LOOKAHEAD)
+        scanned = self.count
+        for match in self.matches:
+            kind = match.lastgroup
+            if kind == "name":
+                token = intern(match.group())
+                index = match.end()
+                if token in KEYWORD_SET:
+                    tokentype = KEYWORD
+                    offset = -len(token)
+                elif token == "TRUE" or token == "FALSE":
+                    tokentype = BOOLEAN
+                    offset = -4
                 else:
-                    token += ch
-                    state = 1
-
-            elif state == 8:  # decimal
-                if ch in "0123456789_":
-                    token += ch
-                elif ch in "()[]<>=! \t\n\r+-*/%,;#":
-                    here = SourcePos(fname, line, column - len(token))
+                    tokentype = IDENTIFIER
+                    offset = -len(token)
+            elif kind == "space":
+                continue
+            elif kind == "fixed":
+                token, tokentype, delta, offset = FIXED_CODES[match.group()]
+                index = match.start() + delta
+            elif kind == "string":
+                token = match.group()[1:-1]
+                if "\\" in token:
+                    token = ESCAPE.sub(unescape, token)
+                tokentype = STRING
+                index = match.end() - 1
+                offset = -len(token) - 1
+            elif kind == "number":
+                token = match.group()
+                tokentype = DECIMAL if "." in token else INT
+                index = match.end()
+                offset = -len(token)
+                if "_" in token:
                     token = token.replace("_", "")
-                    self.tokens.append(Token(token, "decimal", here))
-                    token = ""
-                    pos -= 1
-                    updatepos = False
-                    state = 0
-                else:
-                    token += ch
-                    state = 1
-
-            elif state == 9:  # comment
-                if ch == "\n":
-                    state = 0
-
-            elif state == 10:  # potentially composite assign or -> or *>
-                if ch == "=":
-                    token += ch
-                    here = SourcePos(fname, line, column)
-                    self.tokens.append(Token(token, "operator", here))
-                    token = ""
-                    state = 0
-                elif token == "-" and ch == ">":
-                    here = SourcePos(fname, line, column)
-                    self.tokens.append(Token("->", "operator", here))
-                    token = ""
-                    state = 0
-                elif token == "*" and ch == ">":
-                    here = SourcePos(fname, line, column)
-                    self.tokens.append(Token("*>", "interpunction", here))
-                    token = ""
-                    state = 0
+            elif kind == "comment":
+                continue
+            elif kind == "hex" or kind == "binary":
+                digits = match.group(kind)
+                value = int(
+                    digits.replace("_", ""), 16 if kind == "hex" else 2
+                )
+                token = str(value)
+                tokentype = INT
+                index = match.end()
+                offset = -len(digits)
+            elif kind == "pattern":
+                token = match.group()
+                tokentype = PATTERN
+                index = match.end() - 1
+                offset = -len(token) - 3
+            elif kind == "quote":  # unterminated string
+                checkEscapes(script, match.end())
+                break
+            elif kind == "unterminated":  # pattern
+                break
+            elif kind == "dots":
+                token = "..."
+                tokentype = INTERPUNCTION
+                index = match.end() - 1
+                offset = -3
+            else:  # number continued as name
+                token = intern(match.group(kind))
+                index = match.end()
+                if token == "TRUE" or token == "FALSE":
+                    tokentype = BOOLEAN
+                    offset = -4
                 else:
-                    here = SourcePos(fname, line, column)
-                    self.tokens.append(Token(token, "operator", here))
-                    token = ""
-                    pos -= 1
-                    updatepos = False
-                    state = 0
-        return self
+                    if token in KEYWORD_SET:
+                        tokentype = KEYWORD
+                    else:
+                        tokentype = IDENTIFIER
+                    offset = -len(token)
+            if index >= mark:
+                newlines = count("\n", mark, index + 1)
+                if newlines:
+                    line += newlines
+                    linestart = script.rfind("\n", mark, index + 1)
+                mark = index + 1
+            addValue(token)
+            addType(tokentype)
+            addLine(line)
+            addColumn(index - linestart + offset)
+            scanned += 1
+            if scanned > last:
+                self.count = scanned
+                self.line = line
+                self.linestart = linestart
+                self.mark = mark
+                return True
+        self.count = scanned
+        self.matches = None
+        return k < scanned
 
     def __repr__(self):
         result = "[" + ", ".join([str(s) for s in self.tokens]) + "]"
@@ -1,3 +1,4 @@
+import itertools
 import os
 import pkgutil
 
@@ -9,6 +10,7 @@ from ckl.values import (
     ValueControlBreak,
     ValueControlContinue,
     ValueControlReturn,
+    ValueControlTailCall,
     ValueList,
     ValueMap,
     ValueObject,
@@ -32,16 +34,18 @@ def convertEntries(entries):
 
 def getCollectionValue(collection, what):
     if collection.isList():
-        return collection.value
+        return collection.getItems()
+    elif collection.isSequence():
+        return list(collection.iterate())
     elif collection.isSet():
         return collection.getSortedItems()
     elif collection.isMap() and what == "keys":
-        return sorted(collection.value.keys())
+        return collection.getSortedKeys()
     elif collection.isMap() and what == "values":
         return sorted(collection.value.values())
     elif collection.isMap():
         return convertEntries({k: collection.value[k]
-                               for k in sorted(collection.value.keys())})
+                               for k in collection.getSortedKeys()})
     elif collection.isObject() and what == "values":
         return collection.value.values()
     elif collection.isObject() and what == "entries":
@@ -54,6 +58,100 @@ def getCollectionValue(collection, what):
         return None
 
 
+def getUnorderedCollectionValue(collection, what):
+    # like getCollectionValue, for consumers that do not depend on the
+    # order of the values, so sets and maps need not be sorted
+    if collection.isSet():
+        return list(collection.value)
+    elif collection.isMap() and what == "keys":
+        return list(collection.value.keys())
+    elif collection.isMap() and what == "values":
+        return list(collection.value.values())
+    elif collection.isMap():
+        return convertEntries(collection.value)
+    return getCollectionValue(collection, what)
+
+
+# The comprehensions bind the identifiers of each row in a single local
+# environment by iterating one of the bind generators below, and pass
+# them to comprehend. The condition of a row is evaluated before its
+# value, so rows that are discarded are never projected.
+
+def bindValues(environment, identifier, values):
+    put = environment.put
+    for value in values:
+        put(identifier, value)
+        yield
+
+
+def bindParallel(environment, identifier1, values1, identifier2, values2,
+                 fill):
+    put = environment.put
+    for value1, value2 in itertools.zip_longest(
+        values1, values2, fillvalue=fill
+    ):
+        put(identifier1, value1)
+        put(identifier2, value2)
+        yield
+
+
+def bindProduct(environment, identifier1, values1, identifier2, values2):
+    put = environment.put
+    for value1 in values1:
+        put(identifier1, value1)
+        for value2 in values2:
+            put(identifier2, value2)
+            yield
+
+
+def comprehend(rows, environment, project, conditionExpr, pos):
+    if conditionExpr is None:
+        return [project(environment) for _ in rows]
+    condition = conditionExpr.evaluate
+    result = []
+    for _ in rows:
+        value = condition(environment)
+        if value.__class__ is not ValueBoolean:
+            raise CklRuntimeError(
+                ValueString("ERROR"),
+                f"Condition must be boolean but got {value.type()}",
+                pos,
+            )
+        if value.value:
+            result.append(project(environment))
+    return result
+
+
+def copyConstant(value):
+    # strings can be changed in place, so like collections they are
+    # copied, numbers are copied by def when it attaches its info
+    if isinstance(value, ValueString):
+        return ValueString(value.value)
+    if isinstance(value, ValueList):
+        result = ValueList()
+        result.value = [copyConstant(item) for item in value.value]
+        return result
+    if isinstance(value, ValueSet):
+        result = ValueSet()
+        result.value = set(copyConstant(item) for item in value.value)
+        return result
+    if isinstance(value, ValueMap):
+        result = ValueMap()
+        result.value = {
+            key: copyConstant(item) for key, item in value.value.items()
+        }
+        return result
+    return value
+
+
+def isAccumulation(identifier, expression):
+    return (
+        type(expression) is NodeBinaryOp
+        and type(expression.a) is NodeIdentifier
+        and expression.a.value == identifier
+    )
+
+
 def getFuncallString(fn, args):
     return f"{fn.name}({args.toStringAbbrev()})"
 
@@ -79,6 +177,10 @@ def invoke(fn, names_, args, environment, pos):
         else:
             values.append(arg.evaluate(environment))
             names.append(names_[i])
+    return invokeValues(fn, names, values, environment, pos)
+
+
+def invokeValues(fn, names, values, environment, pos):
     args_ = Args(pos)
     args_.addArgs(fn.getArgNames())
     args_.setArgs(names, values)
@@ -90,6 +192,413 @@ def invoke(fn, names_, args, environment, pos):
         raise
 
 
+class BindingPlan:
+    # Records how Args.setArgs distributes the arguments of a call site
+    # onto the parameters of a callee, by running it once on the
+    # argument indices. Calls with the same names and parameters then
+    # bind their values directly.
+    def __init__(self, names, argNames):
+        self.names = list(names)
+        self.argNames = list(argNames)
+        args_ = Args(None)
+        args_.addArgs(argNames)
+        try:
+            args_.setArgs(names, list(range(len(names))))
+        except CklRuntimeError:
+            self.bindings = None
+            return
+        self.positionalNames = args_.argNames
+        self.restArgName = args_.restArgName
+        self.bindings = [
+            (name, index)
+            for name, index in args_.args.items()
+            if name != self.restArgName
+        ]
+        if self.restArgName:
+            self.rest = args_.args[self.restArgName].value
+
+    def matches(self, names, argNames):
+        return self.names == names and self.argNames == argNames
+
+    def bind(self, values, pos):
+        args_ = Args(pos)
+        args_.argNames = self.positionalNames
+        args_.restArgName = self.restArgName
+        args_.args = {name: values[index] for name, index in self.bindings}
+        if self.restArgName:
+            rest = ValueList()
+            rest.value = [values[index] for index in self.rest]
+            args_.args[self.restArgName] = rest
+        return args_
+
+    def invoke(self, fn, values, environment, pos):
+        if self.bindings is None:
+            return invokeValues(fn, self.names, values, environment, pos)
+        args_ = self.bind(values, pos)
+
+        try:
+            return fn.execute(args_, environment, pos)
+        except CklRuntimeError as e:
+            e.stacktrace.append(getFuncallString(fn, args_) + " " + str(pos))
+            raise
+
+
+def getBindingPlan(plan, names, fn):
+    argNames = fn.getArgNames()
+    if plan is None or not plan.matches(names, argNames):
+        return BindingPlan(names, argNames)
+    return plan
+
+
+def markTailCalls(node):
+    # Marks the calls whose value is returned from a lambda body. These
+    # are not executed by the call node but handed to the executing
+    # FuncLambda, see ValueControlTailCall. Blocks with catch or finally
+    # are not looked into, their calls have to complete within them.
+    if isinstance(node, NodeFuncall):
+        node.tail = True
+    elif isinstance(node, NodeBlock):
+        if not node.catchexprs and not node.finallyexprs:
+            for expression in node.expressions[:-1]:
+                markReturnedCalls(expression)
+            if node.expressions:
+                markTailCalls(node.expressions[-1])
+    elif isinstance(node, NodeIf):
+        for expression in node.expressions:
+            markTailCalls(expression)
+        markTailCalls(node.elseExpression)
+    elif isinstance(node, NodeReturn):
+        if node.expression:
+            markTailCalls(node.expression)
+
+
+def markReturnedCalls(node):
+    # marks the calls of return statements that are not in tail position
+    if isinstance(node, NodeBlock):
+        if not node.catchexprs and not node.finallyexprs:
+            for expression in node.expressions:
+                markReturnedCalls(expression)
+    elif isinstance(node, NodeIf):
+        for expression in node.expressions:
+            markReturnedCalls(expression)
+        markReturnedCalls(node.elseExpression)
+    elif isinstance(node, (NodeFor, NodeWhile)):
+        markReturnedCalls(node.block)
+    elif isinstance(node, NodeReturn):
+        markTailCalls(node)
+
+
+def markAccumulations(body, args):
+    # Marks the accumulations x = x op b of a lambda body or script which
+    # may change the list in x in place, see NodeAssign.accumulateValue.
+    # This needs a proof that no one else holds the list: x is defined by
+    # a statement of the body before any other use, every def of x
+    # creates a new list and x is not a parameter. Up to the last
+    # statement accumulating into x, x is otherwise only indexed, tested
+    # with in or the value of the body, and nested lambdas do not see it.
+    # Code run by eval or run is not visible here, so it marks the
+    # environments it can see, see Environment.markEvaluated.
+    if not isinstance(body, NodeBlock):
+        return
+    if body.catchexprs or body.finallyexprs:
+        return
+    accumulations = dict()
+    last = dict()
+    defined = set()
+    mentioned = set()
+    for i, expression in enumerate(body.expressions):
+        if isinstance(expression, NodeDef):
+            if expression.identifier not in mentioned:
+                defined.add(expression.identifier)
+        collectMentions(expression, mentioned)
+        found = dict()
+        collectAccumulations(expression, found)
+        for name, nodes in found.items():
+            accumulations.setdefault(name, []).extend(nodes)
+            last[name] = i
+    names = defined.intersection(accumulations).difference(args)
+    for i, expression in enumerate(body.expressions):
+        check = AccumulationCheck({name for name in names if last[name] >= i})
+        if i == len(body.expressions) - 1:
+            check.walk(expression, AccumulationCheck.RESULT, False, False)
+        else:
+            check.walk(expression, AccumulationCheck.DISCARDED, False, False)
+        names.difference_update(check.shared)
+    for name in names:
+        for node in accumulations[name]:
+            node.accumulate = True
+
+
+def collectAccumulations(node, accumulations):
+    if isinstance(node, NodeAssign):
+        if isAccumulation(node.identifier, node.expression):
+            accumulations.setdefault(node.identifier, []).append(node)
+    if not isinstance(node, NodeLambda):
+        for child in getChildNodes(node):
+            collectAccumulations(child, accumulations)
+
+
+def collectMentions(node, mentioned):
+    if isinstance(node, NodeIdentifier):
+        mentioned.add(node.value)
+    elif isinstance(node, (NodeAssign, NodeDef)):
+        mentioned.add(node.identifier)
+    for child in getChildNodes(node):
+        collectMentions(child, mentioned)
+
+
+def getChildNodes(node):
+    for value in vars(node).values():
+        yield from getNodes(value)
+
+
+def getNodes(value):
+    if isinstance(value, (list, tuple)):
+        for item in value:
+            yield from getNodes(item)
+    elif type(value).__module__ == __name__ and hasattr(value, "evaluate"):
+        yield value
+
+
+def isFreshList(node):
+    return isinstance(
+        node,
+        (
+            NodeList,
+            NodeListComprehension,
+            NodeListComprehensionParallel,
+            NodeListComprehensionProduct,
+        ),
+    )
+
+
+class AccumulationCheck:
+    # Walks a body and collects the names of variables whose list may be
+    # shared. The state tells what happens to the value of a node: it is
+    # discarded, it is the value of the body, which ends the frame, or it
+    # is used, e.g. stored or passed to a function.
+    DISCARDED = 0
+    RESULT = 1
+    USED = 2
+
+    def __init__(self, names):
+        self.names = names
+        self.shared = set()
+
+    def walk(self, node, state, nested, guarded):
+        if node is None:
+            return
+        if isinstance(node, NodeIdentifier):
+            if node.value in self.names and (nested or state != self.RESULT):
+                self.shared.add(node.value)
+        elif (
+            isinstance(node, NodeAssign)
+            and node.identifier in self.names
+            and isAccumulation(node.identifier, node.expression)
+        ):
+            if nested or state == self.USED:
+                self.shared.add(node.identifier)
+            self.walk(node.expression.func, self.USED, nested, guarded)
+            self.walk(node.expression.b, self.USED, nested, guarded)
+        elif isinstance(node, NodeDef) and node.identifier in self.names:
+            if (
+                nested
+                or state == self.USED
+                or not isFreshList(node.expression)
+            ):
+                self.shared.add(node.identifier)
+            self.walk(node.expression, self.USED, nested, guarded)
+        elif isinstance(node, NodeDeref) and self.isName(node.expression):
+            self.walk(node.index, self.USED, nested, guarded)
+            self.walk(node.default_value, self.USED, nested, guarded)
+        elif isinstance(node, NodeIn) and self.isName(node.list):
+            self.walk(node.expression, self.USED, nested, guarded)
+        elif isinstance(node, NodeBlock):
+            if node.catchexprs or node.finallyexprs:
+                state = self.USED
+                guarded = True
+            for expression in node.expressions[:-1]:
+                self.walk(expression, self.DISCARDED, nested, guarded)
+            if node.expressions:
+                self.walk(node.expressions[-1], state, nested, guarded)
+            for child in getNodes([node.catchexprs, node.finallyexprs]):
+                self.walk(child, self.USED, nested, guarded)
+            self.checkNames(node.catchexprs)
+        elif isinstance(node, (NodeFor, NodeWhile)):
+            if isinstance(node, NodeFor):
+                self.checkNames(node.identifiers)
+            self.walk(node.expression, self.USED, nested, guarded)
+            self.walk(node.block, state, nested, guarded)
+        elif isinstance(node, NodeIf):
+            for condition in node.conditions:
+                self.walk(condition, self.USED, nested, guarded)
+            for expression in node.expressions:
+                self.walk(expression, state, nested, guarded)
+            self.walk(node.elseExpression, state, nested, guarded)
+        elif isinstance(node, NodeReturn):
+            state = self.USED if nested or guarded else self.RESULT
+            self.walk(node.expression, state, nested, guarded)
+        else:
+            # anything else may keep the value, and may bind the names
+            nested = nested or isinstance(node, NodeLambda)
+            self.checkNames(list(vars(node).values()))
+            for child in getChildNodes(node):
+                self.walk(child, self.USED, nested, guarded)
+
+    def isName(self, node):
+        return isinstance(node, NodeIdentifier) and node.value in self.names
+
+    def checkNames(self, value):
+        if isinstance(value, (list, tuple)):
+            for item in value:
+                self.checkNames(item)
+        elif isinstance(value, str) and value in self.names:
+            self.shared.add(value)
+
+
+
+# Marks a frame slot whose variable is not (or no longer) defined.
+UNBOUND = object()
+
+
+class Scope:
+    def __init__(self, parent=None, layout=None):
+        self.parent = parent
+        self.layout = layout
+        self.names = set()
+        self.references = parent.references if parent else []
+
+    def newScope(self, args):
+        layout = dict()
+        for arg in args:
+            if arg not in layout:
+                layout[arg] = len(layout)
+        return Scope(self, layout)
+
+    def newLocalScope(self, identifiers):
+        scope = Scope(self)
+        scope.names.update(identifiers)
+        return scope
+
+    def declare(self, name):
+        if self.layout is None:
+            self.names.add(name)
+        elif name not in self.layout:
+            self.layout[name] = len(self.layout)
+
+    def reference(self, identifier):
+        self.references.append((identifier, self))
+
+    def resolveReferences(self):
+        for identifier, scope in self.references:
+            name = identifier.value
+            skipped = []
+            while scope.parent:
+                layout = scope.layout
+                if layout is not None and name in layout:
+                    identifier.bindSlot(tuple(skipped), layout, layout[name])
+                    break
+                if name in scope.names:
+                    break
+                skipped.append(layout)
+                scope = scope.parent
+            else:
+                if skipped:
+                    identifier.bindSlot(tuple(skipped), None, None)
+
+
+def resolveSlots(node):
+    scope = Scope()
+    node.resolveSlots(scope)
+    scope.resolveReferences()
+    return node
+
+
+# The manifest of a module lists the bindings its top level makes, in
+# order: ("def", name), ("native", native, alias), ("require", modulespec,
+# isIdentifier, unqualified, symbols) and ("secure", entries, entries)
+# for parts that depend on checkerlang_secure_mode. It is None if the
+# module does anything else at the top level.
+
+def getManifest(node):
+    manifest = []
+    if addManifestEntries(manifest, node):
+        return manifest
+    return None
+
+
+def addManifestEntries(manifest, node):
+    if isinstance(node, NodeBlock):
+        if node.catchexprs or node.finallyexprs:
+            return False
+        for expression in node.expressions:
+            if not addManifestEntries(manifest, expression):
+                return False
+        return True
+    if isinstance(node, (NodeLiteral, NodeNull)):
+        return True
+    if isinstance(node, NodeDef):
+        manifest.append(("def", node.identifier))
+        return True
+    if isinstance(node, NodeFuncall):
+        if (
+            not isinstance(node.func, NodeIdentifier)
+            or node.func.value != "bind_native"
+            or node.names != [None] * len(node.args)
+            or len(node.args) not in [1, 2]
+        ):
+            return False
+        args = []
+        for arg in node.args:
+            if not isinstance(arg, NodeLiteral) or not arg.value.isString():
+                return False
+            args.append(arg.value.value)
+        manifest.append(("native", args[0], args[1] if args[1:] else None))
+        return True
+    if isinstance(node, NodeRequire):
+        if node.name or not (node.unqualified or node.symbols):
+            return False
+        if isinstance(node.modulespec, NodeIdentifier):
+            modulespec = node.modulespec.value
+        elif (
+            isinstance(node.modulespec, NodeLiteral)
+            and node.modulespec.value.isString()
+        ):
+            modulespec = node.modulespec.value.value
+        else:
+            return False
+        manifest.append((
+            "require",
+            modulespec,
+            isinstance(node.modulespec, NodeIdentifier),
+            node.unqualified,
+            node.symbols,
+        ))
+        return True
+    if isinstance(node, NodeIf) and len(node.conditions) == 1:
+        condition = node.conditions[0]
+        negated = isinstance(condition, NodeNot)
+        if negated:
+            condition = condition.expression
+        if (
+            not isinstance(condition, NodeIdentifier)
+            or condition.value != "checkerlang_secure_mode"
+        ):
+            return False
+        thenEntries = []
+        elseEntries = []
+        if not addManifestEntries(thenEntries, node.expressions[0]):
+            return False
+        if not addManifestEntries(elseEntries, node.elseExpression):
+            return False
+        if negated:
+            manifest.append(("secure", elseEntries, thenEntries))
+        else:
+            manifest.append(("secure", thenEntries, elseEntries))
+        return True
+    return False
+
+
 class NodeAnd:
     def __init__(self, expression, pos):
         self.expressions = [expression] if expression else []
@@ -126,6 +635,10 @@ class NodeAnd:
         for expression in self.expressions:
             expression.collectVars(freeVars, boundVars, additionalBoundVars)
 
+    def resolveSlots(self, scope):
+        for expression in self.expressions:
+            expression.resolveSlots(scope)
+
 
 class NodeAssign:
     def __init__(self, identifier, expression, pos):
@@ -136,6 +649,7 @@ class NodeAssign:
         self.identifier = identifier
         self.expression = expression
         self.pos = pos
+        self.accumulate = False
 
     def evaluate(self, environment):
         if not environment.isDefined(self.identifier):
@@ -144,15 +658,50 @@ class NodeAssign:
                 f"Variable {self.identifier} is not defined",
                 self.pos,
             )
-        environment.set(self.identifier, self.expression.evaluate(environment))
+        if self.accumulate:
+            value = self.accumulateValue(environment)
+        else:
+            value = self.expression.evaluate(environment)
+        environment.set(self.identifier, value)
         return environment.get(self.identifier, self.pos)
 
+    def accumulateValue(self, environment):
+        # Evaluates x = x op b and x op= b. If the parser proved that the
+        # list in x is not referenced from anywhere but the variable, see
+        # markAccumulations, and no code run by eval could take it since,
+        # op may change it in place instead of creating a new value, see
+        # ValueFunc.accumulate.
+        op = self.expression
+        fn = op.func.evaluate(environment)
+        if not fn.isFunc():
+            raise CklRuntimeError(
+                ValueString("ERROR"),
+                f"Expected def but got {fn.type()}",
+                op.pos,
+            )
+        current = op.a.evaluate(environment)
+        value = op.b.evaluate(environment)
+        if (
+            current.__class__ is ValueList
+            and not environment.evaluated
+            and fn.accumulate(current, value)
+        ):
+            return current
+        result = fn.executeOperator(current, value)
+        if result is None:
+            return invokeValues(fn, op.names, [current, value], environment,
+                                op.pos)
+        return result
+
     def __repr__(self):
         return f"({self.identifier!s} = {self.expression})"
 
     def collectVars(self, freeVars, boundVars, additionalBoundVars):
         self.expression.collectVars(freeVars, boundVars, additionalBoundVars)
 
+    def resolveSlots(self, scope):
+        self.expression.resolveSlots(scope)
+
 
 class NodeAssignDestructuring:
     def __init__(self, identifiers, expression, pos):
@@ -203,6 +752,47 @@ class NodeAssignDestructuring:
     def collectVars(self, freeVars, boundVars, additionalBoundVars):
         self.expression.collectVars(freeVars, boundVars, additionalBoundVars)
 
+    def resolveSlots(self, scope):
+        self.expression.resolveSlots(scope)
+
+
+class NodeBinaryOp:
+    names = ["a", "b"]
+
+    def __init__(self, func, a, b, pos):
+        self.func = func
+        self.a = a
+        self.b = b
+        self.pos = pos
+
+    def evaluate(self, environment):
+        fn = self.func.evaluate(environment)
+        if not fn.isFunc():
+            raise CklRuntimeError(
+                ValueString("ERROR"),
+                f"Expected def but got {fn.type()}",
+                self.pos,
+            )
+        a = self.a.evaluate(environment)
+        b = self.b.evaluate(environment)
+        result = fn.executeOperator(a, b)
+        if result is None:
+            return invokeValues(fn, self.names, [a, b], environment, self.pos)
+        return result
+
+    def __repr__(self):
+        return f"({self.func} {self.a!r}, {self.b!r})"
+
+    def collectVars(self, freeVars, boundVars, additionalBoundVars):
+        self.func.collectVars(freeVars, boundVars, additionalBoundVars)
+        self.a.collectVars(freeVars, boundVars, additionalBoundVars)
+        self.b.collectVars(freeVars, boundVars, additionalBoundVars)
+
+    def resolveSlots(self, scope):
+        self.func.resolveSlots(scope)
+        self.a.resolveSlots(scope)
+        self.b.resolveSlots(scope)
+
 
 class NodeBlock:
     def __init__(self, pos, toplevel=False):
@@ -329,6 +919,16 @@ class NodeBlock:
                 )
             err.collectVars(freeVars, boundVars, additionalBoundVars)
 
+    def resolveSlots(self, scope):
+        for expression in self.expressions:
+            expression.resolveSlots(scope)
+        for err, expression in self.catchexprs:
+            if err:
+                err.resolveSlots(scope)
+            expression.resolveSlots(scope)
+        for expression in self.finallyexprs:
+            expression.resolveSlots(scope)
+
 
 class NodeBreak:
     def __init__(self, pos):
@@ -343,6 +943,9 @@ class NodeBreak:
     def collectVars(self, freeVars, boundVars, additionalBoundVars):
         pass
 
+    def resolveSlots(self, scope):
+        pass
+
 
 class NodeClass:
     def __init__(self, identifier, pos):
@@ -372,6 +975,42 @@ class NodeClass:
         if boundVars not in (self.identifier):
             boundVars.append(self.identifier)
 
+    def resolveSlots(self, scope):
+        for member in self.members:
+            member.resolveSlots(scope)
+        scope.declare(self.identifier)
+
+
+class NodeConstant:
+    # The precomputed value of an expression, see ckl.optimizer. It is
+    # used as long as the builtin functions named in guards are still
+    # bound to the same native types, otherwise the original expression
+    # is evaluated. Strings and collections are copied for each evaluation
+    # unless the node is frozen because its value is only inspected.
+    def __init__(self, value, original, guards, pos):
+        self.value = value
+        self.original = original
+        self.guards = guards
+        self.frozen = False
+        self.pos = pos
+
+    def evaluate(self, environment):
+        for name, nativetype in self.guards:
+            if environment.get(name, self.pos).__class__ is not nativetype:
+                return self.original.evaluate(environment)
+        if self.frozen:
+            return self.value
+        return copyConstant(self.value)
+
+    def __repr__(self):
+        return repr(self.original)
+
+    def collectVars(self, freeVars, boundVars, additionalBoundVars):
+        self.original.collectVars(freeVars, boundVars, additionalBoundVars)
+
+    def resolveSlots(self, scope):
+        self.original.resolveSlots(scope)
+
 
 class NodeContinue:
     def __init__(self, pos):
@@ -386,6 +1025,9 @@ class NodeContinue:
     def collectVars(self, freeVars, boundVars, additionalBoundVars):
         pass
 
+    def resolveSlots(self, scope):
+        pass
+
 
 class NodeDef:
     def __init__(self, identifier, expression, info, pos):
@@ -395,8 +1037,7 @@ class NodeDef:
         self.pos = pos
 
     def evaluate(self, environment):
-        value = self.expression.evaluate(environment)
-        value.info = self.info
+        value = self.expression.evaluate(environment).withInfo(self.info)
         environment.put(self.identifier, value)
         import ckl.functions
         if isinstance(value, ckl.functions.FuncLambda):
@@ -411,6 +1052,10 @@ class NodeDef:
         if self.identifier not in boundVars:
             boundVars.append(self.identifier)
 
+    def resolveSlots(self, scope):
+        self.expression.resolveSlots(scope)
+        scope.declare(self.identifier)
+
 
 class NodeDefDestructuring:
     def __init__(self, identifiers, expression, info, pos):
@@ -459,6 +1104,11 @@ class NodeDefDestructuring:
             if identifier not in boundVars:
                 boundVars.append(identifier)
 
+    def resolveSlots(self, scope):
+        self.expression.resolveSlots(scope)
+        for identifier in self.identifiers:
+            scope.declare(identifier)
+
 
 class NodeDeref:
     def __init__(self, expression, index, default_value, pos):
@@ -470,7 +1120,9 @@ class NodeDeref:
     def evaluate(self, environment):
         idx = self.index.evaluate(environment)
         value = self.expression.evaluate(environment)
+        return self.dereference(value, idx, environment)
 
+    def dereference(self, value, idx, environment):
         if value == NULL:
             return NULL
 
@@ -498,7 +1150,7 @@ class NodeDeref:
                     "Default value not allowed in list dereference",
                     self.pos,
                 )
-            lst = value.value
+            lst = value.getItems()
             i = int(idx.value)
             if i < 0:
                 i = i + len(lst)
@@ -550,6 +1202,12 @@ class NodeDeref:
         self.expression.collectVars(freeVars, boundVars, additionalBoundVars)
         self.index.collectVars(freeVars, boundVars, additionalBoundVars)
 
+    def resolveSlots(self, scope):
+        self.expression.resolveSlots(scope)
+        self.index.resolveSlots(scope)
+        if self.default_value:
+            self.default_value.resolveSlots(scope)
+
 
 class NodeDerefAssign:
     def __init__(self, expression, index, value, pos):
@@ -572,7 +1230,7 @@ class NodeDerefAssign:
                 raise CklRuntimeError(
                     ValueString("ERROR"), f"Index out of bounds {i}", self.pos
                 )
-            container.value = s[0:i] + value.value + s[i+1:]
+            container.setChar(i, value.value)
             return container
 
         if container.isList():
@@ -585,10 +1243,11 @@ class NodeDerefAssign:
                     ValueString("ERROR"), f"Index out of bounds {i}", self.pos
                 )
             lst[i] = value
+            container.index = None
             return container
 
         if container.isMap():
-            container.value[idx] = value
+            container.addItem(idx, value)
             return container
 
         if container.isObject():
@@ -607,6 +1266,11 @@ class NodeDerefAssign:
         self.index.collectVars(freeVars, boundVars, additionalBoundVars)
         self.value.collectVars(freeVars, boundVars, additionalBoundVars)
 
+    def resolveSlots(self, scope):
+        self.expression.resolveSlots(scope)
+        self.index.resolveSlots(scope)
+        self.value.resolveSlots(scope)
+
 
 class NodeDerefInvoke:
     def __init__(self, objectExpr, member, pos):
@@ -614,14 +1278,35 @@ class NodeDerefInvoke:
         self.member = member
         self.names = []
         self.args = []
+        self.spread = False
+        self.plan = None
         self.pos = pos
 
     def addArg(self, name, arg):
         self.names.append(name)
         self.args.append(arg)
+        if isinstance(arg, NodeSpread):
+            self.spread = True
 
     def evaluate(self, environment):
         obj_ = self.objectExpr.evaluate(environment)
+        fn = self.getMemberFunction(obj_)
+        if obj_.isObject() and not obj_.isModule:
+            names = [None] + self.names
+            if self.spread:
+                args = [NodeLiteral(obj_, self.pos)] + self.args
+                return invoke(fn, names, args, environment, self.pos)
+            values = [obj_]
+            values.extend([arg.evaluate(environment) for arg in self.args])
+        else:
+            names = self.names
+            if self.spread:
+                return invoke(fn, names, self.args, environment, self.pos)
+            values = [arg.evaluate(environment) for arg in self.args]
+        self.plan = plan = getBindingPlan(self.plan, names, fn)
+        return plan.invoke(fn, values, environment, self.pos)
+
+    def getMemberFunction(self, obj_):
         if obj_.isObject():
             obj = obj_
             exists = obj.hasItem(self.member)
@@ -641,13 +1326,7 @@ class NodeDerefInvoke:
                     f"Member {self.member} is not a function",
                     self.pos,
                 )
-            if obj_.isModule:
-                names = self.names
-                args = self.args
-            else:
-                names = [None] + self.names
-                args = [NodeLiteral(obj_, self.pos)] + self.args
-            return invoke(fn, names, args, environment, self.pos)
+            return fn
 
         if obj_.isMap():
             fn = obj_.value[ValueString(self.member)]
@@ -657,7 +1336,7 @@ class NodeDerefInvoke:
                     f"{self.member} is not a function",
                     self.pos,
                 )
-            return invoke(fn, self.names, self.args, environment, self.pos)
+            return fn
 
         raise CklRuntimeError(
             ValueString("ERROR"),
@@ -676,6 +1355,11 @@ class NodeDerefInvoke:
         for arg in self.args:
             arg.collectVars(freeVars, boundVars, additionalBoundVars)
 
+    def resolveSlots(self, scope):
+        self.objectExpr.resolveSlots(scope)
+        for arg in self.args:
+            arg.resolveSlots(scope)
+
 
 class NodeDerefSlice:
     def __init__(self, expression, start, end, pos):
@@ -693,35 +1377,32 @@ class NodeDerefSlice:
             return NULL
 
         if value.isString():
-            s = value.value
+            length = value.getLength()
             start = int(start.value)
-            end = int(end.value) if end else len(s)
+            end = int(end.value) if end else length
             if start < 0:
-                start += len(s)
+                start += length
             if end < 0:
-                end += len(s)
+                end += length
             if start < 0:
                 start = 0
-            if end > len(s):
-                end = len(s)
-            return ValueString(s[start:end])
+            if end > length:
+                end = length
+            return value.slice(start, max(start, end))
 
         if value.isList():
-            lst = value.value
+            length = len(value.getItems())
             start = int(start.value)
-            end = int(end.value) if end else len(lst)
+            end = int(end.value) if end else length
             if start < 0:
-                start += len(lst)
+                start += length
             if end < 0:
-                end += len(lst)
+                end += length
             if start < 0:
                 start = 0
-            if end > len(lst):
-                end = len(lst)
-            result = ValueList()
-            for i in range(start, end):
-                result.addItem(lst[i])
-            return result
+            if end > length:
+                end = length
+            return value.slice(start, max(start, end))
 
         raise CklRuntimeError(
             ValueString("ERROR"),
@@ -737,6 +1418,12 @@ class NodeDerefSlice:
         self.start.collectVars(freeVars, boundVars, additionalBoundVars)
         self.end.collectVars(freeVars, boundVars, additionalBoundVars)
 
+    def resolveSlots(self, scope):
+        self.expression.resolveSlots(scope)
+        self.start.resolveSlots(scope)
+        if self.end:
+            self.end.resolveSlots(scope)
+
 
 class NodeError:
     def __init__(self, expression, pos):
@@ -753,6 +1440,9 @@ class NodeError:
     def collectVars(self, freeVars, boundVars, additionalBoundVars):
         self.expression.collectVars(freeVars, boundVars, additionalBoundVars)
 
+    def resolveSlots(self, scope):
+        self.expression.resolveSlots(scope)
+
 
 class NodeFor:
     def __init__(self, identifiers, expression, block, what, pos):
@@ -764,6 +1454,9 @@ class NodeFor:
 
     def evaluate(self, environment):
         lst = self.expression.evaluate(environment)
+        return self.iterate(lst, self.block.evaluate, environment)
+
+    def iterate(self, lst, block, environment):
         if lst.isInput():
             input_ = lst
             result = TRUE
@@ -782,7 +1475,7 @@ class NodeFor:
                         for i in range(len(self.identifiers)):
                             environment.put(self.identifiers[i], vals[i])
 
-                    result = self.block.evaluate(environment)
+                    result = block(environment)
                     if result.isBreak():
                         result = TRUE
                         break
@@ -804,7 +1497,7 @@ class NodeFor:
             return result
 
         if lst.isList():
-            values = lst.value
+            values = lst.getItems()
             result = TRUE
             for value in values:
                 if len(self.identifiers) == 1:
@@ -816,7 +1509,7 @@ class NodeFor:
                         vals = value.getSortedItems()
                     for i in range(len(self.identifiers)):
                         environment.put(self.identifiers[i], vals[i])
-                result = self.block.evaluate(environment)
+                result = block(environment)
                 if result.isBreak():
                     result = TRUE
                     break
@@ -833,6 +1526,37 @@ class NodeFor:
                         environment.remove(self.identifiers[i])
             return result
 
+        if lst.isSequence():
+            result = TRUE
+            iterated = False
+            for value in lst.iterate():
+                iterated = True
+                if len(self.identifiers) == 1:
+                    environment.put(self.identifiers[0], value)
+                else:
+                    if value.isList():
+                        vals = value.value
+                    elif value.isSet():
+                        vals = value.getSortedItems()
+                    for i in range(len(self.identifiers)):
+                        environment.put(self.identifiers[i], vals[i])
+                result = block(environment)
+                if result.isBreak():
+                    result = TRUE
+                    break
+                elif result.isContinue():
+                    result = TRUE
+                    # continue
+                elif result.isReturn():
+                    break
+            if iterated:
+                if len(self.identifiers) == 1:
+                    environment.remove(self.identifiers[0])
+                else:
+                    for i in range(len(self.identifiers)):
+                        environment.remove(self.identifiers[i])
+            return result
+
         if lst.isSet():
             values = lst.getSortedItems()
             result = TRUE
@@ -846,7 +1570,7 @@ class NodeFor:
                         vals = value.getSortedItems()
                     for i in range(len(self.identifiers)):
                         environment.put(self.identifiers[i], vals[i])
-                result = self.block.evaluate(environment)
+                result = block(environment)
                 if result.isBreak():
                     result = TRUE
                     break
@@ -864,7 +1588,7 @@ class NodeFor:
             return result
 
         if lst.isMap():
-            values = [(k, lst.value[k]) for k in sorted(lst.value.keys())]
+            values = [(k, lst.value[k]) for k in lst.getSortedKeys()]
             result = TRUE
             for key, value in values:
                 val = value
@@ -885,7 +1609,7 @@ class NodeFor:
                         vals = val.value.sortedValues()
                     for i in range(len(self.identifiers)):
                         environment.put(self.identifiers[i], vals[i])
-                result = self.block.evaluate(environment)
+                result = block(environment)
                 if result.isBreak():
                     result = TRUE
                     break
@@ -924,7 +1648,7 @@ class NodeFor:
                         vals = val.value.sortedValues()
                     for i in range(len(self.identifiers)):
                         environment.put(self.identifiers[i], vals[i])
-                result = self.block.evaluate(environment)
+                result = block(environment)
                 if result.isBreak():
                     result = TRUE
                     break
@@ -944,9 +1668,9 @@ class NodeFor:
         if lst.isString():
             s = lst.value
             result = TRUE
-            for i in range(len(s)):
-                environment.put(self.identifiers[0], ValueString(s[i:i+1]))
-                result = self.block.evaluate(environment)
+            for ch in s:
+                environment.put(self.identifiers[0], ValueString(ch))
+                result = block(environment)
                 if result.isBreak():
                     result = TRUE
                     break
@@ -984,17 +1708,28 @@ class NodeFor:
         boundVarsLocal = [*boundVars, *self.identifiers]
         self.block.collectVars(freeVars, boundVarsLocal, additionalBoundVars)
 
+    def resolveSlots(self, scope):
+        self.expression.resolveSlots(scope)
+        for identifier in self.identifiers:
+            scope.declare(identifier)
+        self.block.resolveSlots(scope)
+
 
 class NodeFuncall:
     def __init__(self, func, pos):
         self.func = func
         self.names = []
         self.args = []
+        self.spread = False
+        self.tail = False
+        self.plan = None
         self.pos = pos
 
     def addArg(self, name, arg):
         self.names.append(name)
         self.args.append(arg)
+        if isinstance(arg, NodeSpread):
+            self.spread = True
 
     def evaluate(self, environment):
         fn = self.func.evaluate(environment)
@@ -1004,7 +1739,15 @@ class NodeFuncall:
                 f"Expected def but got {fn.type()}",
                 self.pos,
             )
-        return invoke(fn, self.names, self.args, environment, self.pos)
+        if self.spread:
+            return invoke(fn, self.names, self.args, environment, self.pos)
+        values = [arg.evaluate(environment) for arg in self.args]
+        self.plan = plan = getBindingPlan(self.plan, self.names, fn)
+        if self.tail and fn.tailCallable and plan.bindings is not None:
+            return ValueControlTailCall(
+                fn, plan.bind(values, self.pos), self.pos
+            )
+        return plan.invoke(fn, values, environment, self.pos)
 
     def __repr__(self):
         args = ", ".join([repr(arg) for arg in self.args])
@@ -1015,6 +1758,11 @@ class NodeFuncall:
         for arg in self.args:
             arg.collectVars(freeVars, boundVars, additionalBoundVars)
 
+    def resolveSlots(self, scope):
+        self.func.resolveSlots(scope)
+        for arg in self.args:
+            arg.resolveSlots(scope)
+
 
 class NodeIdentifier:
     def __init__(self, value, pos):
@@ -1035,6 +1783,45 @@ class NodeIdentifier:
             if self.value not in freeVars:
                 freeVars.append(self.value)
 
+    def resolveSlots(self, scope):
+        scope.reference(self)
+
+    def bindSlot(self, skipped, layout, index):
+        # The identifier switches to a specialised subclass, so that
+        # evaluate needs no further checks of the binding kind.
+        self.skipped = skipped
+        self.layout = layout
+        self.index = index
+        if skipped:
+            self.__class__ = NodeOuterIdentifier
+        else:
+            self.__class__ = NodeLocalIdentifier
+
+
+class NodeLocalIdentifier(NodeIdentifier):
+    def evaluate(self, environment):
+        if environment.layout is self.layout:
+            value = environment.slots[self.index]
+            if value is not UNBOUND:
+                return value
+        return environment.get(self.value, self.pos)
+
+
+class NodeOuterIdentifier(NodeIdentifier):
+    def evaluate(self, environment):
+        env = environment
+        for layout in self.skipped:
+            if env.layout is not layout or self.value in env.map:
+                return environment.get(self.value, self.pos)
+            env = env.parent
+        if self.layout is None:
+            return env.get(self.value, self.pos)
+        if env.layout is self.layout:
+            value = env.slots[self.index]
+            if value is not UNBOUND:
+                return value
+        return environment.get(self.value, self.pos)
+
 
 class NodeIf:
     def __init__(self, pos):
@@ -1088,6 +1875,13 @@ class NodeIf:
             freeVars, boundVars, additionalBoundVars
         )
 
+    def resolveSlots(self, scope):
+        for expression in self.conditions:
+            expression.resolveSlots(scope)
+        for expression in self.expressions:
+            expression.resolveSlots(scope)
+        self.elseExpression.resolveSlots(scope)
+
 
 class NodeIn:
     def __init__(self, expression, lst, pos):
@@ -1098,10 +1892,11 @@ class NodeIn:
     def evaluate(self, environment):
         value = self.expression.evaluate(environment)
         container = self.list.evaluate(environment)
+        return self.contains(value, container)
+
+    def contains(self, value, container):
         if container.isList():
-            for item in container.value:
-                if value == item:
-                    return TRUE
+            return ValueBoolean.fromval(container.hasItem(value))
         elif container.isSet():
             return ValueBoolean.fromval(container.hasItem(value))
         elif container.isMap():
@@ -1121,11 +1916,16 @@ class NodeIn:
         self.expression.collectVars(freeVars, boundVars, additionalBoundVars)
         self.list.collectVars(freeVars, boundVars, additionalBoundVars)
 
+    def resolveSlots(self, scope):
+        self.expression.resolveSlots(scope)
+        self.list.resolveSlots(scope)
+
 
 class NodeLambda:
     def __init__(self, pos):
         self.args = []
         self.defs = []
+        self.layout = None
         self.pos = pos
 
     def addArg(self, arg, defaultValue=None):
@@ -1143,6 +1943,8 @@ class NodeLambda:
         elif isinstance(body, NodeReturn):
             body = body.expression
         self.body = body
+        markTailCalls(body)
+        markAccumulations(body, self.args)
 
     def evaluate(self, environment):
         import ckl.functions
@@ -1150,6 +1952,7 @@ class NodeLambda:
         for i in range(len(self.args)):
             result.addArg(self.args[i], self.defs[i])
         result.setBody(self.body)
+        result.setLayout(self.layout)
         return result
 
     def __repr__(self):
@@ -1172,6 +1975,14 @@ class NodeLambda:
             boundVarsLocal.append(arg)
         self.body.collectVars(freeVars, boundVarsLocal, additionalBoundVars)
 
+    def resolveSlots(self, scope):
+        lambdaScope = scope.newScope(self.args)
+        for definition in self.defs:
+            if definition:
+                definition.resolveSlots(lambdaScope)
+        self.body.resolveSlots(lambdaScope)
+        self.layout = lambdaScope.layout
+
 
 class NodeList:
     def __init__(self, pos):
@@ -1199,6 +2010,10 @@ class NodeList:
         for item in self.items:
             item.collectVars(freeVars, boundVars, additionalBoundVars)
 
+    def resolveSlots(self, scope):
+        for item in self.items:
+            item.resolveSlots(scope)
+
 
 class NodeListComprehension:
     def __init__(self, valueExpr, identifier, listExpr, what, pos):
@@ -1213,26 +2028,17 @@ class NodeListComprehension:
         self.conditionExpr = conditionExpr
 
     def evaluate(self, environment):
-        result = ValueList()
         localEnv = environment.newEnv()
         lst = self.listExpr.evaluate(environment)
         values = getCollectionValue(lst, self.what)
-        for listValue in values:
-            localEnv.put(self.identifier, listValue)
-            value = self.valueExpr.evaluate(localEnv)
-            if self.conditionExpr:
-                condition = self.conditionExpr.evaluate(localEnv)
-                if not condition.isBoolean():
-                    raise CklRuntimeError(
-                        ValueString("ERROR"),
-                        f"Condition must be boolean "
-                        f"but got {condition.type()}",
-                        self.pos,
-                    )
-                if condition.value:
-                    result.addItem(value)
-            else:
-                result.addItem(value)
+        result = ValueList()
+        result.value = comprehend(
+            bindValues(localEnv, self.identifier, values),
+            localEnv,
+            self.valueExpr.evaluate,
+            self.conditionExpr,
+            self.pos,
+        )
         return result
 
     def __repr__(self):
@@ -1264,6 +2070,13 @@ class NodeListComprehension:
                 freeVars, boundVarsLocal, additionalBoundVars
             )
 
+    def resolveSlots(self, scope):
+        self.listExpr.resolveSlots(scope)
+        localScope = scope.newLocalScope([self.identifier])
+        self.valueExpr.resolveSlots(localScope)
+        if self.conditionExpr:
+            self.conditionExpr.resolveSlots(localScope)
+
 
 class NodeListComprehensionParallel:
     def __init__(
@@ -1291,31 +2104,26 @@ class NodeListComprehensionParallel:
         self.conditionExpr = conditionExpr
 
     def evaluate(self, environment):
-        result = ValueList()
         localEnv = environment.newEnv()
         list1 = self.listExpr1.evaluate(environment)
         list2 = self.listExpr2.evaluate(environment)
         values1 = getCollectionValue(list1, self.what1)
         values2 = getCollectionValue(list2, self.what2)
-        for i in range(max(len(values1), len(values2))):
-            listValue1 = values1[i] if i < len(values1) else None
-            listValue2 = values2[i] if i < len(values2) else None
-            localEnv.put(self.identifier1, listValue1)
-            localEnv.put(self.identifier2, listValue2)
-            value = self.valueExpr.evaluate(localEnv)
-            if self.conditionExpr:
-                condition = self.conditionExpr.evaluate(localEnv)
-                if not condition.isBoolean():
-                    raise CklRuntimeError(
-                        ValueString("ERROR"),
-                        "Condition must be boolean but "
-                        f"got {condition.type()}",
-                        self.pos,
-                    )
-                if condition.value:
-                    result.addItem(value)
-            else:
-                result.addItem(value)
+        result = ValueList()
+        result.value = comprehend(
+            bindParallel(
+                localEnv,
+                self.identifier1,
+                values1,
+                self.identifier2,
+                values2,
+                None,
+            ),
+            localEnv,
+            self.valueExpr.evaluate,
+            self.conditionExpr,
+            self.pos,
+        )
         return result
 
     def __repr__(self):
@@ -1355,6 +2163,16 @@ class NodeListComprehensionParallel:
                 freeVars, boundVarsLocal, additionalBoundVars
             )
 
+    def resolveSlots(self, scope):
+        self.listExpr1.resolveSlots(scope)
+        self.listExpr2.resolveSlots(scope)
+        localScope = scope.newLocalScope(
+            [self.identifier1, self.identifier2]
+        )
+        self.valueExpr.resolveSlots(localScope)
+        if self.conditionExpr:
+            self.conditionExpr.resolveSlots(localScope)
+
 
 class NodeListComprehensionProduct:
     def __init__(
@@ -1382,30 +2200,21 @@ class NodeListComprehensionProduct:
         self.conditionExpr = conditionExpr
 
     def evaluate(self, environment):
-        result = ValueList()
         localEnv = environment.newEnv()
         list1 = self.listExpr1.evaluate(environment)
         list2 = self.listExpr2.evaluate(environment)
         values1 = getCollectionValue(list1, self.what1)
         values2 = getCollectionValue(list2, self.what2)
-        for listValue1 in values1:
-            localEnv.put(self.identifier1, listValue1)
-            for listValue2 in values2:
-                localEnv.put(self.identifier2, listValue2)
-                value = self.valueExpr.evaluate(localEnv)
-                if self.conditionExpr:
-                    condition = self.conditionExpr.evaluate(localEnv)
-                    if not condition.isBoolean():
-                        raise CklRuntimeError(
-                            ValueString("ERROR"),
-                            "Condition must be boolean "
-                            f"but got {condition.type()}",
-                            self.pos,
-                        )
-                    if condition.value:
-                        result.addItem(value)
-                else:
-                    result.addItem(value)
+        result = ValueList()
+        result.value = comprehend(
+            bindProduct(
+                localEnv, self.identifier1, values1, self.identifier2, values2
+            ),
+            localEnv,
+            self.valueExpr.evaluate,
+            self.conditionExpr,
+            self.pos,
+        )
         return result
 
     def __repr__(self):
@@ -1444,6 +2253,16 @@ class NodeListComprehensionProduct:
                 freeVars, boundVarsLocal, additionalBoundVars
             )
 
+    def resolveSlots(self, scope):
+        self.listExpr1.resolveSlots(scope)
+        self.listExpr2.resolveSlots(scope)
+        localScope = scope.newLocalScope(
+            [self.identifier1, self.identifier2]
+        )
+        self.valueExpr.resolveSlots(localScope)
+        if self.conditionExpr:
+            self.conditionExpr.resolveSlots(localScope)
+
 
 class NodeLiteral:
     def __init__(self, value, pos):
@@ -1459,6 +2278,9 @@ class NodeLiteral:
     def collectVars(self, freeVars, boundVars, additionalBoundVars):
         pass
 
+    def resolveSlots(self, scope):
+        pass
+
 
 class NodeMap:
     def __init__(self, pos):
@@ -1497,6 +2319,12 @@ class NodeMap:
         for item in self.values:
             item.collectVars(freeVars, boundVars, additionalBoundVars)
 
+    def resolveSlots(self, scope):
+        for item in self.keys:
+            item.resolveSlots(scope)
+        for item in self.values:
+            item.resolveSlots(scope)
+
 
 class NodeMapComprehension:
     def __init__(self, keyExpr, valueExpr, identifier, listExpr, what, pos):
@@ -1512,27 +2340,25 @@ class NodeMapComprehension:
         self.conditionExpr = conditionExpr
 
     def evaluate(self, environment):
-        result = ValueMap()
         localEnv = environment.newEnv()
         lst = self.listExpr.evaluate(environment)
         values = getCollectionValue(lst, self.what)
-        for listValue in values:
-            localEnv.put(self.identifier, listValue)
-            key = self.keyExpr.evaluate(localEnv)
-            value = self.valueExpr.evaluate(localEnv)
-            if self.conditionExpr:
-                condition = self.conditionExpr.evaluate(localEnv)
-                if not condition.isBoolean():
-                    raise CklRuntimeError(
-                        ValueString("ERROR"),
-                        "Condition must be boolean "
-                        f"but got {condition.type()}",
-                        self.pos,
-                    )
-                if condition.value:
-                    result.addItem(key, value)
-            else:
-                result.addItem(key, value)
+        keyExpr = self.keyExpr
+        valueExpr = self.valueExpr
+
+        def project(env):
+            return keyExpr.evaluate(env), valueExpr.evaluate(env)
+
+        result = ValueMap()
+        result.value = dict(
+            comprehend(
+                bindValues(localEnv, self.identifier, values),
+                localEnv,
+                project,
+                self.conditionExpr,
+                self.pos,
+            )
+        )
         return result
 
     def __repr__(self):
@@ -1556,6 +2382,14 @@ class NodeMapComprehension:
                 freeVars, boundVarsLocal, additionalBoundVars
             )
 
+    def resolveSlots(self, scope):
+        self.listExpr.resolveSlots(scope)
+        localScope = scope.newLocalScope([self.identifier])
+        self.keyExpr.resolveSlots(localScope)
+        self.valueExpr.resolveSlots(localScope)
+        if self.conditionExpr:
+            self.conditionExpr.resolveSlots(localScope)
+
 
 class NodeNot:
     def __init__(self, expression, pos):
@@ -1578,6 +2412,9 @@ class NodeNot:
     def collectVars(self, freeVars, boundVars, additionalBoundVars):
         self.expression.collectVars(freeVars, boundVars, additionalBoundVars)
 
+    def resolveSlots(self, scope):
+        self.expression.resolveSlots(scope)
+
 
 class NodeNull:
     def __init__(self, pos):
@@ -1592,6 +2429,9 @@ class NodeNull:
     def collectVars(self, freeVars, boundVars, additionalBoundVars):
         pass
 
+    def resolveSlots(self, scope):
+        pass
+
 
 class NodeObject:
     def __init__(self, pos):
@@ -1625,6 +2465,10 @@ class NodeObject:
         for item in self.values:
             item.collectVars(freeVars, boundVars, additionalBoundVars)
 
+    def resolveSlots(self, scope):
+        for item in self.values:
+            item.resolveSlots(scope)
+
 
 class NodeOr:
     def __init__(self, pos):
@@ -1662,6 +2506,20 @@ class NodeOr:
         for expression in self.expressions:
             expression.collectVars(freeVars, boundVars, additionalBoundVars)
 
+    def resolveSlots(self, scope):
+        for expression in self.expressions:
+            expression.resolveSlots(scope)
+
+
+def getPackagedModuleSource(modulefile):
+    try:
+        data = pkgutil.get_data(__name__, "modules/" + modulefile.lower())
+    except FileNotFoundError:
+        data = None
+    if data:
+        return data.decode("utf-8")
+    return None
+
 
 class NodeRequire:
     def __init__(self, modulespec, name, unqualified, symbols, pos):
@@ -1727,20 +2585,22 @@ class NodeRequire:
         environment.pushModuleStack(moduleidentifier, self.pos)
 
         # lookup or read module
+        import ckl.lazy
         moduleEnv = None
         if moduleidentifier in modules:
             moduleEnv = modules[moduleidentifier]
-        else:
+        elif (self.unqualified or self.symbols) and ckl.lazy.LAZY_MODULES:
+            moduleEnv = ckl.lazy.getPackagedModule(
+                environment, moduleidentifier, modulefile
+            )
+        if moduleEnv is None:
             moduleEnv = environment.getBase().newEnv()
-            try:
-                data = pkgutil.get_data(
-                    __name__,
-                    "modules/" + modulefile.lower()
+            import ckl.cache
+            modulesrc = getPackagedModuleSource(modulefile)
+            if modulesrc is not None:
+                node = ckl.cache.parse_module_cached(
+                    modulesrc, "mod:"+modulefile[0:-4], modulefile
                 )
-            except FileNotFoundError:
-                data = None
-            if data:
-                modulesrc = data.decode("utf-8")
             else:
                 filename = os.path.basename(modulefile)
                 modulepath = os.path.expanduser("~/.ckl/modules")
@@ -1764,12 +2624,24 @@ class NodeRequire:
                         ValueString("ERROR"),
                         f"Module {filename[:-4]} not found",
                         self.pos)
-            import ckl.parser
-            node = ckl.parser.parse_script(modulesrc, "mod:"+modulefile[0:-4])
+                node = ckl.cache.parse_script_cached(
+                    modulesrc, "mod:"+modulefile[0:-4], filepath
+                )
             node.evaluate(moduleEnv)
             modules[moduleidentifier] = moduleEnv
         environment.popModuleStack()
 
+        if isinstance(moduleEnv, ckl.lazy.LazyModule):
+            base = environment.getBase()
+            if (self.unqualified or self.symbols) and moduleEnv.getExports(
+                base
+            ):
+                moduleEnv.bindExports(
+                    environment, self.unqualified, self.symbols
+                )
+                return NULL
+            moduleEnv = moduleEnv.getEnvironment(base, self.pos)
+
         # bind module or contents of module
         if self.unqualified:
             for name in moduleEnv.getLocalSymbols():
@@ -1808,6 +2680,9 @@ class NodeRequire:
     def collectVars(self, freeVars, boundVars, additionalBoundVars):
         pass
 
+    def resolveSlots(self, scope):
+        pass
+
 
 class NodeReturn:
     def __init__(self, expression, pos):
@@ -1833,6 +2708,10 @@ class NodeReturn:
                 freeVars, boundVars, additionalBoundVars
             )
 
+    def resolveSlots(self, scope):
+        if self.expression:
+            self.expression.resolveSlots(scope)
+
 
 class NodeSet:
     def __init__(self, pos):
@@ -1855,6 +2734,10 @@ class NodeSet:
         for item in self.items:
             item.collectVars(freeVars, boundVars, additionalBoundVars)
 
+    def resolveSlots(self, scope):
+        for item in self.items:
+            item.resolveSlots(scope)
+
 
 class NodeSetComprehension:
     def __init__(self, valueExpr, identifier, listExpr, what, pos):
@@ -1869,26 +2752,19 @@ class NodeSetComprehension:
         self.conditionExpr = conditionExpr
 
     def evaluate(self, environment):
-        result = ValueSet()
         localEnv = environment.newEnv()
         lst = self.listExpr.evaluate(environment)
-        values = getCollectionValue(lst, self.what)
-        for listValue in values:
-            localEnv.put(self.identifier, listValue)
-            value = self.valueExpr.evaluate(localEnv)
-            if self.conditionExpr:
-                condition = self.conditionExpr.evaluate(localEnv)
-                if not condition.isBoolean():
-                    raise CklRuntimeError(
-                        ValueString("ERROR"),
-                        "Condition must be boolean but got "
-                        + condition.type(),
-                        self.pos,
-                    )
-                if condition.value:
-                    result.addItem(value)
-            else:
-                result.addItem(value)
+        values = getUnorderedCollectionValue(lst, self.what)
+        result = ValueSet()
+        result.value = set(
+            comprehend(
+                bindValues(localEnv, self.identifier, values),
+                localEnv,
+                self.valueExpr.evaluate,
+                self.conditionExpr,
+                self.pos,
+            )
+        )
         return result
 
     def __repr__(self):
@@ -1911,6 +2787,13 @@ class NodeSetComprehension:
                 freeVars, boundVarsLocal, additionalBoundVars
             )
 
+    def resolveSlots(self, scope):
+        self.listExpr.resolveSlots(scope)
+        localScope = scope.newLocalScope([self.identifier])
+        self.valueExpr.resolveSlots(localScope)
+        if self.conditionExpr:
+            self.conditionExpr.resolveSlots(localScope)
+
 
 class NodeSetComprehensionParallel:
     def __init__(
@@ -1938,33 +2821,28 @@ class NodeSetComprehensionParallel:
         self.conditionExpr = conditionExpr
 
     def evaluate(self, environment):
-        result = ValueSet()
         localEnv = environment.newEnv()
         list1 = self.listExpr1.evaluate(environment)
         list2 = self.listExpr2.evaluate(environment)
         values1 = getCollectionValue(list1, self.what1)
         values2 = getCollectionValue(list2, self.what2)
-        for i in range(max(len(values1), len(values2))):
-            localEnv.put(
-                self.identifier1, values1[i] if i < len(values1) else NULL
-            )
-            localEnv.put(
-                self.identifier2, values2[i] if i < len(values2) else NULL
+        result = ValueSet()
+        result.value = set(
+            comprehend(
+                bindParallel(
+                    localEnv,
+                    self.identifier1,
+                    values1,
+                    self.identifier2,
+                    values2,
+                    NULL,
+                ),
+                localEnv,
+                self.valueExpr.evaluate,
+                self.conditionExpr,
+                self.pos,
             )
-            value = self.valueExpr.evaluate(localEnv)
-            if self.conditionExpr:
-                condition = self.conditionExpr.evaluate(localEnv)
-                if not condition.isBoolean():
-                    raise CklRuntimeError(
-                        ValueString("ERROR"),
-                        "Condition must be boolean but got "
-                        + condition.type(),
-                        self.pos,
-                    )
-                if condition.value:
-                    result.addItem(value)
-            else:
-                result.addItem(value)
+        )
         return result
 
     def __repr__(self):
@@ -1998,6 +2876,16 @@ class NodeSetComprehensionParallel:
                 freeVars, boundVarsLocal, additionalBoundVars
             )
 
+    def resolveSlots(self, scope):
+        self.listExpr1.resolveSlots(scope)
+        self.listExpr2.resolveSlots(scope)
+        localScope = scope.newLocalScope(
+            [self.identifier1, self.identifier2]
+        )
+        self.valueExpr.resolveSlots(localScope)
+        if self.conditionExpr:
+            self.conditionExpr.resolveSlots(localScope)
+
 
 class NodeSetComprehensionProduct:
     def __init__(
@@ -2025,30 +2913,27 @@ class NodeSetComprehensionProduct:
         self.conditionExpr = conditionExpr
 
     def evaluate(self, environment):
-        result = ValueSet()
         localEnv = environment.newEnv()
         list1 = self.listExpr1.evaluate(environment)
         list2 = self.listExpr2.evaluate(environment)
-        values1 = getCollectionValue(list1, self.what1)
-        values2 = getCollectionValue(list2, self.what2)
-        for value1 in values1:
-            localEnv.put(self.identifier1, value1)
-            for value2 in values2:
-                localEnv.put(self.identifier2, value2)
-                value = self.valueExpr.evaluate(localEnv)
-                if self.conditionExpr:
-                    condition = self.conditionExpr.evaluate(localEnv)
-                    if not condition.isBoolean():
-                        raise CklRuntimeError(
-                            ValueString("ERROR"),
-                            "Condition must be boolean but got "
-                            + condition.type(),
-                            self.pos,
-                        )
-                    if condition.value:
-                        result.addItem(value)
-                else:
-                    result.addItem(value)
+        values1 = getUnorderedCollectionValue(list1, self.what1)
+        values2 = getUnorderedCollectionValue(list2, self.what2)
+        result = ValueSet()
+        result.value = set(
+            comprehend(
+                bindProduct(
+                    localEnv,
+                    self.identifier1,
+                    values1,
+                    self.identifier2,
+                    values2,
+                ),
+                localEnv,
+                self.valueExpr.evaluate,
+                self.conditionExpr,
+                self.pos,
+            )
+        )
         return result
 
     def __repr__(self):
@@ -2081,6 +2966,16 @@ class NodeSetComprehensionProduct:
                 freeVars, boundVarsLocal, additionalBoundVars
             )
 
+    def resolveSlots(self, scope):
+        self.listExpr1.resolveSlots(scope)
+        self.listExpr2.resolveSlots(scope)
+        localScope = scope.newLocalScope(
+            [self.identifier1, self.identifier2]
+        )
+        self.valueExpr.resolveSlots(localScope)
+        if self.conditionExpr:
+            self.conditionExpr.resolveSlots(localScope)
+
 
 class NodeSpread:
     def __init__(self, expression, pos):
@@ -2096,6 +2991,9 @@ class NodeSpread:
     def collectVars(self, freeVars, boundVars, additionalBoundVars):
         self.expression.collectVars(freeVars, boundVars, additionalBoundVars)
 
+    def resolveSlots(self, scope):
+        self.expression.resolveSlots(scope)
+
 
 class NodeWhile:
     def __init__(self, expression, block, pos):
@@ -2138,3 +3036,7 @@ class NodeWhile:
         self.expression.collectVars(freeVars, boundVars, additionalBoundVars)
         boundVarsLocal = boundVars[:]
         self.block.collectVars(freeVars, boundVarsLocal, additionalBoundVars)
+
+    def resolveSlots(self, scope):
+        self.expression.resolveSlots(scope)
+        self.block.resolveSlots(scope)
@@ -0,0 +1,287 @@
+from ckl.functions import FuncLambda
+from ckl.nodes import (
+    NodeBinaryOp,
+    NodeConstant,
+    NodeFor,
+    NodeFuncall,
+    NodeIdentifier,
+    NodeIn,
+    NodeList,
+    NodeLiteral,
+    NodeMap,
+    NodeNull,
+    NodeSet,
+)
+from ckl.values import (
+    ValueBoolean,
+    ValueDecimal,
+    ValueFunc,
+    ValueInt,
+    ValueList,
+    ValueMap,
+    ValueNull,
+    ValueSet,
+    ValueString,
+)
+
+
+# The optimizer rewrites a parsed node tree before it is evaluated.
+# Calls of pure builtin functions with constant arguments are evaluated
+# once, and collections of constants are built once; both are replaced
+# by a NodeConstant. Builtins can be redefined at any time, so a folded
+# node keeps the names and native types of the functions it folded and
+# falls back to the original expression when one of them is shadowed.
+# Expressions that fail are left alone, they report their error when
+# they are evaluated.
+
+OPTIMIZE = True
+
+PURE_NATIVES = frozenset(
+    [
+        "acos",
+        "add",
+        "asin",
+        "atan",
+        "atan2",
+        "bit_and",
+        "bit_not",
+        "bit_or",
+        "bit_rotate_left",
+        "bit_rotate_right",
+        "bit_shift_left",
+        "bit_shift_right",
+        "bit_xor",
+        "boolean",
+        "ceiling",
+        "chr",
+        "compare",
+        "contains",
+        "cos",
+        "decimal",
+        "div",
+        "ends_with",
+        "equals",
+        "exp",
+        "find",
+        "find_last",
+        "floor",
+        "greater",
+        "greater_equals",
+        "int",
+        "is_empty",
+        "is_not_empty",
+        "is_not_null",
+        "is_null",
+        "length",
+        "less",
+        "less_equals",
+        "log",
+        "lower",
+        "mod",
+        "mul",
+        "not_equals",
+        "ord",
+        "pow",
+        "round",
+        "sin",
+        "split",
+        "split2",
+        "sqrt",
+        "starts_with",
+        "string",
+        "sub",
+        "sublist",
+        "substr",
+        "tan",
+        "trim",
+        "upper",
+    ]
+)
+
+SCALAR_TYPES = (ValueBoolean, ValueDecimal, ValueInt, ValueNull, ValueString)
+
+
+def optimize(node, environment):
+    if not OPTIMIZE:
+        return node
+    return optimizeNode(node, environment)
+
+
+def isNode(value):
+    return type(value).__module__ == "ckl.nodes" and hasattr(
+        value, "evaluate"
+    )
+
+
+def optimizeNode(node, environment):
+    for name, value in list(vars(node).items()):
+        if isinstance(value, list):
+            optimizeItems(value, environment)
+        elif isNode(value):
+            setattr(node, name, optimizeNode(value, environment))
+    optimizer = OPTIMIZERS.get(type(node))
+    if optimizer is None:
+        return node
+    return optimizer(node, environment)
+
+
+def optimizeItems(values, environment):
+    for i, value in enumerate(values):
+        if isinstance(value, list):
+            optimizeItems(value, environment)
+        elif isNode(value):
+            values[i] = optimizeNode(value, environment)
+
+
+def isConstantValue(value):
+    if isinstance(value, SCALAR_TYPES):
+        return True
+    if isinstance(value, (ValueList, ValueSet)):
+        return all(isConstantValue(item) for item in value.value)
+    if isinstance(value, ValueMap):
+        return all(
+            isConstantValue(key) and isConstantValue(item)
+            for key, item in value.value.items()
+        )
+    return False
+
+
+def isFlat(value):
+    if isinstance(value, (ValueList, ValueSet)):
+        return all(isinstance(item, SCALAR_TYPES) for item in value.value)
+    if isinstance(value, ValueMap):
+        return all(
+            isinstance(item, SCALAR_TYPES) for item in value.value.values()
+        )
+    return True
+
+
+def getGuards(nodes):
+    # returns the guards of constant nodes, or None if a node is not
+    # constant
+    guards = dict()
+    for node in nodes:
+        if isinstance(node, NodeConstant):
+            guards.update(node.guards)
+        elif isinstance(node, NodeNull):
+            pass
+        elif not isinstance(node, NodeLiteral) or not isinstance(
+            node.value, SCALAR_TYPES
+        ):
+            return None
+    return guards
+
+
+def getNative(node, environment):
+    # returns the native type of a pure builtin function the node refers
+    # to, or None
+    if type(node) is not NodeIdentifier or node.value not in PURE_NATIVES:
+        return None
+    if not environment.isDefined(node.value):
+        return None
+    fn = environment.get(node.value)
+    if (
+        not isinstance(fn, ValueFunc)
+        or isinstance(fn, FuncLambda)
+        or fn.name != node.value
+    ):
+        return None
+    return type(fn)
+
+
+def fold(node, guards, environment):
+    try:
+        value = node.evaluate(environment)
+    except Exception:
+        return node
+    if not isConstantValue(value):
+        return node
+    return NodeConstant(value, node, tuple(guards.items()), node.pos)
+
+
+def optimizeCall(node, args, environment):
+    nativetype = getNative(node.func, environment)
+    if nativetype is None:
+        return node
+    guards = getGuards(args)
+    if guards is None:
+        return node
+    guards[node.func.value] = nativetype
+    return fold(node, guards, environment)
+
+
+def isZero(node):
+    return (
+        isinstance(node, (NodeConstant, NodeLiteral))
+        and isinstance(node.value, (ValueDecimal, ValueInt))
+        and node.value.value == 0
+    )
+
+
+def optimizeBinaryOp(node, environment):
+    # a division by zero returns DIV_0_VALUE, which is only known at
+    # runtime
+    if node.func.value == "div" and isZero(node.b):
+        return node
+    return optimizeCall(node, [node.a, node.b], environment)
+
+
+def optimizeFuncall(node, environment):
+    if node.spread:
+        return node
+    if (
+        isinstance(node.func, NodeIdentifier)
+        and node.func.value == "div"
+        and any(isZero(arg) for arg in node.args)
+    ):
+        return node
+    return optimizeCall(node, node.args, environment)
+
+
+def optimizeCollection(node, items, environment):
+    guards = getGuards(items)
+    if guards is None:
+        return node
+    return fold(node, guards, environment)
+
+
+def optimizeList(node, environment):
+    return optimizeCollection(node, node.items, environment)
+
+
+def optimizeSet(node, environment):
+    return optimizeCollection(node, node.items, environment)
+
+
+def optimizeMap(node, environment):
+    return optimizeCollection(node, node.keys + node.values, environment)
+
+
+def optimizeIn(node, environment):
+    # membership tests only inspect the collection, so it can be shared,
+    # and a list gets its hash index right away
+    if isinstance(node.list, NodeConstant):
+        node.list.frozen = True
+        if isinstance(node.list.value, ValueList):
+            node.list.value.buildIndex()
+    return node
+
+
+def optimizeFor(node, environment):
+    # loops hand out the elements, which are only shared if immutable
+    if isinstance(node.expression, NodeConstant) and isFlat(
+        node.expression.value
+    ):
+        node.expression.frozen = True
+    return node
+
+
+OPTIMIZERS = {
+    NodeBinaryOp: optimizeBinaryOp,
+    NodeFor: optimizeFor,
+    NodeFuncall: optimizeFuncall,
+    NodeIn: optimizeIn,
+    NodeList: optimizeList,
+    NodeMap: optimizeMap,
+    NodeSet: optimizeSet,
+}
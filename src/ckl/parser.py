@@ -10,9 +10,12 @@ from ckl.values import (
 )
 
 from ckl.nodes import (
+    markAccumulations,
+    resolveSlots,
     NodeAnd,
     NodeAssign,
     NodeAssignDestructuring,
+    NodeBinaryOp,
     NodeBlock,
     NodeBreak,
     NodeClass,
@@ -87,7 +90,8 @@ def parse(lexer):
             lastexpr = expressions[-1]
             if isinstance(lastexpr, NodeReturn):
                 expressions[-1] = lastexpr.expression
-    return result
+    markAccumulations(result, [])
+    return resolveSlots(result)
 
 
 def parse_bare_block(lexer, toplevel=False):
@@ -450,10 +454,12 @@ def parse_unary_expr(lexer):
         elif token.type == "decimal":
             return parse_pred_expr(lexer, True)
         else:
-            call = NodeFuncall(NodeIdentifier("sub", pos), pos)
-            call.addArg("a", NodeLiteral(ValueInt(0), pos))
-            call.addArg("b", parse_pred_expr(lexer))
-            return call
+            return func_call(
+                "sub",
+                NodeLiteral(ValueInt(0), pos),
+                parse_pred_expr(lexer),
+                pos,
+            )
     return parse_pred_expr(lexer)
 
 
@@ -1622,7 +1628,24 @@ def invoke(lexer, node):
     return node
 
 
+BINARY_OPERATORS = {
+    "add",
+    "sub",
+    "mul",
+    "div",
+    "mod",
+    "less",
+    "less_equals",
+    "greater",
+    "greater_equals",
+    "equals",
+    "not_equals",
+}
+
+
 def func_call(fn, exprA, exprB, pos):
+    if exprB and fn in BINARY_OPERATORS:
+        return NodeBinaryOp(NodeIdentifier(fn, pos), exprA, exprB, pos)
     result = NodeFuncall(NodeIdentifier(fn, pos), pos)
     if exprB:
         return func_call2(fn, "a", exprA, "b", exprB, pos)
@@ -11,7 +11,10 @@ from ckl.errors import (
     CklSyntaxError,
     CklRuntimeError
 )
+from ckl.cache import parse_script_cached
 from ckl.interpreter import Interpreter
+from ckl.optimizer import optimize
+from ckl.parser import parse_script
 
 
 def main():
@@ -19,6 +22,7 @@ def main():
     parser.add_argument("-s", "--secure", action="store_true")
     parser.add_argument("-l", "--legacy", action="store_true")
     parser.add_argument("-m", "--modulepath", nargs="?")
+    parser.add_argument("-c", "--cache", action="store_true")
     parser.add_argument("script")
     parser.add_argument("args", nargs="*")
     args = parser.parse_args(sys.argv[1:])
@@ -45,7 +49,12 @@ def main():
         script = infile.read()
 
     try:
-        result = interpreter.interpret(script, args.script)
+        if args.cache:
+            node = parse_script_cached(script, args.script)
+        else:
+            node = parse_script(script, args.script)
+        node = optimize(node, interpreter.environment)
+        result = interpreter.execute(node.evaluate)
         if result != NULL:
             print(str(result))
     except CklRuntimeError as e:
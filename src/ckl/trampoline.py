@@ -0,0 +1,453 @@
+import functools
+
+from ckl.errors import CklRuntimeError
+from ckl.functions import FuncLambda
+from ckl.nodes import (
+    getBindingPlan,
+    getFuncallString,
+    invoke,
+    invokeValues,
+    NodeAnd,
+    NodeAssign,
+    NodeBinaryOp,
+    NodeBlock,
+    NodeDef,
+    NodeDeref,
+    NodeDerefInvoke,
+    NodeFor,
+    NodeFuncall,
+    NodeIf,
+    NodeIn,
+    NodeLambda,
+    NodeList,
+    NodeLiteral,
+    NodeMap,
+    NodeNot,
+    NodeOr,
+    NodeReturn,
+    NodeSet,
+    NodeSpread,
+    NodeWhile,
+)
+from ckl.values import (
+    ValueBoolean,
+    ValueControlBreak,
+    ValueControlContinue,
+    ValueControlReturn,
+    ValueControlTailCall,
+    ValueList,
+    ValueMap,
+    ValueSet,
+    ValueString,
+    TRUE,
+    FALSE,
+    NULL,
+)
+
+
+# The trampolined evaluator runs a node tree without nesting python
+# frames for nested nodes and calls. Every node type with a step
+# function is evaluated by a generator, which yields the nodes it needs
+# the values of as (node, environment) pairs and returns its own value.
+# The generators waiting for a value are kept on an explicit stack, so
+# the depth of a recursion is limited by memory instead of the python
+# recursion limit. Lambdas called from such a node run their body on the
+# same stack. Node types without a step function are evaluated by their
+# evaluate method, and natives calling back into lambdas start a new
+# stack, so the complete language is covered.
+
+CONTROL = (ValueControlBreak, ValueControlContinue, ValueControlReturn)
+
+
+def run(node, environment):
+    step = STEPS.get(node.__class__)
+    if step is None:
+        return node.evaluate(environment)
+    stack = []
+    current = step(node, environment)
+    value = None
+    error = None
+    while True:
+        try:
+            if error is None:
+                child, env = current.send(value)
+            else:
+                child, env = current.throw(error)
+                error = None
+        except StopIteration as stop:
+            if not stack:
+                return stop.value
+            current = stack.pop()
+            value = stop.value
+            continue
+        except Exception as e:
+            if not stack:
+                raise
+            current = stack.pop()
+            error = e
+            continue
+        step = STEPS.get(child.__class__)
+        if step is None:
+            try:
+                value = child.evaluate(env)
+            except Exception as e:
+                error = e
+            continue
+        stack.append(current)
+        current = step(child, env)
+        value = None
+
+
+def expected_boolean(value, pos):
+    return CklRuntimeError(
+        ValueString("ERROR"),
+        "Expected boolean but got " + value.type(),
+        pos,
+    )
+
+
+def expected_function(fn, pos):
+    return CklRuntimeError(
+        ValueString("ERROR"),
+        f"Expected def but got {fn.type()}",
+        pos,
+    )
+
+
+def step_call(fn, plan, values, environment, pos):
+    if plan.bindings is None or fn.__class__ is not FuncLambda:
+        return plan.invoke(fn, values, environment, pos)
+    args = plan.bind(values, pos)
+    try:
+        return (yield from step_lambda_body(fn, args, pos))
+    except CklRuntimeError as e:
+        e.stacktrace.append(getFuncallString(fn, args) + " " + str(pos))
+        raise
+
+
+def step_lambda_body(fn, args, pos):
+    # mirrors FuncLambda.execute, including the loop over tail calls
+    lambda_ = fn
+    while True:
+        try:
+            result = yield fn.body, fn.bindArgs(args, pos)
+        except CklRuntimeError as e:
+            if fn is not lambda_:
+                e.stacktrace.append(
+                    getFuncallString(fn, args) + " " + str(pos)
+                )
+            raise
+        if isinstance(result, ValueControlReturn):
+            result = result.value
+            if not isinstance(result, ValueControlTailCall):
+                return result
+        if not isinstance(result, ValueControlTailCall):
+            break
+        fn = result.fn
+        args = result.args
+        pos = result.pos
+    if isinstance(result, ValueControlBreak):
+        raise CklRuntimeError(
+            ValueString("ERROR"),
+            "Cannot use break without surrounding loop",
+            result.pos,
+        )
+    elif isinstance(result, ValueControlContinue):
+        raise CklRuntimeError(
+            ValueString("ERROR"),
+            "Cannot use continue without surrounding loop",
+            result.pos,
+        )
+    return result
+
+
+def step_and(node, environment):
+    for expression in node.expressions:
+        value = yield expression, environment
+        if value.__class__ is not ValueBoolean:
+            raise expected_boolean(value, node.pos)
+        if not value.value:
+            return FALSE
+    return TRUE
+
+
+def step_assign(node, environment):
+    if not environment.isDefined(node.identifier):
+        raise CklRuntimeError(
+            ValueString("ERROR"),
+            f"Variable {node.identifier} is not defined",
+            node.pos,
+        )
+    if node.accumulate:
+        value = yield from step_accumulate(node.expression, environment)
+    else:
+        value = yield node.expression, environment
+    environment.set(node.identifier, value)
+    return environment.get(node.identifier, node.pos)
+
+
+def step_accumulate(op, environment):
+    # see NodeAssign.accumulateValue
+    fn = yield op.func, environment
+    if not fn.isFunc():
+        raise expected_function(fn, op.pos)
+    current = op.a.evaluate(environment)
+    value = yield op.b, environment
+    if (
+        current.__class__ is ValueList
+        and not environment.evaluated
+        and fn.accumulate(current, value)
+    ):
+        return current
+    result = fn.executeOperator(current, value)
+    if result is None:
+        return invokeValues(fn, op.names, [current, value], environment,
+                            op.pos)
+    return result
+
+
+def step_binary_op(node, environment):
+    fn = yield node.func, environment
+    if not fn.isFunc():
+        raise expected_function(fn, node.pos)
+    a = yield node.a, environment
+    b = yield node.b, environment
+    result = fn.executeOperator(a, b)
+    if result is None:
+        return invokeValues(fn, node.names, [a, b], environment, node.pos)
+    return result
+
+
+def step_block(node, environment):
+    if node.catchexprs or node.finallyexprs:
+        return (yield from step_block_guarded(node, environment))
+    result = TRUE
+    for expression in node.expressions:
+        result = yield expression, environment
+        if result.__class__ in CONTROL:
+            break
+    return result
+
+
+def step_block_guarded(node, environment):
+    result = TRUE
+    try:
+        for expression in node.expressions:
+            result = yield expression, environment
+            if result.__class__ in CONTROL:
+                break
+    except CklRuntimeError as e:
+        for err, expr in node.catchexprs:
+            if not err or e.value == (yield err, environment):
+                return (yield expr, environment)
+        raise
+    finally:
+        for expression in node.finallyexprs:
+            yield expression, environment
+    return result
+
+
+def step_def(node, environment):
+    value = yield node.expression, environment
+    value = value.withInfo(node.info)
+    environment.put(node.identifier, value)
+    if isinstance(value, FuncLambda):
+        value.name = node.identifier
+    return value
+
+
+def step_deref(node, environment):
+    idx = yield node.index, environment
+    value = yield node.expression, environment
+    return node.dereference(value, idx, environment)
+
+
+def step_deref_invoke(node, environment):
+    obj_ = yield node.objectExpr, environment
+    fn = node.getMemberFunction(obj_)
+    if obj_.isObject() and not obj_.isModule:
+        names = [None] + node.names
+        if node.spread:
+            args = [NodeLiteral(obj_, node.pos)] + node.args
+            return invoke(fn, names, args, environment, node.pos)
+        values = [obj_]
+    else:
+        names = node.names
+        if node.spread:
+            return invoke(fn, names, node.args, environment, node.pos)
+        values = []
+    for arg in node.args:
+        values.append((yield arg, environment))
+    node.plan = plan = getBindingPlan(node.plan, names, fn)
+    return (yield from step_call(fn, plan, values, environment, node.pos))
+
+
+def step_for(node, environment):
+    lst = yield node.expression, environment
+    if not lst.isList():
+        return node.iterate(
+            lst, functools.partial(run, node.block), environment
+        )
+    identifiers = node.identifiers
+    values = lst.getItems()
+    result = TRUE
+    for value in values:
+        if len(identifiers) == 1:
+            environment.put(identifiers[0], value)
+        else:
+            if value.isList():
+                vals = value.value
+            elif value.isSet():
+                vals = value.getSortedItems()
+            for i in range(len(identifiers)):
+                environment.put(identifiers[i], vals[i])
+        result = yield node.block, environment
+        if result.__class__ is ValueControlBreak:
+            result = TRUE
+            break
+        elif result.__class__ is ValueControlContinue:
+            result = TRUE
+        elif result.__class__ is ValueControlReturn:
+            break
+    if values:
+        for identifier in identifiers:
+            environment.remove(identifier)
+    return result
+
+
+def step_funcall(node, environment):
+    fn = yield node.func, environment
+    if not fn.isFunc():
+        raise expected_function(fn, node.pos)
+    if node.spread:
+        return invoke(fn, node.names, node.args, environment, node.pos)
+    values = []
+    for arg in node.args:
+        values.append((yield arg, environment))
+    node.plan = plan = getBindingPlan(node.plan, node.names, fn)
+    if node.tail and fn.tailCallable and plan.bindings is not None:
+        return ValueControlTailCall(fn, plan.bind(values, node.pos), node.pos)
+    return (yield from step_call(fn, plan, values, environment, node.pos))
+
+
+def step_if(node, environment):
+    for i in range(len(node.conditions)):
+        value = yield node.conditions[i], environment
+        if value.__class__ is not ValueBoolean:
+            raise CklRuntimeError(
+                ValueString("ERROR"),
+                f"Expected boolean condition value but got {value.type()}",
+                node.pos,
+            )
+        if value.value:
+            return (yield node.expressions[i], environment)
+    return (yield node.elseExpression, environment)
+
+
+def step_in(node, environment):
+    value = yield node.expression, environment
+    return node.contains(value, (yield node.list, environment))
+
+
+def step_lambda(node, environment):
+    # lambdas called by natives run their body on a stack of their own
+    yield from ()
+    result = node.evaluate(environment)
+    result.setBody(node.body, functools.partial(run, node.body))
+    return result
+
+
+def step_list(node, environment):
+    result = ValueList()
+    for item in node.items:
+        value = yield item, environment
+        if isinstance(item, NodeSpread):
+            for element in value.value:
+                result.addItem(element)
+        else:
+            result.addItem(value)
+    return result
+
+
+def step_map(node, environment):
+    result = ValueMap()
+    for i in range(len(node.keys)):
+        key = yield node.keys[i], environment
+        result.addItem(key, (yield node.values[i], environment))
+    return result
+
+
+def step_not(node, environment):
+    value = yield node.expression, environment
+    if value.__class__ is not ValueBoolean:
+        raise expected_boolean(value, node.pos)
+    return FALSE if value.value else TRUE
+
+
+def step_or(node, environment):
+    for expression in node.expressions:
+        value = yield expression, environment
+        if value.__class__ is not ValueBoolean:
+            raise expected_boolean(value, node.pos)
+        if value.value:
+            return TRUE
+    return FALSE
+
+
+def step_return(node, environment):
+    if node.expression is None:
+        return ValueControlReturn(NULL, node.pos)
+    return ValueControlReturn((yield node.expression, environment), node.pos)
+
+
+def step_set(node, environment):
+    result = ValueSet()
+    for item in node.items:
+        result.addItem((yield item, environment))
+    return result
+
+
+def step_while(node, environment):
+    result = TRUE
+    while True:
+        condition = yield node.expression, environment
+        if condition.__class__ is not ValueBoolean:
+            raise CklRuntimeError(
+                ValueString("ERROR"),
+                "Expected boolean condition but got " + condition.type(),
+                node.pos,
+            )
+        if not condition.value:
+            break
+        result = yield node.block, environment
+        if result.__class__ is ValueControlBreak:
+            result = TRUE
+            break
+        elif result.__class__ is ValueControlContinue:
+            result = TRUE
+        elif result.__class__ is ValueControlReturn:
+            break
+    return result
+
+
+STEPS = {
+    NodeAnd: step_and,
+    NodeAssign: step_assign,
+    NodeBinaryOp: step_binary_op,
+    NodeBlock: step_block,
+    NodeDef: step_def,
+    NodeDeref: step_deref,
+    NodeDerefInvoke: step_deref_invoke,
+    NodeFor: step_for,
+    NodeFuncall: step_funcall,
+    NodeIf: step_if,
+    NodeIn: step_in,
+    NodeLambda: step_lambda,
+    NodeList: step_list,
+    NodeMap: step_map,
+    NodeNot: step_not,
+    NodeOr: step_or,
+    NodeReturn: step_return,
+    NodeSet: step_set,
+    NodeWhile: step_while,
+}
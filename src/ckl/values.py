@@ -1,5 +1,6 @@
 import datetime
 import functools
+import itertools
 import math
 import re
 
@@ -416,28 +417,61 @@ class ConsoleOutput:
 
 
 class FileInput:
+    # Reads the file as a stream, so that inputs of any size can be
+    # processed line by line. The file is closed as soon as its end is
+    # read, or when the input is closed or used as a context manager.
     def __init__(self, filename, encoding):
         self.encoding = encoding.lower()
         if self.encoding == "utf-8":
             self.encoding = "utf8"
-        # TODO rewrite to use open stream instead of reading all in at start.
-        with open(filename, encoding=self.encoding) as infile:
-            self.buffer = StringInput(infile.read())
+        self.fd = open(filename, encoding=self.encoding)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
 
     def process(self, callback):
-        return self.buffer.process(callback)
+        line = self.readLine()
+        count = 0
+        while line:
+            callback(line)
+            count += 1
+            line = self.readLine()
+        return count
 
     def read(self):
-        return self.buffer.read()
+        if self.fd is None:
+            return None
+        ch = self.fd.read(1)
+        if not ch:
+            self.close()
+            return None
+        return ch
 
     def readAll(self):
-        return self.buffer.readAll()
+        if self.fd is None:
+            return None
+        result = self.fd.read() or None
+        self.close()
+        return result
 
     def readLine(self):
-        return self.buffer.readLine()
+        if self.fd is None:
+            return None
+        line = self.fd.readline()
+        if not line:
+            self.close()
+            return None
+        if line.endswith("\n"):
+            return line[:-1]
+        return line
 
     def close(self):
-        return self.buffer.close()
+        if self.fd is not None:
+            self.fd.close()
+            self.fd = None
 
 
 class FileOutput:
@@ -465,6 +499,8 @@ class FileOutput:
 
 
 class Value:
+    __slots__ = ("info",)
+
     def __init__(self):
         self.info = ""
 
@@ -554,6 +590,9 @@ class Value:
     def isSet(self):
         return False
 
+    def isSequence(self):
+        return False
+
     def isMap(self):
         return False
 
@@ -608,6 +647,8 @@ class Value:
 
 @functools.total_ordering
 class ValueBoolean(Value):
+    __slots__ = ("value",)
+
     def __init__(self, value):
         self.value = value
 
@@ -621,6 +662,9 @@ class ValueBoolean(Value):
     def isFalse(self):
         return not self.value
 
+    def __reduce__(self):
+        return "TRUE" if self.value else "FALSE"
+
     def __hash__(self):
         return hash(self.value)
 
@@ -668,6 +712,8 @@ FALSE = ValueBoolean(False)
 
 @functools.total_ordering
 class ValueControlBreak(Value):
+    __slots__ = ("pos",)
+
     def __init__(self, pos):
         self.pos = pos
 
@@ -695,6 +741,8 @@ class ValueControlBreak(Value):
 
 @functools.total_ordering
 class ValueControlContinue(Value):
+    __slots__ = ("pos",)
+
     def __init__(self, pos):
         self.pos = pos
 
@@ -722,6 +770,8 @@ class ValueControlContinue(Value):
 
 @functools.total_ordering
 class ValueControlReturn(Value):
+    __slots__ = ("value", "pos")
+
     def __init__(self, value, pos):
         self.value = value
         self.pos = pos
@@ -748,8 +798,37 @@ class ValueControlReturn(Value):
         return self
 
 
+@functools.total_ordering
+class ValueControlTailCall(Value):
+    # A call in tail position of a lambda body (see markTailCalls), which
+    # the FuncLambda executing the body performs in place of its own call
+    __slots__ = ("fn", "args", "pos")
+
+    def __init__(self, fn, args, pos):
+        self.fn = fn
+        self.args = args
+        self.pos = pos
+
+    def __hash__(self):
+        return hash("tailcall")
+
+    def __eq__(self, other):
+        return self is other
+
+    def __lt__(self, other):
+        return str(self) < str(other)
+
+    def __repr__(self):
+        return f"tailcall {self.fn}"
+
+    def type(self):
+        return "tailcall"
+
+
 @functools.total_ordering
 class ValueDate(Value):
+    __slots__ = ("value",)
+
     def __init__(self, value=None):
         self.value = value if value else datetime.datetime.now()
 
@@ -793,9 +872,17 @@ class ValueDate(Value):
 
 @functools.total_ordering
 class ValueDecimal(Value):
+    __slots__ = ("value",)
+
     def __init__(self, value):
         self.value = value
 
+    def withInfo(self, info):
+        # folded constants share their decimals, see ValueInt.withInfo
+        result = ValueDecimal(self.value)
+        result.info = info
+        return result
+
     def __hash__(self):
         return hash(self.value)
 
@@ -839,6 +926,8 @@ class ValueDecimal(Value):
 
 @functools.total_ordering
 class ValueFunc(Value):
+    tailCallable = False
+
     def __init__(self, name):
         self.name = name
         self.secure = True
@@ -855,6 +944,14 @@ class ValueFunc(Value):
     def __repr__(self):
         return f"<#{self.name}>"
 
+    def executeOperator(self, a, b):
+        return None
+
+    def accumulate(self, a, b):
+        # changes the list a in place to the result of the function,
+        # returns False if it cannot
+        return False
+
     def type(self):
         return "func"
 
@@ -870,6 +967,8 @@ class ValueFunc(Value):
 
 @functools.total_ordering
 class ValueInput(Value):
+    __slots__ = ("input", "closed")
+
     def __init__(self, input_):
         self.input = input_
         self.closed = False
@@ -919,9 +1018,25 @@ class ValueInput(Value):
 
 @functools.total_ordering
 class ValueInt(Value):
+    # Ints are never changed in place, so arithmetic, ranges and parsed
+    # data share the instances of small ints, see SMALL_INTS.
+    __slots__ = ("value",)
+
     def __init__(self, value):
         self.value = value
 
+    @classmethod
+    def fromval(cls, value):
+        if SMALL_INT_MIN <= value < SMALL_INT_MAX:
+            return SMALL_INTS[value - SMALL_INT_MIN]
+        return ValueInt(value)
+
+    def withInfo(self, info):
+        # the info of a def goes to a copy, since the instance is shared
+        result = ValueInt(self.value)
+        result.info = info
+        return result
+
     def __hash__(self):
         return hash(self.value)
 
@@ -967,10 +1082,22 @@ class ValueInt(Value):
         return True
 
 
+SMALL_INT_MIN = -128
+SMALL_INT_MAX = 1024
+SMALL_INTS = [ValueInt(i) for i in range(SMALL_INT_MIN, SMALL_INT_MAX)]
+
+
 @functools.total_ordering
 class ValueList(Value):
+    # Lists that are tested for membership repeatedly get a hash index of
+    # their items, see hasItem. The index belongs to the python list it
+    # was built from and is dropped by the methods changing that list.
+    # It is rebuilt as well when a string was changed in place since.
+    __slots__ = ("value", "index")
+
     def __init__(self):
         self.value = []
+        self.index = None
 
     def __hash__(self):
         return sum(hash(s) for s in self.value)
@@ -989,13 +1116,61 @@ class ValueList(Value):
         return "[" + ", ".join([str(item) for item in self.value]) + "]"
 
     def addItems(self, list_):
-        self.value = self.value + list_
+        self.value.extend(list_)
+        self.index = None
         return self
 
     def addItem(self, item):
         self.value.append(item)
+        self.index = None
         return self
 
+    def hasItem(self, item):
+        items = self.value
+        if (
+            len(items) >= INDEX_MIN_SIZE
+            and item.__class__ in INDEXED_TYPES
+        ):
+            index = self.index
+            changes = ValueString.changes
+            if index is None or index[0] is not items or index[2] != changes:
+                self.index = (items, None, changes)  # index on the next test
+            else:
+                if index[1] is None:
+                    index = self.buildIndex()
+                if index[1] is not False:
+                    return item in index[1]
+        for value in items:
+            if item == value:
+                return True
+        return False
+
+    def buildIndex(self):
+        # only items with consistent hashes and equality are indexed,
+        # decimals that are NaN never equal anything
+        items = self.value
+        lookup = False
+        if all(
+            value.__class__ in INDEXED_TYPES
+            and (value.__class__ is not ValueDecimal or value == value)
+            for value in items
+        ):
+            lookup = frozenset(items)
+        self.index = (items, lookup, ValueString.changes)
+        return self.index
+
+    def getItems(self):
+        return self.value
+
+    def slice(self, start, end):
+        # the items of the list can change, so they are copied
+        items = self.getItems()[start:end]
+        if len(items) < SLICE_MIN_SIZE:
+            result = ValueList()
+            result.value = items
+            return result
+        return ValueListSlice(items, 0, len(items))
+
     def findItem(self, item):
         for index, value in enumerate(self.value):
             if value == item:
@@ -1004,12 +1179,14 @@ class ValueList(Value):
 
     def removeItem(self, item):
         self.value.remove(item)
+        self.index = None
 
     def deleteAt(self, index):
         if index >= len(self.value):
             return NULL
         result = self.value[index]
         del self.value[index]
+        self.index = None
         return result
 
     def insertAt(self, index, value):
@@ -1022,6 +1199,7 @@ class ValueList(Value):
             self.value.append(value)
         else:
             self.value.insert(idx, value)
+        self.index = None
         return self
 
     def type(self):
@@ -1031,17 +1209,17 @@ class ValueList(Value):
         return ValueString(str(self))
 
     def asInt(self):
-        return ValueInt(len(self.value))
+        return ValueInt(len(self.getItems()))
 
     def asBoolean(self):
-        return ValueBoolean.fromval(len(self.value) > 0)
+        return ValueBoolean.fromval(len(self.getItems()) > 0)
 
     def asList(self):
         return self
 
     def asSet(self):
         result = ValueSet()
-        for item in self.value:
+        for item in self.getItems():
             result.addItem(item)
         return result
 
@@ -1061,10 +1239,169 @@ class ValueList(Value):
         return True
 
 
+class ValueRange(ValueList):
+    # The list of ints returned by range. The items are only created
+    # when the list is accessed through value, e.g. when it is changed
+    # or printed. Until then getItems returns a lazy sequence, which
+    # loops, comprehensions, length, indexing and sum work on.
+    __slots__ = ("range", "items")
+
+    def __init__(self, range_):
+        self.range = range_
+        self.items = None
+        self.index = None
+
+    @property
+    def value(self):
+        if self.items is None:
+            self.items = [ValueInt.fromval(i) for i in self.range]
+        return self.items
+
+    @value.setter
+    def value(self, value):
+        self.items = value
+
+    def getItems(self):
+        if self.items is None:
+            return RangeItems(self)
+        return self.items
+
+    def hasItem(self, item):
+        if self.items is None and item.__class__ is ValueInt:
+            return item.value in self.range
+        return super().hasItem(item)
+
+    def slice(self, start, end):
+        if self.items is None:
+            return ValueRange(self.range[start:end])
+        return super().slice(start, end)
+
+
+class RangeItems:
+    __slots__ = ("owner", "range")
+
+    def __init__(self, owner):
+        self.owner = owner
+        self.range = owner.range
+
+    def __len__(self):
+        return len(self.range)
+
+    def __getitem__(self, index):
+        return ValueInt.fromval(self.range[index])
+
+    def __iter__(self):
+        return iterateLive(self.owner, map(ValueInt.fromval, self.range))
+
+
+def iterateLive(owner, lazy):
+    # iterates the lazy items of a range or slice owner until the owner
+    # creates its items, e.g. because a loop appends to it, and continues
+    # with those, so that the loop sees its changes like for a list
+    index = 0
+    for item in lazy:
+        if owner.items is not None:
+            break
+        yield item
+        index += 1
+    items = owner.items
+    if items is not None:
+        while index < len(items):
+            yield items[index]
+            index += 1
+
+
+SLICE_MIN_SIZE = 64
+
+
+def sliceList(items, start, end):
+    # a slice shares items that no list can change, unless it is small
+    # or leaves more than half of them unused, then it copies them
+    if end - start < SLICE_MIN_SIZE:
+        result = ValueList()
+        result.value = items[start:end]
+        return result
+    if 2 * (end - start) < len(items):
+        return ValueListSlice(items[start:end], 0, end - start)
+    return ValueListSlice(items, start, end)
+
+
+class ValueListSlice(ValueList):
+    # The list returned by sublist and slice dereferences. The slices
+    # of a list share one copy of its items, which is never changed, so
+    # taking the rest of a slice again and again costs nothing. The
+    # items are only copied when the list is accessed through value,
+    # e.g. when it is changed or printed. Until then getItems returns a
+    # lazy sequence, like for ValueRange.
+    __slots__ = ("base", "start", "end", "items")
+
+    def __init__(self, base, start, end):
+        self.base = base
+        self.start = start
+        self.end = end
+        self.items = None
+        self.index = None
+
+    @property
+    def value(self):
+        if self.items is None:
+            self.items = self.base[self.start:self.end]
+            self.base = None
+        return self.items
+
+    @value.setter
+    def value(self, value):
+        self.items = value
+        self.base = None
+
+    def getItems(self):
+        if self.items is None:
+            return SliceItems(self)
+        return self.items
+
+    def slice(self, start, end):
+        if self.items is None:
+            return sliceList(self.base, self.start + start, self.start + end)
+        return super().slice(start, end)
+
+
+class SliceItems:
+    __slots__ = ("owner", "items", "start", "end")
+
+    def __init__(self, owner):
+        self.owner = owner
+        self.items = owner.base
+        self.start = owner.start
+        self.end = owner.end
+
+    def __len__(self):
+        return self.end - self.start
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.end - self.start
+        if index < 0 or index >= self.end - self.start:
+            raise IndexError(index)
+        return self.items[self.start + index]
+
+    def __iter__(self):
+        return iterateLive(
+            self.owner, itertools.islice(self.items, self.start, self.end)
+        )
+
+
 @functools.total_ordering
 class ValueMap(Value):
+    # Maps keep their keys in sorted order once it has been computed, so
+    # that iterating an unchanged map again does not sort it again. The
+    # methods adding or removing keys drop the order, and a changed number
+    # of keys is detected as well. The sorted list is shared with the
+    # callers, which must not modify it. Sets do the same for their items.
+    __slots__ = ("value", "sortedKeys")
+
     def __init__(self):
         self.value = dict()
+        self.sortedKeys = None
 
     def __hash__(self):
         return sum(hash(k) + hash(v) for k, v in self.value.items())
@@ -1092,9 +1429,12 @@ class ValueMap(Value):
     def addMap(self, map_):
         for key, value in map_.items():
             self.value[key] = value
+        self.sortedKeys = None
         return self
 
     def addItem(self, key, value):
+        if key not in self.value:
+            self.sortedKeys = None
         self.value[key] = value
         return self
 
@@ -1106,9 +1446,13 @@ class ValueMap(Value):
 
     def removeItem(self, key):
         del self.value[key]
+        self.sortedKeys = None
 
     def getSortedKeys(self):
-        return sorted(self.value.keys())
+        keys = self.sortedKeys
+        if keys is None or len(keys) != len(self.value):
+            keys = self.sortedKeys = sorted(self.value.keys())
+        return keys
 
     def type(self):
         return "map"
@@ -1149,6 +1493,8 @@ class ValueMap(Value):
 
 @functools.total_ordering
 class ValueNode(Value):
+    __slots__ = ("value",)
+
     def __init__(self, value):
         self.value = value
 
@@ -1181,6 +1527,8 @@ class ValueNode(Value):
 
 @functools.total_ordering
 class ValueNull(Value):
+    __slots__ = ("value",)
+
     def __init__(self):
         self.value = None
 
@@ -1190,6 +1538,9 @@ class ValueNull(Value):
     def __eq__(self, other):
         return other is NULL
 
+    def __reduce__(self):
+        return "NULL"
+
     def __lt__(self, other):
         return str(self) < str(other)
 
@@ -1217,6 +1568,8 @@ NULL = ValueNull()
 
 @functools.total_ordering
 class ValueObject(Value):
+    __slots__ = ("value", "isModule")
+
     def __init__(self):
         self.value = dict()
         self.isModule = False
@@ -1324,6 +1677,8 @@ class ValueObject(Value):
 
 @functools.total_ordering
 class ValueOutput(Value):
+    __slots__ = ("output", "closed")
+
     def __init__(self, output):
         self.output = output
         self.closed = False
@@ -1370,6 +1725,8 @@ class ValueOutput(Value):
 
 @functools.total_ordering
 class ValuePattern(Value):
+    __slots__ = ("value", "pattern")
+
     def __init__(self, value):
         self.value = value
         self.pattern = re.compile(value)
@@ -1406,10 +1763,84 @@ class ValuePattern(Value):
         return True
 
 
+@functools.total_ordering
+class ValueSequence(Value):
+    # A lazy sequence of the items of a list, set, input or another
+    # sequence. Stages are python functions taking and returning an
+    # iterator of values. Adding a stage returns a new sequence, so a
+    # chain of stages is fused into a single pass over the source, which
+    # starts anew each time the sequence is iterated. Lines of an input
+    # can only be read once.
+    __slots__ = ("source", "stages")
+
+    def __init__(self, source, stages=()):
+        self.source = source
+        self.stages = stages
+
+    def __hash__(self):
+        return hash("sequence")
+
+    def __eq__(self, other):
+        return self is other
+
+    def __lt__(self, other):
+        return str(self) < str(other)
+
+    def __repr__(self):
+        return "<!sequence>"
+
+    def withStage(self, stage):
+        return ValueSequence(self.source, self.stages + (stage,))
+
+    def iterate(self):
+        items = self.iterateSource()
+        for stage in self.stages:
+            items = stage(items)
+        return items
+
+    def iterateSource(self):
+        source = self.source
+        if source.isSequence():
+            return source.iterate()
+        if source.isSet():
+            return iter(source.getSortedItems())
+        if source.isInput():
+            return self.iterateLines()
+        return iter(source.getItems())
+
+    def iterateLines(self):
+        line = self.source.readLine()
+        while line is not None:
+            yield ValueString(line)
+            line = self.source.readLine()
+
+    def type(self):
+        return "sequence"
+
+    def asString(self):
+        return ValueString(str(self))
+
+    def asList(self):
+        result = ValueList()
+        result.value = list(self.iterate())
+        return result
+
+    def asSet(self):
+        result = ValueSet()
+        result.value = set(self.iterate())
+        return result
+
+    def isSequence(self):
+        return True
+
+
 @functools.total_ordering
 class ValueSet(Value):
+    __slots__ = ("value", "sortedItems")
+
     def __init__(self):
         self.value = set()
+        self.sortedItems = None
 
     def __hash__(self):
         return sum(hash(v) for v in self.value)
@@ -1430,11 +1861,14 @@ class ValueSet(Value):
         )
 
     def addItem(self, item):
-        self.value.add(item)
+        if item not in self.value:
+            self.sortedItems = None
+            self.value.add(item)
         return self
 
     def addItems(self, items):
         self.value = self.value | set(items)
+        self.sortedItems = None
         return self
 
     def hasItem(self, item):
@@ -1442,9 +1876,13 @@ class ValueSet(Value):
 
     def removeItem(self, item):
         self.value.remove(item)
+        self.sortedItems = None
 
     def getSortedItems(self):
-        return sorted(self.value)
+        items = self.sortedItems
+        if items is None or len(items) != len(self.value):
+            items = self.sortedItems = sorted(self.value)
+        return items
 
     def type(self):
         return "set"
@@ -1460,8 +1898,7 @@ class ValueSet(Value):
 
     def asList(self):
         result = ValueList()
-        for value in self.getSortedItems():
-            result.addItem(value)
+        result.value = list(self.getSortedItems())
         return result
 
     def asSet(self):
@@ -1473,6 +1910,13 @@ class ValueSet(Value):
 
 @functools.total_ordering
 class ValueString(Value):
+    # Strings can be changed in place with setChar, which changes their
+    # hash. Each change is counted in changes, so that indexes holding
+    # strings (see ValueList.hasItem) can tell that they are out of date.
+    __slots__ = ("value",)
+
+    changes = 0
+
     def __init__(self, value):
         self.value = value
 
@@ -1563,5 +2007,155 @@ class ValueString(Value):
     def asList(self):
         return ValueList().addItem(self)
 
+    def getLength(self):
+        return len(self.value)
+
+    def setChar(self, index, text):
+        s = self.value
+        self.value = s[0:index] + text + s[index + 1:]
+        ValueString.changes += 1
+
+    def slice(self, start, end):
+        return sliceString(self.value, start, end)
+
+    def concat(self, other):
+        if other.__class__ is ValueStringRope:
+            return other.prepend(self.value)
+        a = self.value
+        b = other.value
+        if len(a) + len(b) < ROPE_MIN_SIZE:
+            return ValueString(a + b)
+        return ValueStringRope([], 0, [a, b], 2, len(a) + len(b))
+
     def isString(self):
         return True
+
+
+def sliceString(s, start, end):
+    # python strings never change, so a slice shares the string, unless
+    # it is small or leaves more than half of it unused
+    if end - start < SLICE_MIN_SIZE or 2 * (end - start) < len(s):
+        return ValueString(s[start:end])
+    return ValueStringSlice(s, start, end)
+
+
+class ValueStringSlice(ValueString):
+    # The string returned by substr and slice dereferences. The
+    # substring is only created when it is accessed through value, so
+    # taking the rest of a string again and again costs nothing.
+    __slots__ = ("base", "start", "end", "text")
+
+    def __init__(self, base, start, end):
+        self.base = base
+        self.start = start
+        self.end = end
+        self.text = None
+
+    @property
+    def value(self):
+        if self.text is None:
+            self.text = self.base[self.start:self.end]
+            self.base = None
+        return self.text
+
+    @value.setter
+    def value(self, value):
+        self.text = value
+        self.base = None
+
+    def getLength(self):
+        if self.text is None:
+            return self.end - self.start
+        return len(self.text)
+
+    def slice(self, start, end):
+        if self.text is None:
+            return sliceString(self.base, self.start + start, self.start + end)
+        return super().slice(start, end)
+
+
+ROPE_MIN_SIZE = 256
+
+
+class ValueStringRope(ValueString):
+    # The string returned by concatenations of at least ROPE_MIN_SIZE
+    # characters, see concat. It keeps the concatenated parts in two
+    # lists, head holding the prepended parts in reverse order. Ropes
+    # created from each other share the lists, each one using only the
+    # first headCount and tailCount parts, so adding to the same string
+    # again and again takes constant time. A rope that is extended a
+    # second time copies its parts first. The parts are joined when the
+    # string is accessed through value, and the rope continues with the
+    # joined string as its only part.
+    __slots__ = ("head", "headCount", "tail", "tailCount", "length")
+
+    def __init__(self, head, headCount, tail, tailCount, length):
+        self.head = head
+        self.headCount = headCount
+        self.tail = tail
+        self.tailCount = tailCount
+        self.length = length
+
+    @property
+    def value(self):
+        if self.headCount or self.tailCount != 1:
+            parts = self.head[:self.headCount]
+            parts.reverse()
+            parts.extend(self.tail[:self.tailCount])
+            self.value = "".join(parts)
+        return self.tail[0]
+
+    @value.setter
+    def value(self, value):
+        self.head = []
+        self.headCount = 0
+        self.tail = [value]
+        self.tailCount = 1
+        self.length = len(value)
+
+    def getLength(self):
+        return self.length
+
+    def concat(self, other):
+        part = other.value
+        tail = self.tail
+        if len(tail) != self.tailCount:
+            tail = tail[:self.tailCount]
+        tail.append(part)
+        return ValueStringRope(
+            self.head,
+            self.headCount,
+            tail,
+            self.tailCount + 1,
+            self.length + len(part),
+        )
+
+    def prepend(self, part):
+        head = self.head
+        if len(head) != self.headCount:
+            head = head[:self.headCount]
+        head.append(part)
+        return ValueStringRope(
+            head,
+            self.headCount + 1,
+            self.tail,
+            self.tailCount,
+            self.length + len(part),
+        )
+
+
+INDEX_MIN_SIZE = 8
+
+INDEXED_TYPES = frozenset(
+    [
+        ValueBoolean,
+        ValueDate,
+        ValueDecimal,
+        ValueInt,
+        ValueNull,
+        ValuePattern,
+        ValueString,
+        ValueStringRope,
+        ValueStringSlice,
+    ]
+)
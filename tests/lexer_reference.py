@@ -0,0 +1,349 @@
+from ckl.lexer import KEYWORDS, SourcePos, Token
+
+
+def scan_reference(script, name="-"):
+    # the original character at a time scanner of ckl.lexer.Lexer,
+    # kept to check the current scanner against it
+    script = script + " "
+    tokens = []
+    fname = name
+
+    tempbuf = ""
+    token = ""
+    state = 0
+    pos = 0
+    line = 1
+    column = 0
+    updatepos = True
+    while pos < len(script):
+        ch = script[pos]
+        pos += 1
+        if updatepos:
+            if ch == "\n":
+                line += 1
+                column = 0
+            else:
+                column += 1
+        updatepos = True
+
+        if state == 0:  # Eat whitespace
+            if ch == "#":
+                state = 9
+            elif ch in "+-*%":
+                token += ch
+                state = 10
+            elif ch in "()[],;":
+                here = SourcePos(fname, line, column)
+                tokens.append(Token(ch, "interpunction", here))
+            elif ch == "/":
+                state = 5
+            elif ch in "<>=!":
+                token += ch
+                state = 2
+            elif ch == '"':
+                state = 3
+            elif ch == "'":
+                state = 4
+            elif ch == "0":
+                state = 70
+            elif ch in "0123456789":
+                token += ch
+                state = 7
+            elif ch not in " \t\r\n":
+                token += ch
+                state = 1
+
+        elif state == 1:  # normal token
+            if ch in "()+-*/%[]<>=,;!\"' \t\r\n#":
+                if token == "TRUE":
+                    here = SourcePos(fname, line, column - len("TRUE"))
+                    tokens.append(Token("TRUE", "boolean", here))
+                    token = ""
+                elif token == "FALSE":
+                    here = SourcePos(fname, line, column - len("TRUE"))
+                    tokens.append(Token("FALSE", "boolean", here))
+                    token = ""
+                elif token in KEYWORDS:
+                    here = SourcePos(fname, line, column - len(token))
+                    tokens.append(Token(token, "keyword", here))
+                    token = ""
+                elif token:
+                    here = SourcePos(fname, line, column - len(token))
+                    tokens.append(Token(token, "identifier", here))
+                    token = ""
+                pos -= 1
+                updatepos = False
+                state = 0
+            else:
+                token += ch
+                if token == "...":
+                    here = SourcePos(fname, line, column - len(token))
+                    tokens.append(Token(token, "interpunction", here))
+                    token = ""
+                    state = 0
+
+        elif state == 2:  # <>, <=, >=, ==, <<, >>, <<<, >>>, !>, <*, *>
+            if ch == "=":
+                token += ch
+                here = SourcePos(fname, line, column - len(token) - 1)
+                tokens.append(Token(token, "operator", here))
+                token = ""
+                state = 0
+            elif ch == ">" and token == "=":
+                token += ch
+                here = SourcePos(fname, line, column - len(token) - 1)
+                tokens.append(Token(token, "interpunction", here))
+                token = ""
+                state = 0
+            elif ch == ">" and token == "<":
+                here = SourcePos(fname, line, column - 1)
+                tokens.append(Token("<>", "operator", here))
+                token = ""
+                state = 0
+            elif ch == "<" and token == "<":
+                token += ch
+                state = 21
+            elif ch == ">" and token == ">":
+                token += ch
+                state = 21
+            elif ch == ">" and token == "!":
+                token += ch
+                here = SourcePos(fname, line, column - len(token) - 1)
+                tokens.append(Token("!>", "operator", here))
+                token = ""
+                state = 0
+            elif ch == "*" and token == "<":
+                here = SourcePos(fname, line, column - 1)
+                tokens.append(Token("<*", "interpunction", here))
+                token = ""
+                state = 0
+            else:
+                here = SourcePos(fname, line, column - len(token))
+                tokens.append(Token(token, "operator", here))
+                token = ""
+                pos -= 1
+                updatepos = False
+                state = 0
+
+        elif state == 21:  # <<, >>, <<<, >>>
+            if ch == "<" and token == "<<":
+                here = SourcePos(fname, line, column - 3)
+                tokens.append(Token("<<<", "interpunction", here))
+                token = ""
+                state = 0
+            elif ch == ">" and token == ">>":
+                here = SourcePos(fname, line, column - 3)
+                tokens.append(Token(">>>", "interpunction", here))
+                token = ""
+                state = 0
+            else:
+                here = SourcePos(fname, line, column - len(token))
+                tokens.append(Token(token, "interpunction", here))
+                token = ""
+                pos -= 1
+                updatepos = False
+                state = 0
+
+        elif state == 3:  # double quotes
+            if ch == '"':
+                here = SourcePos(fname, line, column - len(token) - 2 + 1)
+                tokens.append(Token(token, "string", here))
+                token = ""
+                state = 0
+            elif ch == "\\":
+                state = 31
+            else:
+                token += ch
+
+        elif state == 31:  # double quotes escapes
+            if ch == "n":
+                token += "\n"
+                state = 3
+            elif ch == "r":
+                token += "\r"
+                state = 3
+            elif ch == "t":
+                token += "\t"
+                state = 3
+            elif ch == "x":
+                state = 311
+            else:
+                token += ch
+                state = 3
+
+        elif state == 311:  # hex num first digit
+            tempbuf = ch
+            state = 312
+
+        elif state == 312:  # hex num second digit
+            tempbuf += ch
+            token += chr(int(tempbuf, 16))
+            tempbuf = ""
+            state = 3
+
+        elif state == 4:  # single quote
+            if ch == "'":
+                here = SourcePos(fname, line, column - len(token) - 2 + 1)
+                tokens.append(Token(token, "string", here))
+                token = ""
+                state = 0
+            elif ch == "\\":
+                state = 41
+            else:
+                token += ch
+
+        elif state == 41:  # single quotes escapes
+            if ch == "n":
+                token += "\n"
+                state = 4
+            elif ch == "r":
+                token += "\r"
+                state = 4
+            elif ch == "t":
+                token += "\t"
+                state = 4
+            elif ch == "x":
+                state = 411
+            else:
+                token += ch
+                state = 4
+
+        elif state == 411:  # hex num first digit
+            tempbuf = ch
+            state = 412
+
+        elif state == 412:  # hex num second digit
+            tempbuf += ch
+            token += chr(int(tempbuf, 16))
+            tempbuf = ""
+            state = 4
+
+        elif state == 5:  # check for pattern
+            if ch == "/":
+                token += "//"
+                state = 6
+            elif ch == "=":
+                here = SourcePos(fname, line, column - 1)
+                tokens.append(Token("/=", "operator", here))
+                state = 0
+            else:
+                here = SourcePos(fname, line, column - 1)
+                tokens.append(Token("/", "operator", here))
+                pos -= 1
+                updatepos = False
+                state = 0
+
+        elif state == 6:  # pattern
+            token += ch
+            if token.endswith("//"):
+                here = SourcePos(fname, line, column - len(token) - 4 + 1)
+                tokens.append(Token(token, "pattern", here))
+                token = ""
+                state = 0
+
+        elif state == 7:  # int or decimal
+            if ch == ".":
+                token += ch
+                state = 8
+            elif ch in "0123456789_":
+                token += ch
+            elif ch in "()[]<>=! \t\n\r+-*/%,;#":
+                here = SourcePos(fname, line, column - len(token))
+                token = token.replace("_", "")
+                tokens.append(Token(token, "int", here))
+                token = ""
+                pos -= 1
+                updatepos = False
+                state = 0
+            else:
+                token += ch
+                state = 1
+
+        elif state == 70:  # int, decimal or hex/binary int literal
+            if ch == "x":
+                state = 71
+                # hex int literal
+            elif ch == "b":
+                state = 72
+                # binary int literal
+            else:
+                token += "0"
+                pos -= 1
+                updatepos = False
+                state = 7
+
+        elif state == 71:  # hex int literal
+            if ch in "0123456789abcdefABCDEF_":
+                token += ch
+            elif ch in "()[]<>=! \t\n\r+-*/%,;#":
+                here = SourcePos(fname, line, column - len(token))
+                token = str(int(token.replace("_", ""), 16))
+                tokens.append(Token(token, "int", here))
+                token = ""
+                pos -= 1
+                updatepos = False
+                state = 0
+            else:
+                token += ch
+                state = 1
+
+        elif state == 72:  # binary int literal
+            if ch in "01_":
+                token += ch
+            elif ch in "()[]<>=! \t\n\r+-*/%,;#":
+                here = SourcePos(fname, line, column - len(token))
+                tokens.append(
+                    Token(str(int(token.replace("_", ""), 2)), "int", here)
+                )
+                token = ""
+                pos -= 1
+                updatepos = False
+                state = 0
+            else:
+                token += ch
+                state = 1
+
+        elif state == 8:  # decimal
+            if ch in "0123456789_":
+                token += ch
+            elif ch in "()[]<>=! \t\n\r+-*/%,;#":
+                here = SourcePos(fname, line, column - len(token))
+                token = token.replace("_", "")
+                tokens.append(Token(token, "decimal", here))
+                token = ""
+                pos -= 1
+                updatepos = False
+                state = 0
+            else:
+                token += ch
+                state = 1
+
+        elif state == 9:  # comment
+            if ch == "\n":
+                state = 0
+
+        elif state == 10:  # potentially composite assign or -> or *>
+            if ch == "=":
+                token += ch
+                here = SourcePos(fname, line, column)
+                tokens.append(Token(token, "operator", here))
+                token = ""
+                state = 0
+            elif token == "-" and ch == ">":
+                here = SourcePos(fname, line, column)
+                tokens.append(Token("->", "operator", here))
+                token = ""
+                state = 0
+            elif token == "*" and ch == ">":
+                here = SourcePos(fname, line, column)
+                tokens.append(Token("*>", "interpunction", here))
+                token = ""
+                state = 0
+            else:
+                here = SourcePos(fname, line, column)
+                tokens.append(Token(token, "operator", here))
+                token = ""
+                pos -= 1
+                updatepos = False
+                state = 0
+    return tokens
@@ -0,0 +1,16 @@
+import pytest
+
+
+def collect_tests(module):
+    return sorted(name for name in dir(module) if name.startswith("test_"))
+
+
+def rerun_tests(module, interpreter):
+    # returns a test which runs every test of module with the interpreter
+    # used by the tests of module replaced by the given one
+    @pytest.mark.parametrize("name", collect_tests(module))
+    def test(name, monkeypatch):
+        monkeypatch.setattr(module, "interpreter", interpreter)
+        getattr(module, name)()
+
+    return test
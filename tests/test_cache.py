@@ -0,0 +1,105 @@
+import os
+
+import ckl.cache
+from ckl.cache import (
+    ParseCache,
+    get_cache_key,
+    load_cached,
+    parse_script_cached,
+    store_cached,
+)
+from ckl.functions import get_none_environment
+from ckl.interpreter import Interpreter
+from ckl.parser import parse_script
+from ckl.values import TRUE, NULL
+
+
+SCRIPT = "def f(a, b = TRUE) if b then a + 1 else NULL; [f(1), f(1, FALSE)]"
+
+
+def test_cache_roundtrip(tmp_path, monkeypatch):
+    monkeypatch.setenv("CKL_CACHE_DIR", str(tmp_path))
+    first = parse_script_cached(SCRIPT, "test")
+    assert len(os.listdir(tmp_path)) == 1
+    second = parse_script_cached(SCRIPT, "test")
+    assert second is not first
+    assert repr(second) == repr(first)
+    interpreter = Interpreter(False, False)
+    result = interpreter.execute(second.evaluate, get_none_environment())
+    assert repr(result) == "[2, NULL]"
+
+
+def test_cache_singletons(tmp_path):
+    path = str(tmp_path / "x.cklc")
+    assert store_cached(path, "key", [TRUE, NULL], "test")
+    assert load_cached(path, "key", "test") == [TRUE, NULL]
+    values = load_cached(path, "key", "test")
+    assert values[0] is TRUE and values[1] is NULL
+
+
+def test_cache_filename_substituted(tmp_path, monkeypatch):
+    monkeypatch.setenv("CKL_CACHE_DIR", str(tmp_path))
+    parse_script_cached("a + b", "first")
+    node = parse_script_cached("a + b", "second")
+    assert node.pos.filename == "second"
+
+
+def test_cache_stale_key_ignored(tmp_path):
+    path = str(tmp_path / "x.cklc")
+    store_cached(path, get_cache_key("1 + 2"), parse_script("1 + 2"), "-")
+    assert load_cached(path, get_cache_key("1 + 3"), "-") is None
+    assert load_cached(path, get_cache_key("1 + 2"), "-") is not None
+
+
+def test_cache_next_to_module(tmp_path, monkeypatch):
+    monkeypatch.setenv("CKL_CACHE_DIR", "")
+    filepath = str(tmp_path / "mod.ckl")
+    parse_script_cached("def x = 1", "mod:mod", filepath)
+    assert os.listdir(tmp_path) == ["mod.cklc"]
+
+
+def test_cache_untrusted_file_ignored(tmp_path):
+    path = str(tmp_path / "x.cklc")
+    store_cached(path, "key", parse_script("1 + 2"), "-")
+    assert not os.stat(path).st_mode & 0o022
+    assert load_cached(path, "key", "-") is not None
+    os.chmod(path, 0o666)
+    assert load_cached(path, "key", "-") is None
+
+
+def test_cache_dir_pruned(tmp_path, monkeypatch):
+    monkeypatch.setenv("CKL_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(ckl.cache, "CACHE_MAX_FILES", 2)
+    stale = tmp_path / ("0" * 16 + "-" + "1" * 64 + ".cklc")
+    stale.write_bytes(b"")
+    unnamed = tmp_path / ("2" * 64 + ".cklc")
+    unnamed.write_bytes(b"")
+    other = tmp_path / "notes.txt"
+    other.write_text("keep")
+    for script in ["1 + 2", "1 + 3", "1 + 4"]:
+        parse_script_cached(script, "test")
+    names = sorted(os.listdir(tmp_path))
+    assert len(names) == 3 and "notes.txt" in names
+    assert stale.name not in names and unnamed.name not in names
+
+
+def test_parse_cache_lru():
+    cache = ParseCache(2)
+    first = cache.parse("1 + 2", "test")
+    assert cache.parse("1 + 2", "test") is first
+    assert cache.parse("1 + 2", "other") is not first
+    cache.parse("3 + 4", "test")
+    assert cache.parse("1 + 2", "test") is not first
+    assert (cache.hits, cache.misses, len(cache.entries)) == (1, 4, 2)
+    cache.resize(0)
+    cache.parse("1 + 2", "test")
+    assert (cache.hits, cache.misses, len(cache.entries)) == (1, 5, 0)
+
+
+def test_parse_cache_fresh_strings():
+    cache = ParseCache(2)
+    environment = get_none_environment()
+    script = "def s = 'abc'; def t = s[0]; s[0] = 'x'; [t, s]"
+    for _ in range(2):
+        result = cache.parse(script, "test").evaluate(environment)
+        assert repr(result) == "['a', 'xbc']"
@@ -0,0 +1,33 @@
+import test_infotests
+import test_interpreter
+from ckl.functions import get_none_environment
+from ckl.interpreter import Interpreter
+from rerun import rerun_tests
+
+
+class CompilingInterpreter(Interpreter):
+    def interpret(self, script, filename, environment=None):
+        return self.compile(script, filename).run(environment)
+
+
+test_interpreter_compiled = rerun_tests(
+    test_interpreter, CompilingInterpreter(False, False)
+)
+test_infotests_compiled = rerun_tests(
+    test_infotests, CompilingInterpreter(False, True)
+)
+
+
+def test_compiled_script_rerun():
+    interpreter = Interpreter(False, False)
+    script = interpreter.compile("def x = 0; for i in range(10) x += i; x")
+    assert repr(script.run(get_none_environment())) == "45"
+    assert repr(script.run(get_none_environment())) == "45"
+
+
+def test_compiled_lambda_body():
+    interpreter = Interpreter(False, False)
+    script = interpreter.compile(
+        "def f(n) if n < 2 then n else f(n - 1) + f(n - 2); f(10)"
+    )
+    assert repr(script.run(get_none_environment())) == "55"
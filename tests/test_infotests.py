@@ -778,6 +778,12 @@ def test_is_odd_2():
 def test_is_positive_1():
     run_test('is_positive(1)', 'TRUE')
 
+def test_is_sequence_1():
+    run_test('is_sequence(sequence([1, 2, 3]))', 'TRUE')
+
+def test_is_sequence_2():
+    run_test('is_sequence([1, 2, 3])', 'FALSE')
+
 def test_is_set_1():
     run_test('is_set(set([1, 2, 3]))', 'TRUE')
 
@@ -832,6 +838,18 @@ def test_last_2():
 def test_last_n_1():
     run_test('range(100) !> last_n(5)', '[95, 96, 97, 98, 99]')
 
+def test_lazy_filter_1():
+    run_test('list(lazy_filter([1, 2, 3, 4], fn(x) x % 2 == 0))', '[2, 4]')
+
+def test_lazy_flatten_1():
+    run_test('list(lazy_flatten([[1, 2], 3, [4]]))', '[1, 2, 3, 4]')
+
+def test_lazy_map_1():
+    run_test('list(lazy_map([1, 2, 3], fn(x) 2 * x))', '[2, 4, 6]')
+
+def test_lazy_unique_1():
+    run_test('list(lazy_unique([1, 4, 2, 4, 1]))', '[1, 4, 2]')
+
 def test_lcm_1():
     run_test('lcm(2 * 2 * 2 * 3, 2 * 2 * 3 * 3)', '72')
 
@@ -1030,6 +1048,9 @@ def test_pairs_2():
 def test_parse_1():
     run_test("parse('2+3')", "'(add 2, 3)'")
 
+def test_parse_cache_info_1():
+    run_test('set(parse_cache_info())', "<<'hits', 'maxsize', 'misses', 'size'>>")
+
 def test_parse_date_1():
     run_test("parse_date('20170102')", "'20170102000000'")
 
@@ -1138,6 +1159,9 @@ def test_readln_1():
 def test_reduce_1():
     run_test('reduce([1, 2, 3, 4], add)', '10')
 
+def test_reduce_2():
+    run_test('sequence([1, 2, 3, 4]) !> map_list(fn(x) x * x) !> reduce(add)', '30')
+
 def test_remove_1():
     run_test('remove([1, 2, 3, 4], 3)', '[1, 2, 4]')
 
@@ -1249,6 +1273,15 @@ def test_sample_2():
 def test_sample_3():
     run_test("sample('abc', 3)", "<<'a', 'b', 'c'>>")
 
+def test_sequence_1():
+    run_test('list(sequence([1, 2, 3]))', '[1, 2, 3]')
+
+def test_sequence_2():
+    run_test('list(sequence(<<3, 1, 2>>))', '[1, 2, 3]')
+
+def test_sequence_3():
+    run_test('type(sequence([]))', "'sequence'")
+
 def test_set_1():
     run_test('set([1, 2, 3])', '<<1, 2, 3>>')
 
@@ -1270,6 +1303,12 @@ def test_sorted_1():
 def test_sorted_2():
     run_test('sorted([6, 2, 5, 3, 1, 4])', '[1, 2, 3, 4, 5, 6]')
 
+def test_sorted_3():
+    run_test('sorted([1, 3, 2], reverse = TRUE)', '[3, 2, 1]')
+
+def test_sorted_4():
+    run_test("sorted(['a', 'bbb', 'cc'], key = length)", "['a', 'cc', 'bbb']")
+
 def test_split_1():
     run_test("split('a,b,c', //,//)", "['a', 'b', 'c']")
 
@@ -1297,6 +1336,15 @@ def test_sprintf_5():
 def test_sprintf_6():
     run_test("require Math; sprintf('{0#.4}', Math->PI)", "'3.1416'")
 
+def test_sprintf_7():
+    run_test("def a = 5; sprintf('{a}-{0}', 1)", "'5-1'")
+
+def test_sprintf_8():
+    run_test("sprintf('[{0}]', NULL)", "'[]'")
+
+def test_sprintf_9():
+    run_test("sprintf('{0}', [1, 2])", "'[1, 2]'")
+
 def test_sqrt_1():
     run_test('sqrt(4)', '2.0')
 
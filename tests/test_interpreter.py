@@ -1,5 +1,9 @@
+import os
+import tempfile
+
 from ckl.interpreter import Interpreter
 from ckl.functions import get_none_environment
+from ckl.values import FileInput
 
 interpreter = Interpreter(False, False)
 
@@ -234,6 +238,300 @@ def test_inlist_6():
     interpreter_test("def feld1 = 4; feld1 in [1, 2, 3]", "FALSE")
 
 
+def test_inlist_indexed():
+    interpreter_test(
+        "def f(x) x in [1, 2, 3, 4, 5, 6, 7, 8.5, 'a', NULL]; "
+        "[f(2.0), f(8.5), f(8), f('a'), f(NULL), f(TRUE), f([1])]",
+        "[TRUE, TRUE, FALSE, TRUE, TRUE, FALSE, FALSE]",
+    )
+
+
+def test_inlist_indexed_mutated():
+    interpreter_test(
+        "def a = [1, 2, 3, 4, 5, 6, 7, 8]; def r = []; "
+        "def t(x) do for i in range(2) do r += x in a; end; end; "
+        "t(9); append(a, 9); t(9); a[8] = 10; t(9); t(10); "
+        "delete_at(a, 8); t(10); insert_at(a, 0, 10); t(10); "
+        "remove(a, 10); t(10); r",
+        "[FALSE, FALSE, TRUE, TRUE, FALSE, FALSE, TRUE, TRUE, "
+        "FALSE, FALSE, TRUE, TRUE, FALSE, FALSE]",
+    )
+
+
+def test_inlist_indexed_string_changed():
+    interpreter_test(
+        "def l = ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h', 'i']; "
+        "def r = ['a' in l, 'a' in l]; def s = l[0]; s[0] = 'z'; "
+        "r += ['z' in l, 'a' in l, 'z' in l]; r",
+        "[TRUE, TRUE, TRUE, FALSE, TRUE]",
+    )
+
+
+def test_range_lazy():
+    interpreter_test(
+        "def r = range(100000000); def n = 0; "
+        "for i in r do n += i; if i == 4 then break; end; "
+        "[n, length(r), r[-1], r[7], 99999999 in r, 100000000 in r]",
+        "[10, 100000000, 99999999, 7, TRUE, FALSE]",
+    )
+
+
+def test_range_lazy_collections():
+    interpreter_test(
+        "[sum(range(101)), [x * 2 for x in range(4)], "
+        "[a + b for a in range(2) for b in range(10, 30, 10)], "
+        "<<x for x in range(6, 0, -2)>>, range(3, 0), range(5, step = 0)]",
+        "[5050, [0, 2, 4, 6], [10, 20, 11, 21], <<2, 4, 6>>, [], []]",
+    )
+
+
+def test_range_materialized():
+    interpreter_test(
+        "def r = range(3); def s = range(3); r !> append(7); s[1] = 5; "
+        "def n = 0; for i in r n += i; [r, s, length(r), 7 in r, 1 in s, n]",
+        "[[0, 1, 2, 7], [0, 5, 2], 4, TRUE, FALSE, 10]",
+    )
+
+
+def test_range_iteration_live():
+    interpreter_test(
+        "def r = range(3); def s = []; "
+        "for i in r do s += [i]; if i < 2 then r !> append(10 + i); end; "
+        "def q = range(2); def t = [];"
+        "for i in q do t += [i]; if i == 1 then q !> append(5); end; "
+        "[s, t]",
+        "[[0, 1, 2, 10, 11], [0, 1, 5]]",
+    )
+
+
+def test_small_ints_shared():
+    interpreter_test(
+        "def a = 1 + 1; def b = 3 - 1; a += 5; b *= 2; "
+        "def r = range(5); def x = r[2]; x += 1; "
+        "[a, b, 1 + 1, x, r, 2000 * 3 - 1]",
+        "[7, 4, 2, 3, [0, 1, 2, 3, 4], 5999]",
+    )
+
+
+def test_small_ints_info():
+    interpreter_test(
+        "def x = 1; \"doc\" def a = x + 1; def b = x + 1; "
+        "\"one\" def c = x; [info(a), info(b), info(c), a + c]",
+        "['doc', '', 'one', 3]",
+    )
+
+
+def test_list_slices():
+    interpreter_test(
+        "def a = [x for x in range(200)]; def b = sublist(a, 10); "
+        "def c = b[100 to 200]; b[0] = -1; a[110] = -2; c !> append(7); "
+        "[b[0], c[0], a[10], length(c), c[-1], length(b), b[100], "
+        "sublist(c, 85, 88), sublist(c, 50, 10), sum(sublist(b, 180))]",
+        "[-1, 110, 10, 91, 7, 190, 110, [195, 196, 197], [], 1945]",
+    )
+
+
+def test_list_slice_iteration_live():
+    interpreter_test(
+        "def a = [x for x in range(200)]; def b = sublist(a, 100); "
+        "def s = []; for i in b do s += [i]; "
+        "if i < 102 then b !> append(1000 + i); end; "
+        "[length(s), sublist(s, 99), a[-1]]",
+        "[102, [199, 1100, 1101], 199]",
+    )
+
+
+def test_string_slices():
+    interpreter_test(
+        "def s = '0123456789' * 20; def t = substr(s, 5); "
+        "def u = t[10 to -10]; t[0] = 'x'; "
+        "[length(t), substr(t, 0, 3), substr(u, 0, 3), length(u), "
+        "s[5 to 8], u == substr(s, 15, 190), substr('abc', -5)]",
+        "[195, 'x67', '567', 175, '567', TRUE, 'bc']",
+    )
+
+
+def test_chunks_slices():
+    interpreter_test(
+        "def c = chunks([x for x in range(1000)], 300); "
+        "def d = chunks('ab' * 100, 150); "
+        "[length(c), length(c[3]), c[3][0], c[1][0], c[2][-1], "
+        "length(d[0]), length(d[1]), d[1] == 'ab' * 25]",
+        "[4, 100, 900, 300, 899, 150, 50, TRUE]",
+    )
+
+
+def test_string_ropes():
+    interpreter_test(
+        "def s = ''; for i in range(1000) s += 'x'; "
+        "def t = s; s += 'y'; def u = t + 'z'; def v = t + 'w' + 'v'; "
+        "def r = '-' + t; r[0] = '+'; "
+        "[length(s), length(t), length(u), s[-1], u[-1], t[-1], "
+        "substr(v, 999), r[0], substr(r, 0, 2), length(r), t == s]",
+        "[1001, 1000, 1001, 'y', 'z', 'x', 'xwv', '+', '+x', 1001, FALSE]",
+    )
+
+
+def test_string_ropes_prepend():
+    interpreter_test(
+        "require String; def r = String->reverse('abc' * 200); "
+        "def a = '1' * 300; def b = '2' + a; def c = '3' + a; "
+        "[length(r), substr(r, 0, 4), substr(r, 596), "
+        "substr(b, 0, 2), substr(c, 0, 2), length(c)]",
+        "[600, 'cbac', 'acba', '21', '31', 301]",
+    )
+
+
+def test_join_collections():
+    interpreter_test(
+        "[join(<<3, 1, 2>>, ','), join(<<<'b' => 2, 'a' => 1>>>, ','), "
+        "join(sequence(range(3)), '-'), join(['a', 1, 2.5, TRUE]), "
+        "join([x for x in range(300)], '') !> length()]",
+        "['1,2,3', '1,2', '0-1-2', 'a 1 2.5 TRUE', 790]",
+    )
+
+
+def test_list_accumulate():
+    interpreter_test(
+        "def x = []; for i in range(3) x += [i]; "
+        "def n = 3; while n < 5 do x = x + n; n += 1; end; "
+        "x += <<5>>; x",
+        "[0, 1, 2, 3, 4, 5]",
+    )
+    interpreter_test(
+        "def x = []; for i in range(3) x += [i]; def y = x; x += [3]; "
+        "def l = [x]; x = x + [4]; def z = (x += [5]); x += [6]; "
+        "def f(a) do a += [7]; a end; [x, y, l, z, f(x), x]",
+        "[[0, 1, 2, 3, 4, 5, 6], [0, 1, 2], [[0, 1, 2, 3]], "
+        "[0, 1, 2, 3, 4, 5], [0, 1, 2, 3, 4, 5, 6, 7], "
+        "[0, 1, 2, 3, 4, 5, 6]]",
+    )
+
+
+def test_list_accumulate_aliased():
+    interpreter_test(
+        "def x = [1]; eval('def y = x'); x += [2]; "
+        "def keep = []; def z = []; for i in range(3) do keep += [z]; "
+        "z += [i] end; def f(a) do def b = a; for i in range(2) b += [i]; "
+        "b end; def c = [5]; [x, y, keep, f(c), c]",
+        "[[1, 2], [1], [[], [0], [0, 1]], [5, 0, 1], [5]]",
+    )
+    interpreter_test(
+        "def f(g) do def x = [1]; g('def y = x'); x += [2]; [x, y] end; "
+        "f(eval)",
+        "[[1, 2], [1]]",
+    )
+
+
+def test_template_fresh_strings():
+    interpreter_test(
+        "def f() s(\"{def q = 'abc'; def t = q[1]; q[1] = 'Z'; t}\"); "
+        "def g() sprintf(\"{def q = 'abc'; def t = q[0]; q[0] = 'Z'; t}\"); "
+        "[f(), f(), g(), g()]",
+        "['b', 'b', 'a', 'a']",
+    )
+
+
+def test_list_accumulate_template():
+    interpreter_test(
+        "def f() do def x = []; def y = NULL; s('{y = x}'); x += [1]; "
+        "y end; def g() do def x = []; def y = NULL; "
+        "sprintf('{y = x}'); x = x + [1]; y end; [f(), g()]",
+        "[[], []]",
+    )
+
+
+def test_list_accumulate_closure():
+    interpreter_test(
+        "def x = [1]; def get() x; def push(v) x += [v]; "
+        "def r = get(); push(2); def s = push(3); push(4); [r, s, x, [0] * 3]",
+        "[[1], [1, 2, 3], [1, 2, 3, 4], [0, 0, 0]]",
+    )
+
+
+def test_sorted_views_cached():
+    interpreter_test(
+        "def s = <<3, 1, 2>>; def m = <<<'b' => 1, 'a' => 2>>>; def r = []; "
+        "for i in range(2) r += [[x for x in s], [k for k in keys m]]; "
+        "s !> append(0); remove(s, 3); m['c'] = 0; m['a'] = 5; "
+        "remove(m, 'b'); r += [[x for x in s], [k for k in keys m], list(s)]; "
+        "s += 7; m['0'] = 1; [r, s, m, join(m, ',')]",
+        "[[[1, 2, 3], ['a', 'b'], [1, 2, 3], ['a', 'b'], [0, 1, 2], "
+        "['a', 'c'], [0, 1, 2]], <<0, 1, 2, 7>>, "
+        "<<<'0' => 1, 'a' => 5, 'c' => 0>>>, '1,5,0']",
+    )
+
+
+def test_string_iteration_chars():
+    interpreter_test(
+        "def s = 'abca'; def t = ''; "
+        "for c in s do c[0] = 'x'; t += c; end; [s, t, s[0], s[3]]",
+        "['abca', 'xxxx', 'a', 'a']",
+    )
+
+
+def test_sequence_pipeline():
+    interpreter_test(
+        "require List unqualified; "
+        "def s = sequence([1, 2, 3, 4, 5, 6, [7, 8], 8]); "
+        "[s !> flatten() !> filter(fn(x) x % 2 == 0) "
+        "!> map_list(fn(x) x * 10) !> list(), "
+        "s !> flatten() !> unique() !> reduce(add), "
+        "sequence(['one', 'two']) !> grep(//e//) !> list(), "
+        "[x * 2 for x in sequence(<<2, 1>>)], type(s)]",
+        "[[20, 40, 60, 80, 80], 36, ['one'], [2, 4], 'sequence']",
+    )
+
+
+def test_sequence_lines():
+    interpreter_test(
+        "require List unqualified; require IO unqualified; "
+        "def n = 0; "
+        "def s = sequence(str_input('a\\nbb\\n\\nccc')) "
+        "!> map_list(length); "
+        "for x in s n += x; "
+        "[n, process_lines(sequence([1, 2]), fn(line) line), "
+        "list(s)]",
+        "[6, 2, []]",
+    )
+
+
+def test_sequence_file_input():
+    with tempfile.TemporaryDirectory() as tempdir:
+        path = os.path.join(tempdir, "lines.txt")
+        with open(path, "w", encoding="utf-8") as outfile:
+            for i in range(1000):
+                outfile.write(f"{i}\n")
+        interpreter_test(
+            "require List unqualified; require IO unqualified; "
+            f"def f = file_input({path!r}); "
+            "def s = sequence(f) !> map_list(int) "
+            "!> filter(fn(x) x % 10 == 0); "
+            "def result = reduce(s, add); close(f); result",
+            "49500",
+        )
+
+
+def test_file_input_closed():
+    with tempfile.TemporaryDirectory() as tempdir:
+        path = os.path.join(tempdir, "lines.txt")
+        with open(path, "w", encoding="utf-8") as outfile:
+            outfile.write("a\nb")
+        inp = FileInput(path, "UTF-8")
+        fd = inp.fd
+        assert [inp.readLine(), inp.readLine(), inp.readLine()] == [
+            "a", "b", None
+        ]
+        assert fd.closed and inp.read() is None
+        with FileInput(path, "UTF-8") as inp:
+            fd = inp.fd
+            assert inp.read() == "a"
+        assert fd.closed and inp.readAll() is None
+        inp = FileInput(path, "UTF-8")
+        assert inp.readAll() == "a\nb" and inp.fd is None
+        inp.close()
+
+
 def test_IsZero1():
     interpreter_test("1 is zero", "FALSE")
 
@@ -609,6 +907,33 @@ def test_MapComprehensionWithCondition():
     )
 
 
+
+def test_ComprehensionConditionBeforeValue():
+    interpreter_test(
+        "[[10 / x for x in [0, 2, 5] if x != 0], "
+        "<<<x => 10 / x for x in [0, 2, 5] if x != 0>>>, "
+        "[10 / (x + y) for x in [0, 1] also for y in [0, 1] if x != 0], "
+        "<<10 / x for x in <<0, 2, 5>> if x != 0>>]",
+        "[[5, 2], <<<2 => 5, 5 => 2>>>, [5], <<2, 5>>]",
+    )
+
+
+def test_ComprehensionConditionNotBoolean():
+    interpreter_test(
+        "do [x for x in [1, 2] if 1]; catch all 'caught'; end",
+        "'caught'",
+    )
+
+
+def test_SetComprehensionUnordered():
+    interpreter_test(
+        "[<<x % 3 for x in <<5, 1, 2, 4, 3>> if x > 1>>, "
+        "<<x * y for x in <<3, 1, 2>> for y in <<1, 2>> if x != y>>, "
+        "<<k for k in keys <<<'b' => 1, 'a' => 2>>> >>]",
+        "[<<0, 1, 2>>, <<2, 3, 6>>, <<'a', 'b'>>]",
+    )
+
+
 def test_FuncRange1():
     interpreter_test("range()", "[]")
 
@@ -1275,3 +1600,161 @@ def test_slice_list5():
 
 def test_slice_list6():
     interpreter_test("range(6)[-99 to -1]", "[0, 1, 2, 3, 4]")
+
+
+def test_lexical_closure():
+    interpreter_test(
+        "def f(a) do def b = 2; fn(c) a + b + c; end; f(1)(3)", "6"
+    )
+
+
+def test_lexical_shadowing():
+    interpreter_test(
+        "def a = 1; def f(a) do def g() a; g(); end; [a, f(2)]", "[1, 2]"
+    )
+
+
+def test_lexical_define_after_use():
+    interpreter_test(
+        "def f() do def g() x; def x = 5; g(); end; f()", "5"
+    )
+
+
+def test_lexical_global_in_loop():
+    interpreter_test(
+        "def x = 1; def f() do def r = 0; "
+        "while r < 3 do r += x; end; r; end; f()",
+        "3",
+    )
+
+
+def test_lexical_unbound_local():
+    interpreter_test(
+        "def x = 'g'; def f(b) do if b then do def x = 'l'; end; x; end; "
+        "[f(TRUE), f(FALSE)]",
+        "['l', 'g']",
+    )
+
+
+def test_operator_shadowed_global():
+    interpreter_test("def add(a, b) a * b; 3 + 4", "12")
+
+
+def test_operator_shadowed_local():
+    interpreter_test(
+        "def f(less) 1 < 2; [f(fn(a, b) 'x'), 1 < 2]", "['x', TRUE]"
+    )
+
+
+def test_operator_rebound_native():
+    interpreter_test("def sub = add; 3 - 4", "7")
+
+
+def test_operator_mixed_numeric():
+    interpreter_test(
+        "[1 + 2.5, 7 / 2, 7.0 / 2, 7 % 3, 1 == 1.0]", "[3.5, 3, 3.5, 1, TRUE]"
+    )
+
+
+def test_call_site_changing_callee():
+    interpreter_test(
+        "def r = []; "
+        "for f in [fn(a, b) a, fn(b, a) a, fn(a, b, c = 3) c] "
+        "do r += f(1, 2); end; r",
+        "[1, 2, 3]",
+    )
+
+
+def test_call_site_named_args_rebinding():
+    interpreter_test(
+        "def r = []; "
+        "for f in [fn(a, b = 2) a - b, fn(b, c, a = 0) a * 10 + c] "
+        "do r += f(5, b = 1); end; r",
+        "[4, 5]",
+    )
+
+
+def test_sorted_custom_cmp():
+    interpreter_test(
+        "sorted([1, 3, 2], cmp = fn(a, b) compare(b, a))", "[3, 2, 1]"
+    )
+
+
+def test_sorted_key_stable():
+    interpreter_test(
+        "sorted(['bb', 'a', 'cc', 'd'], key = length)",
+        "['a', 'd', 'bb', 'cc']",
+    )
+
+
+def test_sorted_key_cmp_reverse():
+    interpreter_test(
+        "sorted([[1, 'x'], [2, 'y'], [1, 'z']], "
+        "cmp = fn(a, b) compare(b, a), key = fn(e) e[0], reverse = TRUE)",
+        "[[1, 'x'], [1, 'z'], [2, 'y']]",
+    )
+
+
+def test_s_template_reused():
+    interpreter_test(
+        "[s('{n#-3}|{n * 2#03}') for n in range(3)]",
+        "['0  |000', '1  |002', '2  |004']",
+    )
+
+
+def test_s_substitution_not_rescanned():
+    interpreter_test("def a = '{b}'; def b = 1; s('{a}{b}')", "'{b}1'")
+
+
+def test_sprintf_quoted_and_braced_args():
+    interpreter_test(
+        "sprintf('{1}{0}{1} {2}', \"it's\", '{0}', 2 * 3)",
+        "'{0}it\\'s{0} 6'",
+    )
+
+
+def test_tail_call_deep_recursion():
+    interpreter_test(
+        "def sum_to(n, acc = 0) "
+        "if n == 0 then acc else sum_to(n - 1, acc + n); "
+        "sum_to(20000)",
+        "200010000",
+    )
+
+
+def test_tail_call_mutual_recursion():
+    interpreter_test(
+        "def even(n) if n == 0 then TRUE else odd(n - 1); "
+        "def odd(n) if n == 0 then FALSE else even(n - 1); "
+        "[even(10001), odd(10001)]",
+        "[FALSE, TRUE]",
+    )
+
+
+def test_tail_call_return():
+    interpreter_test(
+        "def count(n, acc = []) do "
+        "  for i in [1, 2] do if n == 0 then return acc; end; "
+        "  return count(n - 1, acc + n); "
+        "end; "
+        "length(count(5000))",
+        "5000",
+    )
+
+
+def test_tail_call_eval_body():
+    interpreter_test(
+        "def x = 1; def g(y) y + 1; def f(x) g(x); "
+        "def h(x) do if x > 0 then return g(x); x; end; "
+        "[eval(body(f)), eval(body(h)), f(3)]",
+        "[2, return 2, 4]",
+    )
+
+
+def test_tail_call_in_catch_block():
+    interpreter_test(
+        "def g(x) error 'boom'; "
+        "def f(x) do g(x); catch all 'caught'; end; "
+        "f(1)",
+        "'caught'",
+    )
@@ -0,0 +1,65 @@
+import io
+
+import pytest
+
+import ckl.lazy
+from ckl.functions import get_base_environment
+from ckl.interpreter import Interpreter
+from ckl.lazy import LazyModule
+from ckl.values import NULL
+
+
+def describe_environment(environment):
+    return [
+        (symbol, repr(environment.get(symbol)))
+        for symbol in environment.getLocalSymbols()
+    ]
+
+
+@pytest.mark.parametrize("secure", [True, False])
+@pytest.mark.parametrize("legacy", [True, False])
+def test_lazy_matches_eager(monkeypatch, secure, legacy):
+    monkeypatch.setattr(ckl.lazy, "LAZY_MODULES", False)
+    eager = describe_environment(get_base_environment(secure, legacy))
+    monkeypatch.setattr(ckl.lazy, "LAZY_MODULES", True)
+    lazy = describe_environment(get_base_environment(secure, legacy))
+    assert lazy == eager
+
+
+def test_lazy_modules_deferred():
+    environment = get_base_environment(True, False)
+    modules = environment.getModules()
+    assert any(isinstance(module, LazyModule) for module in modules.values())
+    environment.get("abs")
+    assert not isinstance(modules["Math"], LazyModule)
+
+
+def test_lazy_symbol_identity():
+    interpreter = Interpreter(True, False)
+    src = "require Math; [Math->abs == abs, abs(-2)]"
+    result = interpreter.interpret(src, "test")
+    assert repr(result) == "[TRUE, 2]"
+
+
+def test_base_environment_shared():
+    first = get_base_environment(True, False)
+    second = get_base_environment(True, False)
+    assert first is not second
+    first.get("abs")
+    assert isinstance(second.getModules()["Math"], LazyModule)
+    assert first.get("abs") is not second.get("abs")
+    first.put("abs", NULL)
+    assert second.get("abs").isFunc()
+
+
+def test_base_environment_separate_output():
+    first = Interpreter(True, False)
+    second = Interpreter(True, False)
+    firstOutput = io.StringIO()
+    secondOutput = io.StringIO()
+    first.setStandardOutput(firstOutput)
+    second.setStandardOutput(secondOutput)
+    first.interpret("println('first')", "test")
+    second.interpret("println('second')", "test")
+    assert firstOutput.getvalue() == "first\n"
+    assert secondOutput.getvalue() == "second\n"
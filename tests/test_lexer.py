@@ -1,4 +1,13 @@
+import os
+import pickle
+import random
+
+import ckl
+import ckl.lexer
 from ckl.lexer import Lexer
+from ckl.parser import parse_script
+
+from lexer_reference import scan_reference
 
 
 def test_simple():
@@ -221,3 +230,92 @@ def test_ops():
             == "[+ (operator), - (operator), * (operator), "
             "/ (operator), % (operator)] @ 0"
     )
+
+
+FUZZ_FRAGMENTS = [
+    " ", "\n", "\t", "\r\n", "a", "x1", "_", ".", "..", "...", "0", "7",
+    "12_3", "0x", "0b", "1f", "FF", "e", "TRUE", "FALSE", "if", "do",
+    "end", "fn", "'", '"', "\\", "\\n", "\\x4", "1", "/", "//", "#",
+    "+", "-", "*", "%", "=", "<", ">", "!", "(", ")", "[", "]", ",", ";",
+    "{", "}", ":", "ä", "\\x", "abc def",
+]
+
+
+def lexer_tokens(tokens):
+    return [
+        (t.value, t.type, t.pos.filename, t.pos.line, t.pos.column)
+        for t in tokens
+    ]
+
+
+def lexer_result(scanner, script):
+    try:
+        return lexer_tokens(scanner(script))
+    except ValueError:
+        return "ValueError"
+
+
+def test_lexer_matches_reference():
+    rnd = random.Random(4711)
+    for _ in range(3000):
+        script = "".join(
+            rnd.choice(FUZZ_FRAGMENTS) for _ in range(rnd.randint(0, 30))
+        )
+        assert lexer_result(
+            lambda s: Lexer(s, "fuzz").scan().tokens, script
+        ) == lexer_result(
+            lambda s: scan_reference(s, "fuzz"), script
+        ), repr(script)
+
+
+def test_lexer_modules_match_reference():
+    modules = os.path.join(os.path.dirname(ckl.__file__), "modules")
+    for filename in sorted(os.listdir(modules)):
+        if not filename.endswith(".ckl"):
+            continue
+        with open(os.path.join(modules, filename), encoding="utf-8") as f:
+            script = f.read()
+        assert lexer_tokens(Lexer(script, filename).scan().tokens) == (
+            lexer_tokens(scan_reference(script, filename))
+        )
+
+
+def test_lexer_tokens_on_demand():
+    lexer = Lexer("def a = 1;\n  a -> 'x'\n\n# c\nb", "demand").scan()
+    assert len(lexer.positions) == 0
+    expected = lexer_tokens(lexer.tokens)
+    walked = []
+    while lexer.hasNext():
+        pos = lexer.getPosNext()
+        token = lexer.next()
+        assert token.pos is pos
+        walked.append(token)
+    assert lexer_tokens(walked) == expected
+    assert lexer.getPos() is walked[-1].pos
+
+
+def test_lexer_window_bounded(monkeypatch):
+    monkeypatch.setattr(ckl.lexer, "LEXER_LOOKAHEAD", 2)
+    monkeypatch.setattr(ckl.lexer, "LEXER_WINDOW", 16)
+    script = "\n".join(f"def a{i} = [{i}, 'x{i}'];" for i in range(500))
+    expected = lexer_tokens(scan_reference(script, "window"))
+    lexer = Lexer(script, "window").scan()
+    walked = []
+    while lexer.hasNext():
+        lexer.peekn(3, ";", "interpunction")
+        walked.append(lexer.next())
+        assert len(lexer.values) <= 16 + 8 + 4
+    assert lexer_tokens(walked) == expected
+
+
+def test_lexer_window_parse_modules(monkeypatch):
+    modules = os.path.join(os.path.dirname(ckl.__file__), "modules")
+    scripts = []
+    for filename in sorted(os.listdir(modules)):
+        if filename.endswith(".ckl"):
+            with open(os.path.join(modules, filename), encoding="utf-8") as f:
+                scripts.append(f.read())
+    expected = [pickle.dumps(parse_script(script)) for script in scripts]
+    monkeypatch.setattr(ckl.lexer, "LEXER_LOOKAHEAD", 1)
+    monkeypatch.setattr(ckl.lexer, "LEXER_WINDOW", 2)
+    assert [pickle.dumps(parse_script(script)) for script in scripts] == expected
@@ -0,0 +1,83 @@
+import pytest
+
+import ckl.optimizer
+from ckl.interpreter import Interpreter
+from ckl.nodes import NodeConstant
+
+
+def evaluate(source):
+    return repr(Interpreter(False, False).interpret(source, "{test}"))
+
+
+def test_fold_arithmetic():
+    node = Interpreter().parse("60 * 60 * 24")
+    assert isinstance(node, NodeConstant)
+    assert repr(node) == "(mul (mul 60, 60), 24)"
+    assert evaluate("def f() 60 * 60 * 24; f()") == "86400"
+
+
+def test_fold_shadowed_builtin():
+    assert evaluate("def mul(a, b) a + b; 60 * 60 * 24") == "144"
+    assert evaluate(
+        "def f() 2 * 3; def a = f(); def mul = fn(a, b) 0; [a, f()]"
+    ) == "[6, 0]"
+
+
+def test_fold_error_at_runtime():
+    node = Interpreter().parse("1 / 0")
+    assert not isinstance(node, NodeConstant)
+    assert evaluate("do 1 / 0; catch all 'caught'; end") == "'caught'"
+
+
+def test_fold_division_by_zero_at_runtime():
+    interpreter = Interpreter(False, False)
+    interpreter.interpret("def DIV_0_VALUE = 99", "{test}")
+    assert repr(interpreter.interpret(
+        "DIV_0_VALUE = 5; [1 / 0, div(1, 0), 1 / (2 - 2), 6 / 3]", "{test}"
+    )) == "[5, 5, 5, 2]"
+
+
+def test_constant_strings_copied():
+    assert evaluate(
+        "def r = []; for k in range(2) do def s = 'a' + 'b'; "
+        "def t = s[0]; s[0] = 'x'; r += [t, s]; end; r"
+    ) == "['a', 'xb', 'a', 'xb']"
+
+
+def test_constant_info():
+    assert evaluate(
+        "def f() 2000 * 3; def g() 1.5 * 3; "
+        "\"doc\" def a = f(); def b = f(); \"half\" def c = g(); "
+        "def d = g(); [info(a), info(c), a, b, c]"
+    ) == "['doc', 'half', 6000, 6000, 4.5]"
+
+
+def test_constant_collections_copied():
+    assert evaluate(
+        "def f() [1, [2, 3]]; def a = f(); append(a[1], 4); [a, f()]"
+    ) == "[[1, [2, 3, 4]], [1, [2, 3]]]"
+    assert evaluate(
+        "def f() <<<'a' => [1]>>>; def m = f(); append(m['a'], 2); f()"
+    ) == "<<<'a' => [1]>>>"
+
+
+def test_constant_collections_frozen():
+    assert evaluate("def f(x) x in ['a', 'b']; [f('a'), f('c')]") == (
+        "[TRUE, FALSE]"
+    )
+    assert evaluate(
+        "def n = 0; for x in [1, 2, 3] do n += x; end; n"
+    ) == "6"
+    assert evaluate(
+        "def f() do def r = []; "
+        "for x in [[1], [2]] do append(x, 0); r += x; end; r; end; "
+        "f(); f()"
+    ) == "[1, 0, 2, 0]"
+
+
+@pytest.mark.parametrize("optimize", [True, False])
+def test_optimize_flag(monkeypatch, optimize):
+    monkeypatch.setattr(ckl.optimizer, "OPTIMIZE", optimize)
+    node = Interpreter().parse("'a' + 'b'")
+    assert isinstance(node, NodeConstant) == optimize
+    assert evaluate("'a' + 'b'") == "'ab'"
@@ -0,0 +1,85 @@
+import sys
+
+import pytest
+
+import test_infotests
+import test_interpreter
+from ckl.errors import CklRuntimeError
+from ckl.functions import get_none_environment
+from ckl.interpreter import Interpreter
+from rerun import rerun_tests
+
+
+class TrampolinedInterpreter(Interpreter):
+    def interpret(self, script, filename, environment=None):
+        return self.trampoline(script, filename).run(environment)
+
+
+test_interpreter_trampolined = rerun_tests(
+    test_interpreter, TrampolinedInterpreter(False, False)
+)
+test_infotests_trampolined = rerun_tests(
+    test_infotests, TrampolinedInterpreter(False, True)
+)
+
+
+def run_trampolined(script):
+    interpreter = Interpreter(False, False)
+    return interpreter.trampoline(script).run(get_none_environment())
+
+
+def test_trampolined_deep_recursion():
+    depth = sys.getrecursionlimit() * 20
+    script = f"def f(n) if n == 0 then 0 else 1 + f(n - 1); f({depth})"
+    assert repr(run_trampolined(script)) == str(depth)
+
+
+def test_trampolined_deep_recursion_blocks():
+    depth = sys.getrecursionlimit() * 20
+    script = f"""
+        def count(n) do
+            if n == 0 then return [];
+            def result = count(n - 1);
+            result !> append(n);
+            return result;
+        end;
+        length(count({depth}))
+    """
+    assert repr(run_trampolined(script)) == str(depth)
+
+
+def test_trampolined_deep_recursion_methods():
+    depth = sys.getrecursionlimit() * 20
+    script = f"""
+        def obj = <*
+            down = fn(self, n) if n == 0 then 0 else 1 + self->down(n - 1)
+        *>;
+        obj->down({depth})
+    """
+    assert repr(run_trampolined(script)) == str(depth)
+
+
+def test_trampolined_error_stacktrace():
+    script = """
+        def f(n) if n == 0 then error 'boom' else [f(n - 1)];
+        f(3)
+    """
+    with pytest.raises(CklRuntimeError) as excinfo:
+        run_trampolined(script)
+    assert len(excinfo.value.stacktrace) == 4
+
+
+def test_trampolined_catch_finally():
+    script = """
+        def log = [];
+        def f(n) do
+            if n == 0 then error 'bottom';
+            f(n - 1);
+        catch all
+            do log !> append(n); n; end;
+        finally
+            log !> append('x');
+        end;
+        [f(3), log]
+    """
+    assert repr(run_trampolined(script)) == "[0, [0, 'x', 'x', 'x', 'x']]"
@@ -35,7 +35,7 @@ def main():
         env = get_base_environment(False, True)
         for symbol in env.getSymbols():
             value = env.get(symbol)
-            if not "info" in value.__dict__: continue
+            if not hasattr(value, "info"): continue
             info = value.info
             count = 1
             for line in info.splitlines():